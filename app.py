@@ -1,26 +1,58 @@
 import streamlit as st
-from services.embedding_service import EmbeddingService
-from services.vector_store import VectorStore
-from typing import List, Dict
+import json
+import numpy as np
+from typing import Callable, Iterator, List, Dict, Union
 from config import Config
 import time
 import os
 from pathlib import Path
-import PyPDF2
-import docx
-import fitz  # PyMuPDF
 import asyncio
-from services.docusign_service import DocuSignClient
-import google.generativeai as genai
+from services.docusign_sync import DocuSignSync
+from services.spool import SpooledDocument
+from services.chunking import aggregate_by_document
+from services.lexical_index import quoted_phrase, reciprocal_rank_fusion
+from services.metadata_index import to_timestamp
+from services.context_builder import ContextBuilder
+from services.vector_backend import Match
+from services.ingest import index_version, reindex_document
+from services.ingest_manifest import local_document_id, stable_document_id, content_hash
+from services.extraction import extract_text, extract_pdf_text
+from services.container import ServiceContainer, get_container
+from services.tracing import tracer
+
+@st.cache_resource
+def get_services() -> ServiceContainer:
+    """Services shared by every session and rerun; the embedding model warms up in the background"""
+    services = get_container()
+    services.warm_up()
+    if Config.METRICS_PORT:
+        tracer.serve(Config.METRICS_PORT)
+    return services
 
 class AgreementSearchApp:
-    def __init__(self):
-        self.embedding_service = EmbeddingService()
-        self.vector_store = VectorStore()
+    def __init__(self, services: ServiceContainer):
+        # Everything here is built once per process by the container, so reruns stay cheap
+        self.services = services
+        self.embedding_scheduler = services.embedding_scheduler
+        self.embedding_service = services.embedding_service
+        self.vector_store = services.vector_store
+        self.manifest = services.manifest
+        self.query_cache = services.query_cache if Config.QUERY_CACHE_ENABLED else None
+        self.context_builder = ContextBuilder(
+            token_budget=Config.CONTEXT_TOKEN_BUDGET,
+            mmr_lambda=Config.CONTEXT_MMR_LAMBDA,
+            duplicate_threshold=Config.CONTEXT_DUPLICATE_THRESHOLD
+        )
         self.status_placeholder = None
-        # Initialize Gemini
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.last_passages = []
+        self.last_query_embedding = None
+        self.last_context = None
+        self.last_generation = None
+
+    @property
+    def model(self):
+        # Gemini is configured on first use rather than on every rerun
+        return self.services.generative_model
 
     def set_status(self, message: str, is_error: bool = False):
         """Update status message in the UI"""
@@ -29,18 +61,17 @@ class AgreementSearchApp:
         else:
             st.info(message)
 
-    def generate_ai_response(self, query: str, search_results: List[Dict]) -> str:
-        """Generate a structured response using Gemini based on search results"""
-        try:
-            # Construct context from search results
-            context = "\n\n".join([
-                f"Document: {result.metadata.get('title', 'Untitled')}\n"
-                f"Content: {result.metadata.get('preview', 'No preview available')}"
-                for result in search_results
-            ])
+    def build_prompt(self, query: str, search_results: List[Dict], passages: List[Dict] = None) -> str:
+        """
+        Gemini prompt built from the query and search results.
+        `passages` are the matching chunks behind the results (see `search_agreements`); they are
+        packed into `Config.CONTEXT_TOKEN_BUDGET` tokens without near-duplicates.
+        """
+        self.last_context = self.context_builder.build(passages or search_results)
+        context = self.last_context.text
 
-            # Construct prompt for Gemini
-            prompt = f"""Based on the following search results, provide a comprehensive answer to the query: "{query}"
+        # Construct prompt for Gemini
+        return f"""Based on the following search results, provide a comprehensive answer to the query: "{query}"
 
 Search Results:
 {context}
@@ -52,70 +83,211 @@ Please structure your response in the following format:
 
 Response:"""
 
-            # Generate response
-            response = self.model.generate_content(prompt)
-            return response.text
+    def _cached_answer(self, query: str, scope: tuple, query_embedding: List[float] = None) -> Union[str, None]:
+        if self.query_cache is None:
+            return None
+        cached = self.query_cache.get(query, scope)
+        if cached is None and query_embedding is not None:
+            cached = self.query_cache.get(query, scope, embedding=query_embedding)
+        return cached
+
+    def stream_ai_response(self, query: str, search_results: List[Dict], passages: List[Dict] = None,
+                           query_embedding: List[float] = None) -> Iterator[str]:
+        """
+        Yield the Gemini answer in chunks as they are generated, for `st.write_stream`.
+        Time to first token and total time go to `last_generation` and the shared generation stats.
+        `query_embedding` (the search's `last_query_embedding`) lets a near-duplicate question reuse a cached answer.
+        """
+        self.last_generation = None
+        scope = ('answer', tuple(result.id for result in search_results))
+        if quoted_phrase(query) is not None:
+            # An exact phrase lookup only reuses answers to the same phrase
+            query_embedding = None
+        cached = self._cached_answer(query, scope, query_embedding)
+        if cached is not None:
+            self.last_generation = {'cached': True, 'first_token_s': 0.0, 'total_s': 0.0}
+            yield cached
+            return
+
+        stats = self.services.generation_stats
+        started = time.perf_counter()
+        first_token = None
+        prompt_tokens = None
+        parts = []
+        try:
+            response = self.model.generate_content(self.build_prompt(query, search_results, passages), stream=True)
+            for chunk in response:
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                    stats['first_token'].record(first_token, True)
+                    tracer.record("generate_first_token", first_token)
+                usage = getattr(chunk, 'usage_metadata', None)
+                if usage is not None and getattr(usage, 'prompt_token_count', None):
+                    prompt_tokens = usage.prompt_token_count
+                parts.append(chunk.text)
+                yield chunk.text
         except Exception as e:
-            return f"Error generating AI response: {str(e)}"
+            stats['total'].record(time.perf_counter() - started, False)
+            tracer.record("generate", time.perf_counter() - started, ok=False)
+            yield f"Error generating AI response: {str(e)}"
+            return
+
+        total = time.perf_counter() - started
+        stats['total'].record(total, True)
+        tracer.record("generate", total).annotate(prompt_tokens=prompt_tokens)
+        self.last_generation = {
+            'cached': False, 'first_token_s': first_token, 'total_s': total, 'prompt_tokens': prompt_tokens
+        }
+        if self.query_cache is not None:
+            self.query_cache.put(query, "".join(parts), scope, embedding=query_embedding)
+
+    def search_agreements(self, query: str, top_k: int = 5, mode: str = None, filter: Dict = None) -> List[Dict]:
+        """
+        `mode` is "hybrid" (dense and BM25 rankings fused), "dense" or "lexical".
+        A fully quoted query is an exact phrase lookup and skips the embedding call.
+        `filter` is a metadata filter applied before ranking (see `build_filter`).
+        """
+        mode = mode or Config.SEARCH_MODE
+        # Root span of the query pipeline; the vector and keyword query spans nest under it
+        with tracer.span("search", mode=mode) as span:
+            results = self._search_agreements(query, top_k, mode, filter)
+            span.annotate(results=len(results))
+            return results
+
+    def _search_agreements(self, query: str, top_k: int, mode: str, filter: Dict = None) -> List[Dict]:
+        chunk_count = top_k * Config.CHUNK_OVERSAMPLE
+        phrase = quoted_phrase(query)
+        scope = ('search', mode, top_k, json.dumps(filter, sort_keys=True) if filter else None)
+        self.last_query_embedding = None
+        if self.query_cache is not None:
+            cached = self.query_cache.get(query, scope)
+            if cached is not None:
+                self.set_status("Search completed (cached)")
+                results, self.last_passages, self.last_query_embedding = cached
+                return results
+
+        if self.vector_store.lexical_index is not None and (phrase is not None or mode == "lexical"):
+            self.set_status("Searching keywords...")
+            matches = self.vector_store.lexical_search(
+                phrase or query, top_k=chunk_count, phrase=phrase is not None, filter=filter
+            )
+            if matches:
+                self.set_status("Search completed successfully!")
+                return self._finish_search(query, scope, matches, top_k)
+            # The keyword index only holds chunks written since it was added (nothing older is
+            # backfilled into it), so no keyword hits falls back to the vector search below
+            self.set_status("No keyword matches, searching by meaning...")
 
-    def search_agreements(self, query: str, top_k: int = 5) -> List[Dict]:
         # Get query embedding
         self.set_status("Getting embedding for query...")
-        query_embedding = self.embedding_service.get_single_embedding(query)
+        query_embedding = self.embedding_scheduler.get_single_embedding(phrase or query)
         
         if not query_embedding:
             self.set_status("Failed to get embedding for query", is_error=True)
             return []
+        self.last_query_embedding = query_embedding
 
-        # Search in vector store
+        if self.query_cache is not None:
+            # A near-duplicate of a recent question reuses its results
+            cached = self.query_cache.get(query, scope, embedding=query_embedding)
+            if cached is not None:
+                self.set_status("Search completed (cached)")
+                results, self.last_passages, _ = cached
+                return results
+
+        # Search in vector store, over-fetching chunks so enough distinct documents remain
         self.set_status("Searching for similar agreements...")
         try:
-            results = self.vector_store.search(query_embedding, top_k=top_k)
+            # Chunk vectors come back too, so the context builder can spot near-duplicate passages
+            results = self.vector_store.search(query_embedding, top_k=chunk_count, filter=filter, include_values=True)
+            matches = results.matches
+            if mode == "hybrid" and self.vector_store.lexical_index is not None:
+                matches = reciprocal_rank_fusion(
+                    [matches, self.vector_store.lexical_search(query, top_k=chunk_count, filter=filter)],
+                    k=Config.RRF_K
+                )
             self.set_status("Search completed successfully!")
-            return results.matches
+            return self._finish_search(query, scope, matches, top_k, query_embedding)
         except Exception as e:
             self.set_status(f"Search failed: {str(e)}", is_error=True)
             return []
 
-class DocuSignEmbedder:
-    def __init__(self):
-        self.embedding_service = EmbeddingService()
-        self.vector_store = VectorStore()
+    def _finish_search(self, query: str, scope: tuple, matches: list, top_k: int, query_embedding=None) -> List[Dict]:
+        """Group chunk matches into documents; the chunks of those documents become `last_passages`."""
+        results = aggregate_by_document(matches, top_k)
+        document_ids = {result.id for result in results}
+        # float32 arrays keep cached passages ~6x smaller than lists of Python floats
+        self.last_passages = [
+            Match(id=match.id, score=match.score, metadata=match.metadata,
+                  values=np.asarray(match.values, dtype=np.float32) if getattr(match, 'values', None) else None)
+            for match in matches if (match.metadata or {}).get('document_id', match.id) in document_ids
+        ]
+        if self.query_cache is not None:
+            self.query_cache.put(
+                query, (results, self.last_passages, query_embedding), scope, embedding=query_embedding
+            )
+        return results
 
-    async def embed_document(self, doc_content: bytes, doc_metadata: dict) -> bool:
+class DocuSignEmbedder:
+    def __init__(self, services: ServiceContainer = None):
+        services = services or get_services()
+        self.embedding_scheduler = services.embedding_scheduler
+        self.embedding_service = services.embedding_service
+        self.vector_store = services.vector_store
+        self.manifest = services.manifest
+
+    async def embed_document(self, doc_content: Union[bytes, SpooledDocument], doc_metadata: dict,
+                             on_failed: Callable[[Exception], None] = None) -> bool:
         """
         Embed a single DocuSign document into the vector store
+        `doc_content` is the raw bytes or a spooled download
         Returns True if successful, False otherwise
+        The upsert may be buffered; `on_failed(error)` runs if storing it fails later
         """
         try:
+            document_id = stable_document_id(
+                "docusign", f"{doc_metadata.get('envelopeId')}/{doc_metadata['documentId']}"
+            )
+            if isinstance(doc_content, SpooledDocument):
+                # Large spooled documents are extracted straight from their temp file
+                source, digest = doc_content.source, doc_content.sha256
+            else:
+                source, digest = doc_content, content_hash(doc_content)
+            if self.manifest.is_current(document_id, digest, index_version(self.embedding_service)):
+                # Already indexed with this exact content
+                return True
+
             # Extract text from document
-            text_content = extract_text_from_bytes(doc_content)
+            text_content = extract_text_from_bytes(source)
             if not text_content:
                 st.error("Could not extract text from document")
                 return False
 
-            # Generate embedding
-            embedding = self.embedding_service.get_single_embedding(text_content)
-            if not embedding:
+            # Embed chunks and store them in the vector database
+            # Runs in a worker thread so the event loop stays free while the scheduler batches
+            chunk_ids = await asyncio.to_thread(
+                reindex_document,
+                self.embedding_scheduler,
+                self.vector_store,
+                self.manifest,
+                document_id,
+                digest,
+                text_content,
+                {
+                    'title': doc_metadata['name'],
+                    'source': 'DocuSign',
+                    'docusign_document_id': doc_metadata['documentId'],
+                    'envelope_id': doc_metadata.get('envelopeId'),
+                    'status': doc_metadata.get('status'),
+                    'sent_date': doc_metadata.get('sentDateTime'),
+                    # Numeric copy of the date for range filters
+                    'sent_ts': to_timestamp(doc_metadata.get('sentDateTime'))
+                },
+                on_failed
+            )
+            if not chunk_ids:
                 st.error("Failed to generate embedding")
                 return False
-
-            # Store in vector database
-            self.vector_store.upsert(
-                vectors=[(
-                    f"docusign_{doc_metadata['documentId']}",  # unique ID
-                    embedding,
-                    {
-                        'title': doc_metadata['name'],
-                        'preview': text_content[:200] + "...",
-                        'source': 'DocuSign',
-                        'document_id': doc_metadata['documentId'],
-                        'envelope_id': doc_metadata.get('envelopeId'),
-                        'status': doc_metadata.get('status'),
-                        'sent_date': doc_metadata.get('sentDateTime')
-                    }
-                )]
-            )
             return True
 
         except Exception as e:
@@ -125,53 +297,54 @@ class DocuSignEmbedder:
 def extract_text_from_file(file):
     """Extract text from various file formats"""
     try:
-        file_extension = Path(file.name).suffix.lower()
-        
-        if file_extension == '.pdf':
-            try:
-                # Try PyMuPDF first
-                pdf_document = fitz.open(stream=file.read(), filetype="pdf")
-                text = ""
-                for page in pdf_document:
-                    text += page.get_text()
-                return text
-            except Exception as e:
-                # Fallback to PyPDF2
-                file.seek(0)  # Reset file pointer
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text()
-                return text
-            
-        elif file_extension == '.docx':
-            doc = docx.Document(file)
-            return ' '.join([paragraph.text for paragraph in doc.paragraphs])
-            
-        elif file_extension == '.txt':
-            return file.getvalue().decode('utf-8')
-            
-        else:
-            st.error(f"Unsupported file format: {file_extension}")
-            return None
+        return extract_text(file.getvalue(), file.name)
+    except ValueError as e:
+        st.error(str(e))
+        return None
     except Exception as e:
         st.error(f"Error processing file {file.name}: {str(e)}")
         return None
 
-def check_api_status():
+def build_filter(source: str = None, statuses: List[str] = None, sent_from=None, sent_to=None) -> Dict:
+    """Metadata filter for the search controls; None when nothing is selected."""
+    clauses = []
+    if source:
+        clauses.append({'source': source})
+    if statuses:
+        clauses.append({'status': {'$in': list(statuses)}})
+    sent_range = {}
+    if sent_from:
+        sent_range['$gte'] = to_timestamp(sent_from.isoformat())
+    if sent_to:
+        # Inclusive of the whole end day
+        sent_range['$lt'] = to_timestamp(sent_to.isoformat()) + 86400
+    if sent_range:
+        clauses.append({'sent_ts': sent_range})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+def check_api_status(services: ServiceContainer):
     """Check if the APIs are accessible"""
-    embedding_service = EmbeddingService()
-    vector_store = VectorStore()
+    embedding_service = services.embedding_service
+    vector_store = services.vector_store
     
     status = {
         "huggingface": False,
-        "pinecone": False
+        "pinecone": False,
+        "embedding_cache": None,
+        "query_cache": services.query_cache.stats() if Config.QUERY_CACHE_ENABLED else None,
+        "generation_latency": {name: stats.snapshot() for name, stats in services.generation_stats.items()},
+        "embedding_latency": None,
+        "readiness": services.readiness()
     }
     
     # Check Hugging Face API
     try:
         test_embedding = embedding_service.get_single_embedding("test")
         status["huggingface"] = test_embedding is not None
+        status["embedding_cache"] = embedding_service.cache_stats()
+        status["embedding_latency"] = embedding_service.latency_report()
     except Exception as e:
         st.error(f"Hugging Face API Error: {str(e)}")
     
@@ -192,28 +365,97 @@ def main():
     # Main app content
     st.title("Semantic Search Engine")
     
+    services = get_services()
+
     # Add a sidebar for status information
     st.sidebar.title("System Status")
+    readiness = services.readiness()
+    if not readiness['ready']:
+        st.sidebar.caption(
+            f"Warming up: embedding model {readiness['embedding_model']}, "
+            f"vector store {readiness['vector_store']}"
+        )
 
     # Check API status
     if st.sidebar.button("Check API Status"):
-        status = check_api_status()
+        status = check_api_status(services)
         
         # Display status with colored indicators
         st.sidebar.markdown("### API Status")
         st.sidebar.markdown(f"🤗 Hugging Face API: {'✅' if status['huggingface'] else '❌'}")
         st.sidebar.markdown(f"🌲 Pinecone API: {'✅' if status['pinecone'] else '❌'}")
+        if status['embedding_latency']:
+            latency = status['embedding_latency']
+            for backend in ('remote', 'local'):
+                stats = latency[backend]
+                if stats['calls']:
+                    st.sidebar.markdown(
+                        f"⏱️ {backend.title()} embeddings: p50 {stats['p50_ms']:.0f} ms, "
+                        f"p95 {stats['p95_ms']:.0f} ms, {stats['error_rate']:.0%} errors"
+                    )
+            st.sidebar.markdown(f"🔌 Remote circuit: {latency['circuit']}")
+        if status['embedding_cache']:
+            cache = status['embedding_cache']
+            st.sidebar.markdown(
+                f"🗄️ Embedding cache: {cache['entries']} entries, "
+                f"{cache['hits']} hits / {cache['misses']} misses"
+            )
+        if status['query_cache']:
+            cache = status['query_cache']
+            st.sidebar.markdown(
+                f"💬 Query cache: {cache['entries']} entries, {cache['exact_hits']} exact / "
+                f"{cache['semantic_hits']} similar hits, {cache['misses']} misses"
+            )
+        generation = status['generation_latency']
+        if generation['total']['calls']:
+            st.sidebar.markdown(
+                f"✍️ Gemini answers: first token p50 {generation['first_token']['p50_ms'] or 0:.0f} ms, "
+                f"complete p50 {generation['total']['p50_ms']:.0f} ms"
+            )
+        readiness = status['readiness']
+        st.sidebar.markdown(f"🔥 Warm start: {'✅' if readiness['ready'] else '⏳'}")
+        for component, error in readiness['errors'].items():
+            st.sidebar.markdown(f"⚠️ {component}: {error}")
+
+    # Per-stage latencies since the process started, to find the slow stage when search gets slow
+    stages = tracer.snapshot()
+    if stages:
+        with st.sidebar.expander("⏱️ Latency breakdown"):
+            rows = ["| Stage | Calls | p50 ms | p95 ms | Errors |", "|---|---:|---:|---:|---:|"]
+            for stage in stages:
+                labels = ", ".join(stage['labels'].values())
+                name = f"{stage['stage']} ({labels})" if labels else stage['stage']
+                rows.append(
+                    f"| {name} | {stage['calls']} | {stage['p50_ms']:.1f} | {stage['p95_ms']:.1f} | {stage['errors']} |"
+                )
+            st.markdown("\n".join(rows))
+            st.download_button("Download metrics", tracer.prometheus(), file_name="metrics.prom", mime="text/plain")
 
     # Initialize app
-    app = AgreementSearchApp()
+    app = AgreementSearchApp(services)
 
     # Add tabs for different functionalities
     tab1, tab2, tab3 = st.tabs(["Search Documents", "Import Documents", "DocuSign Import"])
     
     with tab1:
         # Search interface
-        query = st.text_input("Enter your search query:")
-        
+        query = st.text_input("Enter your search query:", help='Wrap the query in "quotes" to look up an exact phrase')
+
+        with st.expander("Filters"):
+            filter_col1, filter_col2, filter_col3 = st.columns(3)
+            with filter_col1:
+                source = st.selectbox("Source", ["Any", "DocuSign", "Local"])
+            with filter_col2:
+                statuses = st.multiselect("Envelope status", ["completed", "sent", "delivered", "declined", "voided"])
+            with filter_col3:
+                sent_range = st.date_input("Sent between", value=())
+        search_filter = build_filter(
+            source=None if source == "Any" else source,
+            statuses=statuses,
+            sent_from=sent_range[0] if len(sent_range) > 0 else None,
+            sent_to=sent_range[1] if len(sent_range) > 1 else None
+        )
+
         col1, col2 = st.columns([1, 5])
         with col1:
             search_button = st.button("Search")
@@ -221,26 +463,44 @@ def main():
             if search_button:
                 if query:
                     with st.spinner("Searching..."):
-                        results = app.search_agreements(query)
-                        
-                        if results:
-                            st.success(f"Found {len(results)} results!")
-                            
-                            # Add tabs for different views
-                            search_tab1, search_tab2 = st.tabs(["AI Response", "Raw Results"])
-                            
-                            with search_tab1:
-                                with st.spinner("Generating AI response..."):
-                                    ai_response = app.generate_ai_response(query, results)
-                                    st.markdown(ai_response)
-                            
-                            with search_tab2:
-                                for idx, result in enumerate(results, 1):
-                                    with st.expander(f"Result {idx} - Score: {result.score:.2f}"):
-                                        st.write(f"Document: {result.metadata.get('title', 'N/A')}")
-                                        st.write(f"Content Preview: {result.metadata.get('preview', 'N/A')}")
-                        else:
-                            st.warning("No results found")
+                        results = app.search_agreements(query, filter=search_filter)
+
+                    if results:
+                        st.success(f"Found {len(results)} results!")
+
+                        # Add tabs for different views
+                        search_tab1, search_tab2 = st.tabs(["AI Response", "Raw Results"])
+
+                        # Raw results are rendered first so they show while the answer streams
+                        with search_tab2:
+                            for idx, result in enumerate(results, 1):
+                                with st.expander(f"Result {idx} - Score: {result.score:.3f}"):
+                                    st.write(f"Document: {result.metadata.get('title', 'N/A')}")
+                                    st.write(f"Content Preview: {result.metadata.get('preview', 'N/A')}")
+                                    if 'page' in result.metadata:
+                                        st.write(f"Best match on page {int(result.metadata['page'])} "
+                                                 f"({int(result.metadata.get('matched_chunks', 1))} matching chunks)")
+
+                        with search_tab1:
+                            st.write_stream(app.stream_ai_response(
+                                query, results, app.last_passages, app.last_query_embedding
+                            ))
+                            timing = app.last_generation
+                            if timing and not timing['cached']:
+                                st.caption(f"First token after {timing['first_token_s'] or 0:.2f}s, "
+                                           f"complete after {timing['total_s']:.2f}s")
+                            elif timing:
+                                st.caption("Answer served from cache")
+                            context = app.last_context
+                            if context and timing and not timing['cached']:
+                                prompt_tokens = timing.get('prompt_tokens')
+                                st.caption(
+                                    f"Prompt: {prompt_tokens or f'~{context.tokens}'} tokens, "
+                                    f"{len(context.passages)} of {context.candidates} passages "
+                                    f"({context.duplicates_dropped} near-duplicates dropped)"
+                                )
+                    else:
+                        st.warning("No results found")
                 else:
                     st.warning("Please enter a search query")
     
@@ -259,26 +519,40 @@ def main():
             for file in uploaded_files:
                 if file.name not in st.session_state.processed_files:
                     with st.spinner(f"Processing {file.name}..."):
+                        document_id = local_document_id(file.name)
+                        digest = content_hash(file.getvalue())
+                        if app.manifest.is_current(document_id, digest, index_version(app.embedding_service)):
+                            st.session_state.processed_files.add(file.name)
+                            st.info(f"{file.name} is unchanged since it was last indexed")
+                            continue
+
                         text_content = extract_text_from_file(file)
                         if text_content:
-                            # Get embedding and store in vector database
-                            embedding = app.embedding_service.get_single_embedding(text_content)
-                            if embedding:
-                                try:
-                                    app.vector_store.upsert(
-                                        vectors=[(
-                                            str(hash(file.name)),  # unique ID
-                                            embedding,  # vector
-                                            {  # metadata as part of the vector tuple
-                                                'title': file.name,
-                                                'preview': text_content[:200] + "..."
-                                            }
-                                        )]
-                                    )
+                            # Embed chunks and store them in the vector database
+                            try:
+                                errors = []
+                                chunk_ids = reindex_document(
+                                    app.embedding_service,
+                                    app.vector_store,
+                                    app.manifest,
+                                    document_id,
+                                    digest,
+                                    text_content,
+                                    {'title': file.name, 'source': 'Local'},
+                                    on_failed=errors.append
+                                )
+                                if chunk_ids:
+                                    # Store the buffered upsert before reporting success
+                                    app.vector_store.flush()
+                                if chunk_ids and errors:
+                                    st.error(f"Error storing {file.name}: {str(errors[0])}")
+                                elif chunk_ids:
                                     st.session_state.processed_files.add(file.name)
-                                    st.success(f"Successfully processed {file.name}")
-                                except Exception as e:
-                                    st.error(f"Error storing {file.name}: {str(e)}")
+                                    st.success(f"Successfully processed {file.name} ({len(chunk_ids)} chunks)")
+                                else:
+                                    st.error(f"Failed to generate embeddings for {file.name}")
+                            except Exception as e:
+                                st.error(f"Error storing {file.name}: {str(e)}")
                         else:
                             st.error(f"Could not extract text from {file.name}")
 
@@ -302,7 +576,7 @@ def main():
         if code and not st.session_state.docusign_token:
             # Exchange code for token
             with st.spinner("Authenticating with DocuSign..."):
-                client = DocuSignClient()
+                client = services.docusign_client
                 token = asyncio.run(client.get_token(code))
                 if token:
                     st.session_state.docusign_token = token
@@ -316,20 +590,34 @@ def main():
         # Show different content based on authentication state
         if not st.session_state.docusign_token:
             st.write("Please log in to DocuSign to access your documents.")
-            client = DocuSignClient()
+            client = services.docusign_client
             auth_url = client.get_authorization_url()
             st.link_button("Login to DocuSign", auth_url)
         else:
             # Show authenticated UI
             st.success("✅ Connected to DocuSign")
             
-            col1, col2 = st.columns([4, 1])
+            col1, col2, col3 = st.columns([2, 2, 1])
             
+            with col2:
+                if st.button("Sync Changes", key="sync_docs", use_container_width=True):
+                    with st.spinner("Syncing changed envelopes from DocuSign..."):
+                        try:
+                            client = services.docusign_client
+                            account_id = asyncio.run(client.fetch_account_id())
+
+                            if account_id:
+                                asyncio.run(sync_envelopes(client, account_id))
+                            else:
+                                st.error("Could not fetch account ID")
+                        except Exception as e:
+                            st.error(f"Error syncing documents: {str(e)}")
+
             with col1:
                 if st.button("Fetch Documents", key="fetch_docs", use_container_width=True):
                     with st.spinner("Fetching documents from DocuSign..."):
                         try:
-                            client = DocuSignClient()
+                            client = services.docusign_client
                             account_id = asyncio.run(client.fetch_account_id())
                             
                             if account_id:
@@ -339,7 +627,7 @@ def main():
                         except Exception as e:
                             st.error(f"Error fetching documents: {str(e)}")
             
-            with col2:
+            with col3:
                 if st.button("Logout", key="logout_button"):
                     st.session_state.docusign_token = None
                     st.query_params.clear()
@@ -350,13 +638,14 @@ async def process_envelopes(client, account_id):
     envelopes = await client.fetch_envelopes(account_id)
     if envelopes:
         st.success(f"Found {len(envelopes)} envelopes")
+        documents_by_envelope = await client.fetch_all_documents(account_id, envelopes)
         
         for envelope in envelopes:
             with st.expander(f"📩 Envelope: {envelope.get('emailSubject', 'No Subject')}"):
                 st.write(f"Status: {envelope.get('status')}")
                 st.write(f"Sent: {envelope.get('sentDateTime')}")
                 
-                docs = await client.fetch_documents(account_id, envelope['envelopeId'])
+                docs = documents_by_envelope.get(envelope['envelopeId'])
                 if docs:
                     for doc in docs:
                         # Add envelope metadata to document
@@ -379,15 +668,56 @@ async def process_envelopes(client, account_id):
                                 if st.button("Import", key=button_key):
                                     await process_document(client, account_id, doc)
 
+async def sync_envelopes(client, account_id):
+    """Embed only the documents of envelopes changed since the last sync"""
+    sync = DocuSignSync(client)
+    # Raises when the listing fails, so the watermark is only advanced after a complete listing
+    plan = await sync.plan(account_id)
+    if not plan.envelopes:
+        st.info("Everything is up to date")
+        sync.commit(plan)
+        return
+
+    embedder = DocuSignEmbedder()
+    failed_envelopes = set(plan.failed_envelope_ids)
+    for doc in plan.documents:
+        spool = await client.fetch_document_spooled(account_id, doc['uri'])
+        if spool is None:
+            failed_envelopes.add(doc['envelopeId'])
+            continue
+        doc_metadata = {
+            'documentId': doc['documentId'],
+            'name': doc['name'],
+            'envelopeId': doc.get('envelopeId'),
+            'status': doc.get('status'),
+            'sentDateTime': doc.get('sentDateTime')
+        }
+        with spool:
+            # A buffered upsert that fails later marks its envelope as failed
+            stored = await embedder.embed_document(
+                spool, doc_metadata, on_failed=lambda _error, envelope_id=doc['envelopeId']: failed_envelopes.add(envelope_id)
+            )
+            if not stored:
+                failed_envelopes.add(doc['envelopeId'])
+
+    # Buffered upserts must be stored before their envelopes are marked as synced
+    await asyncio.to_thread(embedder.vector_store.flush)
+
+    synced = {envelope['envelopeId'] for envelope in plan.envelopes} - failed_envelopes
+    sync.commit(plan, synced)
+    st.success(f"Synced {len(synced)} changed envelopes ({len(plan.documents)} documents)")
+    if failed_envelopes:
+        st.warning(f"{len(failed_envelopes)} envelopes failed and will be retried on the next sync")
+
 async def process_document(client, account_id, doc):
     """Process a single document"""
     embedder = DocuSignEmbedder()
     
     try:
         with st.spinner(f"Importing {doc['name']}..."):
-            # Fetch document content
-            content = await client.fetch_document(account_id, doc['uri'])
-            if not content:
+            # Stream document content to a size-capped spool
+            spool = await client.fetch_document_spooled(account_id, doc['uri'])
+            if spool is None:
                 st.error("Failed to fetch document content")
                 return
 
@@ -401,9 +731,15 @@ async def process_document(client, account_id, doc):
             }
 
             # Embed document
-            success = await embedder.embed_document(content, doc_metadata)
-            
+            errors = []
+            with spool:
+                success = await embedder.embed_document(spool, doc_metadata, on_failed=errors.append)
             if success:
+                # Store the buffered upsert before reporting the import as done
+                await asyncio.to_thread(embedder.vector_store.flush)
+                if errors:
+                    st.error(f"Failed to store {doc['name']}: {str(errors[0])}")
+                    return
                 # Update session state
                 if 'processed_files' not in st.session_state:
                     st.session_state.processed_files = set()
@@ -418,27 +754,13 @@ async def process_document(client, account_id, doc):
     except Exception as e:
         st.error(f"Error processing document {doc['name']}: {str(e)}")
 
-def extract_text_from_bytes(content: bytes) -> str:
-    """Extract text from document bytes"""
+def extract_text_from_bytes(content: Union[bytes, str]) -> str:
+    """Extract text from document bytes (or a path to the document)"""
     try:
-        # Try PyMuPDF first
-        pdf_document = fitz.open(stream=content, filetype="pdf")
-        text = ""
-        for page in pdf_document:
-            text += page.get_text()
-        return text
+        return extract_pdf_text(content)
     except Exception as e:
-        try:
-            # Fallback to PyPDF2
-            from io import BytesIO
-            pdf_reader = PyPDF2.PdfReader(BytesIO(content))
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-            return text
-        except Exception as e:
-            st.error(f"Error extracting text from document: {str(e)}")
-            return None
+        st.error(f"Error extracting text from document: {str(e)}")
+        return None
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""
+Synthetic contract corpora for benchmarks.
+
+Contracts are assembled from clause templates with random parties, dates,
+amounts and lengths, padded with sentences taken from the sample documents
+in `Context files/` so the vocabulary looks like real agreements. The same
+seed always produces the same corpus:
+
+    python -m benchmarks.corpus --out bench_corpus --count 200 --formats pdf docx txt
+"""
+import argparse
+import io
+import random
+import re
+import textwrap
+from pathlib import Path
+from typing import List, Tuple
+
+from services.extraction import SUPPORTED_EXTENSIONS, extract_text
+
+SAMPLE_DIR = Path(__file__).resolve().parent.parent / "Context files"
+FORMATS = ("pdf", "docx", "txt")
+LINES_PER_PAGE = 60
+
+AGREEMENT_TYPES = (
+    "Master Services Agreement", "Mutual Non-Disclosure Agreement", "Sales Contract", "Software License Agreement",
+    "Consulting Agreement", "Lease Agreement", "Supply Agreement", "Data Processing Addendum",
+)
+COMPANIES = (
+    "Acme Corporation", "Globex Ltd", "Initech LLC", "Umbrella Holdings", "Stark Industries", "Wayne Enterprises",
+    "Hooli Inc", "Vandelay Imports", "Soylent Foods", "Tyrell Systems", "Cyberdyne GmbH", "Wonka Industries",
+)
+JURISDICTIONS = ("Delaware", "New York", "California", "England and Wales", "Ontario", "Singapore")
+CLAUSES = (
+    ("Term", "This Agreement commences on {date} and continues for {years} years unless terminated earlier."),
+    ("Termination", "Either party may terminate this Agreement for convenience upon {days} days written notice. "
+                    "Either party may terminate immediately if the other party materially breaches this Agreement."),
+    ("Fees and Payment", "{buyer} shall pay {seller} the fees of USD {amount} within {days} days of invoice. "
+                         "Late payments accrue interest at 1.5% per month."),
+    ("Confidentiality", "Each party shall hold the other party's Confidential Information in strict confidence "
+                        "and use it only to perform its obligations under this Agreement."),
+    ("Indemnification", "{seller} shall indemnify and hold harmless {buyer} against all third-party claims "
+                        "arising from {seller}'s gross negligence or willful misconduct."),
+    ("Limitation of Liability", "Neither party's aggregate liability shall exceed USD {amount}, except for "
+                                "breaches of confidentiality or indemnification obligations."),
+    ("Force Majeure", "Neither party is liable for delays caused by events beyond its reasonable control, "
+                      "including acts of God, war, pandemic or governmental action."),
+    ("Governing Law", "This Agreement is governed by the laws of {jurisdiction}, without regard to its "
+                      "conflict of laws principles."),
+    ("Assignment", "Neither party may assign this Agreement without the prior written consent of the other party."),
+    ("Notices", "All notices must be in writing and delivered to the addresses set out above."),
+)
+
+
+def seed_sentences() -> List[str]:
+    """Sentences from the sample documents, used as realistic filler."""
+    sentences = []
+    for path in sorted(SAMPLE_DIR.glob("*")):
+        if path.suffix.lower() not in SUPPORTED_EXTENSIONS:
+            continue
+        try:
+            text = extract_text(path.read_bytes(), path.name)
+        except Exception:
+            continue
+        sentences.extend(s.strip() for s in re.split(r"(?<=[.!?])\s+", " ".join(text.split())) if len(s) > 40)
+    return sentences or [template for _, template in CLAUSES]
+
+
+def generate_contracts(count: int, seed: int = 0, mean_sections: int = 12) -> List[Tuple[str, str]]:
+    """`count` (file stem, text) pairs with lengths from a couple of pages to a few dozen."""
+    rng = random.Random(seed)
+    filler = seed_sentences()
+    contracts = []
+    for i in range(count):
+        kind = rng.choice(AGREEMENT_TYPES)
+        buyer, seller = rng.sample(COMPANIES, 2)
+        values = {
+            "buyer": buyer,
+            "seller": seller,
+            "date": f"{rng.randint(2019, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "years": rng.randint(1, 5),
+            "days": rng.choice((15, 30, 45, 60, 90)),
+            "amount": f"{rng.randint(5, 5000) * 1000:,}",
+            "jurisdiction": rng.choice(JURISDICTIONS),
+        }
+        lines = [kind.upper(), f"between {buyer} and {seller}", f"Effective Date: {values['date']}", ""]
+        sections = max(3, int(rng.lognormvariate(0, 0.6) * mean_sections))
+        for number in range(1, sections + 1):
+            heading, template = CLAUSES[(number - 1) % len(CLAUSES)] if number <= len(CLAUSES) else rng.choice(CLAUSES)
+            body = [template.format(**values)] + rng.sample(filler, k=min(len(filler), rng.randint(2, 8)))
+            lines += [f"{number}. {heading}", " ".join(body), ""]
+        contracts.append((f"{kind.lower().replace(' ', '_')}_{i:05d}", "\n".join(lines)))
+    return contracts
+
+
+def to_pdf(text: str) -> bytes:
+    import fitz
+    lines = [wrapped for line in text.splitlines() for wrapped in (textwrap.wrap(line, 95) or [""])]
+    document = fitz.open()
+    for start in range(0, len(lines), LINES_PER_PAGE):
+        page = document.new_page()
+        page.insert_text((54, 72), "\n".join(lines[start:start + LINES_PER_PAGE]), fontsize=10)
+    data = document.tobytes()
+    document.close()
+    return data
+
+
+def to_docx(text: str) -> bytes:
+    import docx
+    document = docx.Document()
+    for line in text.splitlines():
+        document.add_paragraph(line)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def render(text: str, fmt: str) -> bytes:
+    if fmt == "pdf":
+        return to_pdf(text)
+    if fmt == "docx":
+        return to_docx(text)
+    return text.encode("utf-8")
+
+
+def generate_files(count: int, formats=FORMATS, seed: int = 0) -> List[Tuple[str, bytes]]:
+    """(file name, bytes) pairs, cycling through `formats`."""
+    return [
+        (f"{stem}.{formats[i % len(formats)]}", render(text, formats[i % len(formats)]))
+        for i, (stem, text) in enumerate(generate_contracts(count, seed))
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic contract corpus.")
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), choices=FORMATS)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    total = 0
+    for name, data in generate_files(args.count, args.formats, args.seed):
+        (args.out / name).write_bytes(data)
+        total += len(data)
+    print(f"Wrote {args.count} documents ({total / 1e6:.1f} MB) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Local stand-ins for the external services, so benchmarks run offline.
+
+- `FakeEmbeddingServer`: HTTP server speaking the HuggingFace
+  feature-extraction protocol, returning deterministic hashed bag-of-words
+  vectors (texts sharing words get similar vectors, so searches are meaningful).
+- `FakePineconeIndex`: in-memory object with the `upsert`/`query`/`delete`
+  surface of a Pinecone index, for `PineconeBackend(index=...)`.
+- `FakeDocuSignServer`: HTTP server for the eSignature REST endpoints used by
+  `DocuSignClient` (envelope listing with pagination, document lists, downloads).
+- `FakeGenerativeModel`: Gemini `generate_content` with configurable
+  time-to-first-token and per-chunk delay, streaming or not.
+
+Every fake takes an optional latency so network round trips can be simulated.
+"""
+import json
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from config import Config
+from services.metadata_index import matches_filter
+from services.vector_backend import Match, QueryResult
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def hashed_embedding(text: str, dimension: int = Config.EMBEDDING_DIMENSION) -> List[float]:
+    """Unit-length signed bag-of-words vector with one hashed bucket per word."""
+    vector = np.zeros(dimension, dtype=np.float32)
+    for word in WORD_PATTERN.findall(text.lower()):
+        code = zlib.crc32(word.encode("utf-8"))
+        vector[code % dimension] += 1.0 if code & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+class _Server:
+    """Threaded HTTP server on a free localhost port, started and stopped as a context manager."""
+
+    def __init__(self, handler):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self.requests = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real services
+    # Headers and body go out as separate writes; with Nagle on, the body waits
+    # for the client's delayed ACK and every response gains ~40ms of fake latency
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, payload: Any, status: int = 200):
+        self._send(status, json.dumps(payload).encode("utf-8"))
+
+
+class _EmbeddingHandler(_Handler):
+    def do_POST(self):
+        fake = self.fake
+        fake.requests += 1
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        inputs = payload.get("inputs")
+        texts = [inputs] if isinstance(inputs, str) else list(inputs or [])
+        if fake.latency:
+            time.sleep(fake.latency)
+        self._send_json([hashed_embedding(text, fake.dimension) for text in texts])
+
+
+class FakeEmbeddingServer(_Server):
+    def __init__(self, latency_ms: float = 0, dimension: int = Config.EMBEDDING_DIMENSION):
+        super().__init__(_EmbeddingHandler)
+        self.latency = latency_ms / 1000
+        self.dimension = dimension
+
+
+class FakePineconeIndex:
+    """Brute-force in-memory index answering like Pinecone, filters included."""
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency = latency_ms / 1000
+        self._vectors: Dict[str, Tuple[np.ndarray, Dict[str, Any]]] = {}
+        self._matrix = None
+        self._ids: List[str] = []
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def upsert(self, vectors):
+        self._round_trip()
+        with self._lock:
+            for vector_id, values, metadata in vectors:
+                vector = np.asarray(values, dtype=np.float32)
+                norm = np.linalg.norm(vector)
+                self._vectors[vector_id] = (vector / norm if norm else vector, dict(metadata or {}))
+            self._matrix = None
+
+    def delete(self, ids):
+        self._round_trip()
+        with self._lock:
+            for vector_id in ids:
+                self._vectors.pop(vector_id, None)
+            self._matrix = None
+
+    def query(self, vector, top_k: int = 5, include_metadata: bool = False, include_values: bool = False,
+              filter: Optional[Dict[str, Any]] = None):
+        self._round_trip()
+        with self._lock:
+            if self._matrix is None:
+                self._ids = list(self._vectors)
+                self._matrix = (np.stack([self._vectors[i][0] for i in self._ids]) if self._ids
+                                else np.zeros((0, len(vector)), dtype=np.float32))
+            query = np.asarray(vector, dtype=np.float32)
+            scores = self._matrix @ (query / (np.linalg.norm(query) or 1.0))
+            if filter:
+                allowed = np.array([matches_filter(self._vectors[i][1], filter) for i in self._ids], dtype=bool)
+                scores = np.where(allowed, scores, -np.inf)
+            order = [int(i) for i in np.argsort(-scores)[:top_k] if np.isfinite(scores[i])]
+            return QueryResult(matches=[
+                Match(
+                    id=self._ids[i],
+                    score=float(scores[i]),
+                    metadata=dict(self._vectors[self._ids[i]][1]) if include_metadata else {},
+                    values=self._vectors[self._ids[i]][0].tolist() if include_values else None
+                )
+                for i in order
+            ])
+
+
+class _DocuSignHandler(_Handler):
+    ROUTES = (
+        (re.compile(r"/accounts/(?P<account>[^/]+)/envelopes$"), "_envelopes"),
+        (re.compile(r"/accounts/(?P<account>[^/]+)/envelopes/(?P<envelope>[^/]+)/documents$"), "_documents"),
+        (re.compile(r"/accounts/(?P<account>[^/]+)/envelopes/(?P<envelope>[^/]+)/documents/(?P<document>[^/]+)$"),
+         "_download"),
+    )
+
+    def do_GET(self):
+        fake = self.fake
+        fake.requests += 1
+        if fake.latency:
+            time.sleep(fake.latency)
+        url = urlparse(self.path)
+        for pattern, handler in self.ROUTES:
+            match = pattern.search(url.path)
+            if match:
+                return getattr(self, handler)(parse_qs(url.query), **match.groupdict())
+        self._send_json({"errorCode": "NOT_FOUND"}, status=404)
+
+    def _envelopes(self, query, account):
+        start = int(query.get("start_position", ["0"])[0])
+        count = int(query.get("count", [str(Config.DOCUSIGN_PAGE_SIZE)])[0])
+        envelopes = self.fake.envelopes
+        self._send_json({
+            "envelopes": envelopes[start:start + count],
+            "totalSetSize": str(len(envelopes)),
+            "resultSetSize": str(len(envelopes[start:start + count])),
+        })
+
+    def _documents(self, query, account, envelope):
+        documents = [
+            {"documentId": document_id, "name": name, "type": "content",
+             "uri": f"/envelopes/{envelope}/documents/{document_id}"}
+            for document_id, name in self.fake.documents.get(envelope, {}).items()
+        ]
+        self._send_json({"envelopeId": envelope, "envelopeDocuments": documents})
+
+    def _download(self, query, account, envelope, document):
+        content = self.fake.contents.get((envelope, document))
+        if content is None:
+            return self._send_json({"errorCode": "DOCUMENT_DOES_NOT_EXIST"}, status=404)
+        self._send(200, content, "application/pdf")
+
+
+class FakeDocuSignServer(_Server):
+    """
+    Serves one envelope per corpus document. `base_url` replaces
+    `DocuSignClient.base_url`; any bearer token is accepted.
+    """
+
+    def __init__(self, documents: List[Tuple[str, bytes]], latency_ms: float = 0):
+        super().__init__(_DocuSignHandler)
+        self.latency = latency_ms / 1000
+        self.envelopes, self.documents, self.contents = [], {}, {}
+        sent = datetime(2024, 1, 2, tzinfo=timezone.utc)
+        statuses = ("completed", "sent", "delivered", "completed", "declined")
+        for i, (name, content) in enumerate(documents):
+            envelope_id = f"00000000-0000-4000-8000-{i:012d}"
+            sent_at = (sent + timedelta(hours=7 * i)).strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
+            self.envelopes.append({
+                "envelopeId": envelope_id,
+                "status": statuses[i % len(statuses)],
+                "sentDateTime": sent_at,
+                "statusChangedDateTime": sent_at,
+                "emailSubject": f"Please sign: {name}",
+            })
+            self.documents[envelope_id] = {"1": name}
+            self.contents[(envelope_id, "1")] = content
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/restapi/v2.1/accounts"
+
+
+class _Chunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Answers with a canned summary of the prompt after Gemini-like delays."""
+
+    def __init__(self, first_token_ms: float = 0, chunk_ms: float = 0, chunks: int = 8):
+        self.first_token = first_token_ms / 1000
+        self.chunk_delay = chunk_ms / 1000
+        self.chunks = chunks
+        self.calls = 0
+
+    def _answer(self, prompt: str) -> List[str]:
+        titles = sorted(set(re.findall(r"^Document: (.+)$", prompt, flags=re.MULTILINE)))
+        words = f"1. The agreements address the query. 2. Source references: {', '.join(titles)}.".split(" ")
+        size = max(1, len(words) // self.chunks)
+        return [" ".join(words[i:i + size]) + " " for i in range(0, len(words), size)]
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        self.calls += 1
+        parts = self._answer(prompt)
+        if not stream:
+            time.sleep(self.first_token + self.chunk_delay * (len(parts) - 1))
+            return _Response("".join(parts))
+
+        def generate():
+            time.sleep(self.first_token)
+            for i, part in enumerate(parts):
+                if i:
+                    time.sleep(self.chunk_delay)
+                yield _Chunk(part)
+        return generate()
@@ -0,0 +1,121 @@
+"""
+Import-time budget for the Streamlit entry point.
+
+Imports a module (default: `app`) in a fresh interpreter with `-X importtime`,
+prints the heaviest top-level imports, and fails if the total exceeds the
+budget or if any dependency that the search path should only load on first
+use was imported eagerly.
+
+    python -m benchmarks.import_budget --budget-ms 1500
+"""
+import argparse
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Heavy dependencies that must stay out of the entry point's import graph
+DEFERRED_MODULES = (
+    "fitz",
+    "pymupdf",
+    "PyPDF2",
+    "docx",
+    "sentence_transformers",
+    "torch",
+    "google.generativeai",
+    "docusign_esign",
+    "pinecone",
+)
+
+
+@dataclass
+class ImportRecord:
+    module: str
+    depth: int
+    self_us: int
+    cumulative_us: int
+
+
+def parse_importtime(output: str) -> List[ImportRecord]:
+    """Parse `-X importtime` stderr lines: `import time: self [us] | cumulative | imported package`."""
+    records = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # Header line
+        name = fields[2].rstrip()
+        module = name.lstrip()
+        # Nested imports are indented by two spaces per level after the separator's own space
+        depth = (len(name) - len(module) - 1) // 2
+        records.append(ImportRecord(module, depth, int(fields[0]), int(fields[1])))
+    return records
+
+
+def measure(module: str) -> List[ImportRecord]:
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")]))}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    return parse_importtime(completed.stderr)
+
+
+def direct_imports(records: List[ImportRecord], module: str) -> List[ImportRecord]:
+    """Imports made directly by `module`. `-X importtime` lists a module's children just before it."""
+    for end in range(len(records) - 1, -1, -1):
+        if records[end].module == module and records[end].depth == 0:
+            break
+    else:
+        return []
+    start = end
+    while start > 0 and records[start - 1].depth > 0:
+        start -= 1
+    return [record for record in records[start:end] if record.depth == 1]
+
+
+def eager_deferred_imports(records: List[ImportRecord]) -> List[str]:
+    imported = {record.module for record in records}
+    return [
+        name for name in DEFERRED_MODULES
+        if any(module == name or module.startswith(name + ".") for module in imported)
+    ]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check the import time of the app entry point against a budget.")
+    parser.add_argument("--module", default="app", help="Module to import (default: app)")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "2000")),
+                        help="Maximum total import time in milliseconds")
+    parser.add_argument("--top", type=int, default=15, help="Number of heaviest imports to show")
+    args = parser.parse_args(argv)
+
+    records = measure(args.module)
+    total_ms = sum(record.cumulative_us for record in records if record.depth == 0) / 1000
+
+    print(f"Importing {args.module}: {total_ms:.0f} ms total including interpreter startup "
+          f"(budget {args.budget_ms:.0f} ms)")
+    for record in sorted(direct_imports(records, args.module), key=lambda r: r.cumulative_us, reverse=True)[:args.top]:
+        print(f"  {record.cumulative_us / 1000:8.1f} ms  {record.module}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+    eager = eager_deferred_imports(records)
+    if eager:
+        failures.append(f"deferred dependencies imported eagerly: {', '.join(eager)}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Parity and throughput of the local encoder variants.
+
+Encodes the same texts with the full-precision reference model and each
+selected variant, prints per-text cosine agreement with the reference and
+texts/s per core, and exits non-zero if a variant's mean cosine falls below
+`--min-cosine`:
+
+    python -m benchmarks.local_encoder --variants torch-int8 onnx-int8 --threads 1
+
+Texts come from `--texts` (one per line) or are chunked from the sample
+documents in `Context files/`.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from services.chunking import chunk_text
+from services.embedding_service import EmbeddingService
+from services.extraction import SUPPORTED_EXTENSIONS, extract_text
+from services.local_encoder import LOCAL_ENCODERS, create_local_encoder
+
+SAMPLE_DIR = Path(__file__).resolve().parent.parent / "Context files"
+
+
+def sample_texts(limit: int) -> List[str]:
+    texts = []
+    for path in sorted(SAMPLE_DIR.glob("*")):
+        if path.suffix.lower() in SUPPORTED_EXTENSIONS:
+            texts.extend(chunk.text for chunk in chunk_text(extract_text(path.read_bytes(), path.name)))
+    # Repeat the sample documents to reach `limit` texts
+    return [texts[i % len(texts)] for i in range(limit)] if texts else []
+
+
+def throughput(encoder, texts: List[str], batch_size: int, rounds: int) -> float:
+    encoder.encode(texts[:batch_size], batch_size=batch_size)  # Warm-up
+    started = time.perf_counter()
+    for _ in range(rounds):
+        encoder.encode(texts, batch_size=batch_size)
+    return rounds * len(texts) / (time.perf_counter() - started)
+
+
+def cosine_agreement(reference: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return np.sum(reference * candidate, axis=1)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare local encoder variants with the reference model.")
+    parser.add_argument("--variants", nargs="+", default=[v for v in LOCAL_ENCODERS if v != "torch"],
+                        choices=LOCAL_ENCODERS)
+    parser.add_argument("--texts", type=Path, help="File with one text per line")
+    parser.add_argument("--limit", type=int, default=256, help="Number of texts")
+    parser.add_argument("--threads", type=int, default=1, help="Threads per encoder (throughput is per core)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    args = parser.parse_args(argv)
+
+    if args.texts:
+        texts = [line.strip() for line in args.texts.read_text(encoding="utf-8").splitlines() if line.strip()]
+        texts = texts[:args.limit]
+    else:
+        texts = sample_texts(args.limit)
+    if not texts:
+        parser.error("no texts to encode")
+
+    reference = create_local_encoder("torch", EmbeddingService.MODEL_ID, threads=args.threads)
+    reference_vectors = reference.encode(texts, batch_size=args.batch_size)
+    reference_rate = throughput(reference, texts, args.batch_size, args.rounds) / args.threads
+
+    print(f"{len(texts)} texts, {args.threads} thread(s), batch size {args.batch_size}")
+    print(f"{'variant':<12}{'texts/s/core':>14}{'speed-up':>10}{'mean cos':>10}{'min cos':>9}")
+    print(f"{'torch':<12}{reference_rate:>14.1f}{1.0:>9.2f}x{1.0:>10.4f}{1.0:>9.4f}")
+
+    failures = []
+    for variant in args.variants:
+        encoder = create_local_encoder(variant, EmbeddingService.MODEL_ID, threads=args.threads)
+        try:
+            vectors = encoder.encode(texts, batch_size=args.batch_size)
+        except Exception as e:
+            print(f"{variant:<12} unavailable: {e}")
+            continue
+        cosines = cosine_agreement(reference_vectors, vectors)
+        rate = throughput(encoder, texts, args.batch_size, args.rounds) / args.threads
+        print(f"{variant:<12}{rate:>14.1f}{rate / reference_rate:>9.2f}x{cosines.mean():>10.4f}{cosines.min():>9.4f}")
+        if cosines.mean() < args.min_cosine:
+            failures.append(f"{variant}: mean cosine {cosines.mean():.4f} < {args.min_cosine}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Recall versus compression of the local index quantization modes.
+
+Builds a float32, an int8 and a binary `LocalVectorIndex` over the same
+vectors in a temporary directory and compares each quantized top-k against
+the exact top-k:
+
+    python -m benchmarks.quantization_recall --vectors 200000 --top-k 5
+
+With `--index data/local_index` the vectors of an existing local index are
+used instead of synthetic clustered ones, and queries are perturbed copies
+of stored vectors.
+"""
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from services.local_index import LocalVectorIndex
+from services.quantization import QUANTIZERS, create_quantizer
+
+
+def synthetic_vectors(count: int, dimension: int, clusters: int, seed: int) -> np.ndarray:
+    """Clustered Gaussian vectors, a rough stand-in for sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(clusters, dimension))
+    return (centroids[rng.integers(0, clusters, count)] + 0.7 * rng.normal(size=(count, dimension))).astype(np.float32)
+
+
+def load_vectors(index_path: str) -> np.ndarray:
+    vectors = np.load(Path(index_path) / LocalVectorIndex.VECTORS_FILE, mmap_mode="r")
+    live = np.flatnonzero(np.abs(vectors).sum(axis=1) > 0)
+    return np.asarray(vectors[live], dtype=np.float32)
+
+
+def build(path: str, vectors: np.ndarray, mode: str) -> LocalVectorIndex:
+    quantizer = create_quantizer(mode, path, vectors.shape[1])
+    index = LocalVectorIndex(path, vectors.shape[1], initial_capacity=len(vectors), quantizer=quantizer)
+    for start in range(0, len(vectors), 10000):
+        batch = vectors[start:start + 10000]
+        index.upsert([(f"v{start + i}", vector, {}) for i, vector in enumerate(batch)])
+    return index
+
+
+def evaluate(index: LocalVectorIndex, queries: np.ndarray, truth: list, top_k: int) -> tuple[float, float]:
+    """Mean recall@k against `truth` and p50 latency in milliseconds."""
+    recalls, latencies = [], []
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        found = {match.id for match in index.search(query, top_k=top_k).matches}
+        latencies.append(time.perf_counter() - started)
+        recalls.append(len(found & expected) / len(expected))
+    return float(np.mean(recalls)), float(np.percentile(latencies, 50) * 1000)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure recall@k versus memory for local index quantization.")
+    parser.add_argument("--vectors", type=int, default=100000, help="Synthetic corpus size")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--index", help="Evaluate the vectors of an existing local index instead")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed + 1)
+    if args.index:
+        vectors = load_vectors(args.index)
+        picks = vectors[rng.integers(0, len(vectors), args.queries)]
+        queries = picks + 0.05 * rng.normal(size=picks.shape).astype(np.float32)
+    else:
+        corpus = synthetic_vectors(args.vectors + args.queries, args.dimension, 256, args.seed)
+        vectors, queries = corpus[:args.vectors], corpus[args.vectors:]
+
+    workdir = tempfile.mkdtemp(prefix="quantization_recall_")
+    try:
+        exact = build(f"{workdir}/none", vectors, "none")
+        truth = [{match.id for match in exact.search(query, top_k=args.top_k, exact=True).matches} for query in queries]
+        _, exact_ms = evaluate(exact, queries, truth, args.top_k)
+
+        print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, recall@{args.top_k}")
+        print(f"{'mode':<8}{'bytes/vec':>10}{'compression':>13}{'recall':>9}{'p50 ms':>9}")
+        print(f"{'float32':<8}{vectors.shape[1] * 4:>10}{1.0:>12.1f}x{1.0:>9.3f}{exact_ms:>9.1f}")
+        for mode in QUANTIZERS:
+            index = build(f"{workdir}/{mode}", vectors, mode)
+            recall, p50 = evaluate(index, queries, truth, args.top_k)
+            quantizer = index.quantizer
+            print(f"{mode:<8}{quantizer.bytes_per_vector:>10}{quantizer.compression:>12.1f}x{recall:>9.3f}{p50:>9.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+End-to-end offline benchmark: extraction, embedding, ingest, search,
+answer streaming, DocuSign sync and upserts against local stand-ins for every
+external service (see `benchmarks.fakes`), on a synthetic contract corpus
+(see `benchmarks.corpus`).
+
+    python -m benchmarks.suite                       # compare with benchmarks/baseline.json
+    python -m benchmarks.suite --save-baseline       # record a new baseline
+    python -m benchmarks.suite --backend pinecone --pinecone-latency-ms 20 --hf-latency-ms 30
+
+Throughput metrics (`*_per_s`) regress when they drop, latency and memory
+metrics (`*_ms`, `*_mb`) when they rise, by more than `--tolerance`. The
+exit status is 1 on any regression. Baselines are machine-specific: record
+one on the machine that runs the comparison.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from benchmarks.corpus import COMPANIES, JURISDICTIONS, generate_files
+from benchmarks.fakes import FakeDocuSignServer, FakeEmbeddingServer, FakeGenerativeModel, FakePineconeIndex
+from config import Config
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+QUERY_TEMPLATES = (
+    "termination for convenience notice period",
+    "limitation of liability cap",
+    "governing law {jurisdiction}",
+    "{company} payment terms and late interest",
+    "indemnification for gross negligence",
+    "who can assign the agreement",
+    '"force majeure"',
+    "confidential information obligations of {company}",
+)
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentiles(latencies: List[float], prefix: str) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99])
+    return {f"{prefix}_p50_ms": float(p50), f"{prefix}_p95_ms": float(p95), f"{prefix}_p99_ms": float(p99)}
+
+
+def make_queries(count: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    return [
+        rng.choice(QUERY_TEMPLATES).format(company=rng.choice(COMPANIES), jurisdiction=rng.choice(JURISDICTIONS))
+        for _ in range(count)
+    ]
+
+
+def configure(workdir: str):
+    """Keep every data file in `workdir` and turn off caches that would hide the work being measured."""
+    Config.DATA_DIR = workdir
+    Config.LOCAL_INDEX_PATH = f"{workdir}/local_index"
+    Config.LEXICAL_INDEX_PATH = f"{workdir}/lexical_index.sqlite3"
+    Config.INGEST_MANIFEST_PATH = f"{workdir}/ingest_manifest.sqlite3"
+    Config.DOCUSIGN_SYNC_STATE_PATH = f"{workdir}/docusign_sync.sqlite3"
+    Config.DOCUMENT_SPOOL_DIR = workdir
+    Config.EMBEDDING_CACHE_ENABLED = False
+    Config.QUERY_CACHE_ENABLED = False
+    Config.WARM_LOCAL_MODEL = False
+
+
+def build_services(args, hf_url: str):
+    from services.container import get_container
+    from services.embedding_service import EmbeddingService
+    from services.ingest_manifest import IngestManifest
+    from services.vector_store import PineconeBackend, VectorStore, create_backend
+
+    embedding_service = EmbeddingService()
+    embedding_service.router.api_url = hf_url
+    if args.backend == "pinecone":
+        backend = PineconeBackend(index=FakePineconeIndex(args.pinecone_latency_ms))
+    else:
+        backend = create_backend("local")
+    services = get_container()
+    services.override(
+        embedding_service=embedding_service,
+        vector_store=VectorStore(backend=backend),
+        manifest=IngestManifest(Config.INGEST_MANIFEST_PATH),
+        generative_model=FakeGenerativeModel(args.gemini_first_token_ms, args.gemini_chunk_ms)
+    )
+    return services
+
+
+def bench_extract(files: List[Tuple[str, bytes]]) -> Tuple[Dict[str, float], List[str]]:
+    from services.extraction import extract_text
+    started = time.perf_counter()
+    texts = [extract_text(data, name) for name, data in files]
+    elapsed = time.perf_counter() - started
+    megabytes = sum(len(data) for _, data in files) / 1e6
+    return {"extract_docs_per_s": len(files) / elapsed, "extract_mb_per_s": megabytes / elapsed}, texts
+
+
+def bench_embed(services, texts: List[str]) -> Dict[str, float]:
+    from services.chunking import chunk_text
+    chunks = [chunk.text for text in texts for chunk in chunk_text(text)]
+    batch = Config.EMBEDDING_BATCH_SIZE
+    started = time.perf_counter()
+    for i in range(0, len(chunks), batch):
+        services.embedding_service.get_embeddings(chunks[i:i + batch])
+    return {"embed_texts_per_s": len(chunks) / (time.perf_counter() - started)}
+
+
+def bench_ingest(services, files: List[Tuple[str, bytes]]) -> Dict[str, float]:
+    from services.extraction import extract_text
+    from services.ingest import reindex_document
+    from services.ingest_manifest import content_hash, local_document_id
+    started = time.perf_counter()
+    for name, data in files:
+        reindex_document(
+            services.embedding_service, services.vector_store, services.manifest,
+            local_document_id(name), content_hash(data), extract_text(data, name),
+            {'title': name, 'source': 'Local'}
+        )
+    services.vector_store.flush()
+    return {"ingest_docs_per_s": len(files) / (time.perf_counter() - started)}
+
+
+def bench_upsert(services, calls: int, vectors_per_call: int = 20) -> Dict[str, float]:
+    """Document-sized upserts, as ingest issues them, including the final flush of buffered writes."""
+    from benchmarks.fakes import hashed_embedding
+    rng = random.Random(0)
+    words = [company.split()[0].lower() for company in COMPANIES] + [j.split()[0].lower() for j in JURISDICTIONS]
+    batches = [
+        [
+            (f"upsert-benchmark-{call}#{i}", hashed_embedding(" ".join(rng.choices(words, k=12))),
+             {'document_id': f"upsert-benchmark-{call}", 'text': " ".join(rng.choices(words, k=150))})
+            for i in range(vectors_per_call)
+        ]
+        for call in range(calls)
+    ]
+    started = time.perf_counter()
+    for batch in batches:
+        services.vector_store.upsert(batch)
+    services.vector_store.flush()
+    return {"upsert_vectors_per_s": calls * vectors_per_call / (time.perf_counter() - started)}
+
+
+def search_app(services):
+    from app import AgreementSearchApp
+    search = AgreementSearchApp(services)
+    search.set_status = lambda message, is_error=False: None  # Keep UI calls out of the timings
+    return search
+
+
+def bench_query(services, queries: List[str]) -> Dict[str, float]:
+    search = search_app(services)
+    search.search_agreements(queries[0])  # Warm-up
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        search.search_agreements(query)
+        latencies.append(time.perf_counter() - started)
+    return percentiles(latencies, "query")
+
+
+def bench_answer(services, queries: List[str]) -> Dict[str, float]:
+    search = search_app(services)
+    first_tokens, totals = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results = search.search_agreements(query)
+        stream = search.stream_ai_response(query, results, search.last_passages, search.last_query_embedding)
+        next(stream, None)
+        first_tokens.append(time.perf_counter() - started)
+        for _ in stream:
+            pass
+        totals.append(time.perf_counter() - started)
+    return {**percentiles(first_tokens, "answer_first_token"), **percentiles(totals, "answer_total")}
+
+
+def bench_docusign(services, files: List[Tuple[str, bytes]], latency_ms: float) -> Dict[str, float]:
+    import streamlit as st
+    from app import sync_envelopes
+    with FakeDocuSignServer(files, latency_ms=latency_ms) as server:
+        client = services.docusign_client
+        client.base_url = server.base_url
+        st.session_state.docusign_token = "benchmark"
+        started = time.perf_counter()
+        asyncio.run(sync_envelopes(client, "benchmark-account"))
+        elapsed = time.perf_counter() - started
+    return {"docusign_sync_docs_per_s": len(files) / elapsed}
+
+
+def compare(metrics: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """Print metrics next to the baseline; return the regressed ones."""
+    regressions = []
+    print(f"{'metric':<32}{'value':>12}{'baseline':>12}{'change':>9}")
+    for name, value in metrics.items():
+        reference = baseline.get(name)
+        if not reference:
+            print(f"{name:<32}{value:>12.2f}{'-':>12}{'':>9}")
+            continue
+        change = value / reference - 1
+        worse = change < -tolerance if name.endswith("_per_s") else change > tolerance
+        if worse:
+            regressions.append(f"{name}: {value:.2f} vs baseline {reference:.2f} ({change:+.0%})")
+        print(f"{name:<32}{value:>12.2f}{reference:>12.2f}{change:>+8.0%}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark with local service stand-ins.")
+    parser.add_argument("--docs", type=int, default=60, help="Synthetic contracts to ingest")
+    parser.add_argument("--docusign-docs", type=int, default=20, help="Envelopes served by the fake DocuSign")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--answers", type=int, default=20, help="Queries answered through the fake Gemini")
+    parser.add_argument("--upsert-calls", type=int, default=100, help="Document-sized upserts of 20 vectors")
+    parser.add_argument("--backend", choices=("local", "pinecone"), default="local",
+                        help="Local index, or PineconeBackend over an in-memory fake index")
+    parser.add_argument("--hf-latency-ms", type=float, default=0)
+    parser.add_argument("--pinecone-latency-ms", type=float, default=0)
+    parser.add_argument("--docusign-latency-ms", type=float, default=0)
+    parser.add_argument("--gemini-first-token-ms", type=float, default=0)
+    parser.add_argument("--gemini-chunk-ms", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative change before failing")
+    parser.add_argument("--output", type=Path, help="Also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    settings = {key: value for key, value in vars(args).items()
+                if key not in ("baseline", "save_baseline", "tolerance", "output")}
+    workdir = tempfile.mkdtemp(prefix="benchmark_")
+    configure(workdir)
+
+    files = generate_files(args.docs, seed=args.seed)
+    queries = make_queries(args.queries, args.seed)
+    metrics = {}
+    with FakeEmbeddingServer(latency_ms=args.hf_latency_ms) as hf:
+        services = build_services(args, hf.url)
+        stages = (
+            ("extract", lambda: bench_extract(files)),
+            ("embed", lambda: bench_embed(services, texts)),
+            ("ingest", lambda: bench_ingest(services, files)),
+            ("query", lambda: bench_query(services, queries)),
+            ("answer", lambda: bench_answer(services, queries[:args.answers])),
+            ("docusign", lambda: bench_docusign(
+                services, generate_files(args.docusign_docs, formats=("pdf",), seed=args.seed + 1),
+                args.docusign_latency_ms
+            )),
+            # Last, so its vectors do not change the search results measured above
+            ("upsert", lambda: bench_upsert(services, args.upsert_calls)),
+        )
+        texts = []
+        for stage, run in stages:
+            started = time.perf_counter()
+            result = run()
+            if stage == "extract":
+                result, texts = result
+            metrics.update(result)
+            print(f"[{stage}] {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    metrics["peak_rss_mb"] = peak_rss_mb()
+
+    report = {
+        "metrics": metrics,
+        "settings": settings,
+        "environment": {"python": platform.python_version(), "machine": platform.machine(),
+                        "system": platform.system()},
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+
+    baseline = {}
+    if args.baseline.exists() and not args.save_baseline:
+        stored = json.loads(args.baseline.read_text())
+        baseline = stored.get("metrics", {})
+        if stored.get("settings") != settings:
+            print("Note: baseline was recorded with different settings; comparisons are indicative only")
+    regressions = compare(metrics, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"FAIL: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""
+Headless bulk ingest: crawl a directory of PDF/DOCX/TXT files, extract text in
+a process pool, embed chunks in large batches and upsert them through
+`VectorStore`.
+
+    python bulk_ingest.py /path/to/agreements --workers 8
+
+Indexed files are recorded in the shared ingest manifest with their content
+hash, so an interrupted run resumes where it stopped and a re-run only
+re-embeds files whose content changed.
+"""
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+from config import Config
+from services.embedding_service import EmbeddingService
+from services.extraction import SUPPORTED_EXTENSIONS, extract_text
+from services.ingest import build_chunk_records, embed_and_upsert, index_version, record_indexed
+from services.ingest_manifest import IngestManifest, local_document_id, stable_document_id, content_hash
+from services.local_index import LocalVectorIndex
+from services.tracing import tracer
+from services.vector_store import VectorStore
+
+
+def crawl(root: Path) -> List[Path]:
+    """All supported documents under `root`, in a stable order."""
+    return sorted(
+        path for path in root.rglob("*")
+        if path.is_file() and path.suffix.lower() in SUPPORTED_EXTENSIONS
+    )
+
+
+def _extract_worker(task: tuple[str, Optional[str]]) -> tuple[str, str, Optional[str], Optional[str]]:
+    """
+    Process-pool task: (path, content hash, text, error).
+    Text is None without an error when the content matches `known_hash`.
+    """
+    path, known_hash = task
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+        digest = content_hash(content)
+        if digest == known_hash:
+            return path, digest, None, None
+        # Already one file per process, so no page-level pool inside the worker
+        return path, digest, extract_text(content, path, workers=1), None
+    except Exception as e:
+        return path, "", None, str(e)
+
+
+def _bounded_map(pool, fn, items, max_in_flight: int):
+    """Like `pool.map`, but keeps at most `max_in_flight` results buffered so slow embedding bounds memory."""
+    in_flight = deque()
+    items = iter(items)
+    for item in items:
+        in_flight.append(pool.submit(fn, item))
+        if len(in_flight) >= max_in_flight:
+            break
+    while in_flight:
+        yield in_flight.popleft().result()
+        for item in items:
+            in_flight.append(pool.submit(fn, item))
+            break
+
+
+class IngestStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.docs = 0
+        self.chunks = 0
+        self.bytes = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def line(self) -> str:
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        return (
+            f"{self.docs} docs ({self.docs / elapsed:.1f}/s), "
+            f"{self.chunks} chunks ({self.chunks / elapsed:.1f}/s), "
+            f"{self.bytes / 1e6:.1f} MB ({self.bytes / 1e6 / elapsed:.2f} MB/s), "
+            f"{self.skipped} skipped, {self.failed} failed, {elapsed:.1f}s"
+        )
+
+
+def run(root: Path, workers: int, batch_size: Optional[int], manifest_path: str, report_every: int = 100,
+        encode_processes: int = None, retrain_ann: bool = False) -> IngestStats:
+    embedding_service = EmbeddingService()
+    vector_store = VectorStore()
+    manifest = IngestManifest(manifest_path)
+    stats = IngestStats()
+    # encode_processes=0 keeps the API-first embedding path instead of the local bulk encoder
+    bulk_encode = encode_processes != 0
+    if bulk_encode and encode_processes is not None:
+        embedding_service.bulk_processes = encode_processes
+    if batch_size is None:
+        # Large enough flushes to keep every encoder process busy
+        batch_size = (
+            max(1, embedding_service.bulk_processes) * Config.BULK_ENCODE_MAX_BATCH if bulk_encode
+            else Config.EMBEDDING_BATCH_SIZE * 8
+        )
+
+    version = index_version(embedding_service)
+    tasks = []
+    for path in crawl(root):
+        entry = manifest.get(local_document_id(str(path.relative_to(root))))
+        known_hash = entry.content_hash if entry and entry.model_id == version else None
+        tasks.append((str(path), known_hash))
+    print(f"Found {len(tasks)} documents, {sum(1 for _, h in tasks if h)} already in the manifest")
+
+    pending_records = []
+    pending_docs = []  # (document id, content hash, chunk ids, file key) waiting for the next flush
+
+    def flush():
+        documents = list(pending_docs)
+
+        def written(_ids):
+            # Runs once the vector store has stored the batch, possibly from its write-behind thread
+            for document_id, digest, chunk_ids, key in documents:
+                record_indexed(vector_store, manifest, document_id, digest, chunk_ids, version)
+                # Earlier runs keyed files as "file" documents; drop that copy now that the "local" one is stored
+                legacy = manifest.get(stable_document_id("file", str(Path(key))))
+                if legacy is not None:
+                    vector_store.delete(legacy.chunk_ids)
+                    manifest.remove(legacy.document_id)
+                stats.docs += 1
+                stats.chunks += len(chunk_ids)
+
+        def failed(_ids, error):
+            # Documents left out of the manifest are retried by the next run
+            print(f"Failed to store {len(documents)} documents, they will be retried on the next run: {error}")
+            stats.failed += len(documents)
+
+        try:
+            if pending_records:
+                stored = embed_and_upsert(
+                    embedding_service, vector_store, pending_records, batch_size, bulk=bulk_encode,
+                    on_written=written, on_failed=failed
+                )
+                if not stored:
+                    stats.failed += len(documents)
+            else:
+                written([])
+        except Exception as e:
+            failed([], e)
+        finally:
+            pending_records.clear()
+            pending_docs.clear()
+
+    last_report = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path_str, digest, text, error in _bounded_map(pool, _extract_worker, tasks, workers * 4):
+                path = Path(path_str)
+                key = path.relative_to(root).as_posix()
+                if error:
+                    print(f"Could not extract text from {key}: {error}")
+                    stats.failed += 1
+                    continue
+                if text is None:
+                    stats.skipped += 1
+                    continue
+                stats.bytes += path.stat().st_size
+                if not text.strip():
+                    print(f"Could not extract text from {key}: empty document")
+                    stats.failed += 1
+                    continue
+
+                document_id = local_document_id(key)
+                records = build_chunk_records(
+                    document_id,
+                    text,
+                    {'title': path.name, 'source': 'Local', 'path': key}
+                )
+                pending_records.extend(records)
+                pending_docs.append((document_id, digest, [vector_id for vector_id, _, _ in records], key))
+                if len(pending_records) >= batch_size:
+                    flush()
+                    if stats.docs - last_report >= report_every:
+                        print(stats.line())
+                        last_report = stats.docs
+            flush()
+    finally:
+        embedding_service.close_bulk_pool()
+        # Stores what is still buffered; a failed write is counted by its `failed` callback
+        vector_store.flush()
+
+    backend = vector_store.backend
+    if isinstance(backend, LocalVectorIndex) and (retrain_ann or backend.ann_needs_retrain()):
+        # A backfill can grow the corpus far past what the IVF centroids were fitted on
+        print("Retraining the IVF centroids on the current corpus...")
+        backend.rebuild_ann()
+
+    print(f"Done: {stats.line()}")
+    # Extraction runs in worker processes, so its spans are not in this process's tracer
+    for stage in tracer.snapshot():
+        labels = ", ".join(stage['labels'].values())
+        print(
+            f"  {stage['stage']}{f' ({labels})' if labels else ''}: {stage['calls']} calls, "
+            f"p50 {stage['p50_ms']:.1f} ms, p95 {stage['p95_ms']:.1f} ms, {stage['errors']} errors"
+        )
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory of PDF/DOCX/TXT files.")
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Extraction processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="Chunks per embedding/upsert flush (default: scaled to the encoder processes)")
+    parser.add_argument("--manifest", default=Config.INGEST_MANIFEST_PATH,
+                        help="Ingest manifest path")
+    parser.add_argument("--encode-processes", type=int, default=Config.BULK_ENCODE_PROCESSES,
+                        help="Local encoder processes (default: all cores; 0 = use the Inference API first)")
+    parser.add_argument("--retrain-ann", action="store_true",
+                        help="Retrain the local IVF index after ingesting (default: only once the corpus "
+                             "has grown IVF_RETRAIN_RATIO times since the last training)")
+    args = parser.parse_args(argv)
+
+    if not args.directory.is_dir():
+        parser.error(f"{args.directory} is not a directory")
+    run(args.directory.resolve(), args.workers, args.batch_size, args.manifest,
+        encode_processes=args.encode_processes, retrain_ann=args.retrain_ann)
+
+
+if __name__ == "__main__":
+    main()
@@ -24,13 +24,116 @@ class Config:
     DOCUSIGN_SCOPES = "signature impersonation extended"  # Change scope to match DocuSign requirements
     DOCUSIGN_USER_ID = os.getenv("DOCUSIGN_USER_ID")
     DOCUSIGN_ACCOUNT_ID = os.getenv("DOCUSIGN_ACCOUNT_ID")
-    BATCH_SIZE = 5  # Number of vectors to upsert at once 
+
+    # Vector store config
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").strip().lower()  # "pinecone" or "local"
+    EMBEDDING_DIMENSION = 384  # Dimension for all-MiniLM-L6-v2 model
+    DATA_DIR = os.getenv("DATA_DIR", "data")
+    LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", os.path.join(DATA_DIR, "local_index"))
+    LOCAL_INDEX_TYPE = os.getenv("LOCAL_INDEX_TYPE", "flat").strip().lower()  # "flat" or "ivf"
+    IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 = 4 * sqrt(corpus size) at train time
+    IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+    IVF_MIN_TRAIN_SIZE = int(os.getenv("IVF_MIN_TRAIN_SIZE", "10000"))
+    # Corpus growth since the centroids were trained after which bulk_ingest retrains them (0 = never)
+    IVF_RETRAIN_RATIO = float(os.getenv("IVF_RETRAIN_RATIO", "2.0"))
+    # Candidate codes kept in RAM: "none", "int8" (~4x smaller) or "binary" (32x smaller)
+    LOCAL_INDEX_QUANTIZATION = os.getenv("LOCAL_INDEX_QUANTIZATION", "none").strip().lower()
+    QUANTIZATION_RESCORE_MULTIPLIER = int(os.getenv("QUANTIZATION_RESCORE_MULTIPLIER", "0"))  # 0 = per-mode default
+    FILTER_SCAN_ROWS = int(os.getenv("FILTER_SCAN_ROWS", "10000"))  # Filters matching fewer rows skip the ANN index
+
+    # Vector upserts: request-sized batches sent concurrently, small writes coalesced behind a buffer
+    UPSERT_MAX_REQUEST_BYTES = int(os.getenv("UPSERT_MAX_REQUEST_BYTES", str(2 * 1024 * 1024)))  # Pinecone limit: 2 MB
+    UPSERT_MAX_BATCH_VECTORS = 1000  # Pinecone limit per upsert request
+    UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", "4"))  # Upsert requests in flight at once
+    UPSERT_MAX_RETRIES = int(os.getenv("UPSERT_MAX_RETRIES", "3"))  # Per batch, on throttling and transient errors
+    WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").strip().lower() == "true"
+    WRITE_BEHIND_MAX_VECTORS = int(os.getenv("WRITE_BEHIND_MAX_VECTORS", "1000"))
+    WRITE_BEHIND_MAX_DELAY_MS = float(os.getenv("WRITE_BEHIND_MAX_DELAY_MS", "2000"))
+
+    # Lexical (BM25) index and hybrid search
+    LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "true").strip().lower() == "true"
+    LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", os.path.join(DATA_DIR, "lexical_index.sqlite3"))
+    SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid").strip().lower()  # "hybrid", "dense" or "lexical"
+    BM25_K1 = 1.2
+    BM25_B = 0.75
+    LEXICAL_COMPACT_RATIO = 0.25  # Share of postings left by updated/deleted chunks that triggers a compaction
+    RRF_K = 60  # Reciprocal rank fusion constant
+
+    # Query/answer cache (exact and near-duplicate queries)
+    QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").strip().lower() == "true"
+    QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1000"))
+    QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+    QUERY_CACHE_SIMILARITY = float(os.getenv("QUERY_CACHE_SIMILARITY", "0.97"))  # Cosine for a near-duplicate hit
+
+    # Prompt context packing for Gemini answers
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+    CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))  # 1 = relevance only, 0 = diversity only
+    CONTEXT_DUPLICATE_THRESHOLD = 0.95  # Cosine above which a passage counts as a near-duplicate
+
+    # Chunking config
+    # Tokens per chunk; each token can become several word pieces, so this stays at half the model's 256 limit
+    CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "128"))
+    CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "25"))
+    CHUNK_AGGREGATION = os.getenv("CHUNK_AGGREGATION", "max").strip().lower()  # "max" or "sum"
+    CHUNK_OVERSAMPLE = 4  # Chunk hits fetched per requested document
+    EMBEDDING_BATCH_SIZE = 32  # Texts per embedding call during ingest
+    INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", os.path.join(DATA_DIR, "ingest_manifest.sqlite3"))
+
+    # Text extraction config
+    PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(os.cpu_count() or 1, 8))))
+    PDF_PARALLEL_MIN_PAGES = 200  # Smaller PDFs are not worth the process-pool startup
+
+    # Embedding cache config
+    EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").strip().lower() == "true"
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(DATA_DIR, "embedding_cache.sqlite3"))
+    EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+    # Embedding scheduler config (coalesces concurrent requests into one batch)
+    EMBEDDING_SCHEDULER_MAX_BATCH = int(os.getenv("EMBEDDING_SCHEDULER_MAX_BATCH", "32"))
+    EMBEDDING_SCHEDULER_MAX_WAIT_MS = float(os.getenv("EMBEDDING_SCHEDULER_MAX_WAIT_MS", "5"))
+
+    # Local fallback encoder: "torch" (full precision), "torch-int8" (dynamic int8), "onnx" or "onnx-int8"
+    LOCAL_ENCODER = os.getenv("LOCAL_ENCODER", "torch").strip().lower()
+    LOCAL_ENCODER_THREADS = int(os.getenv("LOCAL_ENCODER_THREADS", "0"))  # 0 = runtime default
+    ONNX_MODEL_FILE = os.getenv("ONNX_MODEL_FILE", "")  # Override the ONNX file inside the model repo
+    BULK_ENCODE_PROCESSES = int(os.getenv("BULK_ENCODE_PROCESSES", str(os.cpu_count() or 1)))  # 1 = in-process
+    BULK_ENCODE_TOKEN_BUDGET = int(os.getenv("BULK_ENCODE_TOKEN_BUDGET", "8192"))  # Tokens per length-bucketed batch
+    BULK_ENCODE_MAX_BATCH = 256
+
+    # Tracing and metrics
+    TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")  # JSON-lines span log; empty disables it
+    TRACE_WINDOW = int(os.getenv("TRACE_WINDOW", "1000"))  # Recent spans per stage kept for percentiles
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Prometheus /metrics endpoint; 0 disables it
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # Use 0.0.0.0 to let other hosts scrape it
+
+    # Service container config
+    WARM_LOCAL_MODEL = os.getenv("WARM_LOCAL_MODEL", "true").strip().lower() == "true"  # Load the fallback model at startup
+
+    # Embedding router config (remote API vs local model)
+    HF_API_TIMEOUT = float(os.getenv("HF_API_TIMEOUT", "10"))  # Seconds
+    HF_POOL_SIZE = 8  # Pooled HTTP connections to the Inference API
+    EMBEDDING_HEDGE_AFTER_MS = float(os.getenv("EMBEDDING_HEDGE_AFTER_MS", "0"))  # 0 disables hedging
+    CIRCUIT_FAILURE_THRESHOLD = 3  # Consecutive remote failures before skipping the API
+    CIRCUIT_ERROR_RATE = 0.5  # Rolling remote error rate that also opens the circuit
+    CIRCUIT_MIN_SAMPLES = 10
+    CIRCUIT_RESET_SECONDS = 30
 
     # DocuSign config
     DOCUSIGN_CLIENT_ID = os.getenv("DOCUSIGN_CLIENT_ID")
     DOCUSIGN_CLIENT_SECRET = os.getenv("DOCUSIGN_CLIENT_SECRET")
     DOCUSIGN_BASE_PATH = "https://demo.docusign.net/restapi/v2.1"
     DOCUSIGN_AUTH_SERVER = "account-d.docusign.com"
+    DOCUSIGN_MAX_CONCURRENCY = int(os.getenv("DOCUSIGN_MAX_CONCURRENCY", "8"))  # Parallel requests / pooled connections
+    DOCUSIGN_PAGE_SIZE = 100  # Envelopes per list page
+    DOCUSIGN_MAX_RETRIES = 4
+    DOCUSIGN_MAX_BACKOFF = 60  # Seconds
+    DOCUSIGN_RATE_LIMIT_RESERVE = 10  # Pause when fewer requests than this remain in the window
+    DOCUSIGN_SYNC_START = os.getenv("DOCUSIGN_SYNC_START", "2024-01-01")  # First sync window for a new account
+    DOCUSIGN_SYNC_OVERLAP_MINUTES = 5
+    DOCUMENT_SPOOL_MEMORY_MB = int(os.getenv("DOCUMENT_SPOOL_MEMORY_MB", "8"))  # Larger downloads go to a temp file
+    DOCUMENT_MAX_MB = int(os.getenv("DOCUMENT_MAX_MB", "100"))  # Per-document download cap
+    DOCUMENT_SPOOL_DIR = os.getenv("DOCUMENT_SPOOL_DIR") or None  # Defaults to the system temp dir
+    DOCUSIGN_SYNC_STATE_PATH = os.getenv("DOCUSIGN_SYNC_STATE_PATH", os.path.join(DATA_DIR, "docusign_sync.sqlite3"))
 
     @staticmethod
     def validate_config():
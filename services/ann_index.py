@@ -0,0 +1,264 @@
+import json
+import os
+from array import array
+from typing import Callable, List, Optional
+
+import numpy as np
+
+
+def _replace_file(path: str, write: Callable):
+    """Write `path` through `write(file)` into a temp file that then replaces it, so a crash leaves the old file."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class IVFIndex:
+    """
+    Inverted-file (IVF) approximate nearest neighbour index.
+
+    Vectors are clustered around `nlist` spherical k-means centroids and each
+    row id is appended to the posting list of its nearest centroid. A query
+    only scores the rows in its `nprobe` closest lists, so latency grows with
+    list length rather than corpus size.
+
+    The index stores row numbers, not vectors: scoring reads the candidate
+    rows from the owning `LocalVectorIndex` matrix. Deletes and re-assignments
+    leave tombstones in the old list; they are filtered at query time through
+    the `assignment` array and dropped by `compact()`.
+
+    Assignment changes are appended to a journal as (row, list) pairs, so an
+    upsert writes only its own rows. `save()` rewrites the full assignment
+    array and starts a new journal, which happens after training and once the
+    journal outgrows the array. Centroids are fitted to the corpus they were
+    trained on; `needs_retrain()` reports when it has grown `retrain_ratio`
+    times since.
+
+    Every save starts a new epoch: the centroids, assignment and journal
+    files carry its number, and the meta file, replaced last, names the
+    current one. A crash mid-save therefore leaves the previous epoch's
+    files and journal in use, and a journal is never replayed over an
+    assignment from another epoch. Epoch 0 is the unnumbered layout written
+    before epochs existed.
+    """
+
+    CENTROIDS_FILE = "ivf_centroids{}.npy"
+    ASSIGNMENT_FILE = "ivf_assignment{}.npy"
+    JOURNAL_FILE = "ivf_assignment{}.journal"
+    META_FILE = "ivf_meta.json"
+
+    def __init__(self, path: str, nlist: int = 0, nprobe: int = 8,
+                 min_train_size: int = 10000, kmeans_iterations: int = 10, seed: int = 0,
+                 retrain_ratio: float = 2.0):
+        self.path = path
+        self.requested_nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.kmeans_iterations = kmeans_iterations
+        self.retrain_ratio = retrain_ratio
+        self._rng = np.random.default_rng(seed)
+
+        self.centroids: Optional[np.ndarray] = None
+        self.assignment = np.full(0, -1, dtype=np.int32)
+        self.trained_size = 0  # Live rows the centroids were fitted on
+        self.epoch = 0
+        self._lists: List[array] = []
+        self._tombstones = 0
+        self._journal_rows = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def nlist(self) -> int:
+        return 0 if self.centroids is None else self.centroids.shape[0]
+
+    def _ensure_rows(self, size: int):
+        if len(self.assignment) < size:
+            grown = np.full(max(size, 2 * len(self.assignment)), -1, dtype=np.int32)
+            grown[:len(self.assignment)] = self.assignment
+            self.assignment = grown
+
+    def _file(self, name: str, epoch: Optional[int] = None) -> str:
+        epoch = self.epoch if epoch is None else epoch
+        return os.path.join(self.path, name.format(f".{epoch}" if epoch else ""))
+
+    def load(self, vectors: np.ndarray, alive: np.ndarray, size: int):
+        """Restore centroids and assignments from disk, assigning any rows added since the last save."""
+        meta_path = os.path.join(self.path, self.META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.trained_size = meta.get('trained_size', 0)
+            self.epoch = meta.get('epoch', 0)
+        centroids_path = self._file(self.CENTROIDS_FILE)
+        if not os.path.exists(centroids_path):
+            return
+        self.centroids = np.load(centroids_path)
+        assignment_path = self._file(self.ASSIGNMENT_FILE)
+        saved = np.load(assignment_path) if os.path.exists(assignment_path) else np.empty(0, dtype=np.int32)
+
+        self.assignment = np.full(max(size, 1), -1, dtype=np.int32)
+        keep = min(len(saved), size)
+        self.assignment[:keep] = saved[:keep]
+        self._replay_journal(size)
+        self.assignment[:size][~alive[:size]] = -1
+        self._rebuild_lists(size)
+
+        missing = np.flatnonzero(alive[:size] & (self.assignment[:size] < 0))
+        if len(missing):
+            self.add(missing, np.asarray(vectors[missing]))
+
+    def _replay_journal(self, size: int):
+        """Apply assignment changes journaled since the last full save; the latest entry per row wins."""
+        journal_path = self._file(self.JOURNAL_FILE)
+        if not os.path.exists(journal_path):
+            return
+        entries = np.fromfile(journal_path, dtype=np.int32)
+        entries = entries[:len(entries) // 2 * 2].reshape(-1, 2)  # Drop a pair torn by a crash
+        self._journal_rows = len(entries)
+        entries = entries[entries[:, 0] < size]
+        _, last = np.unique(entries[::-1, 0], return_index=True)
+        latest = entries[len(entries) - 1 - last]
+        latest[latest[:, 1] >= self.nlist, 1] = -1  # Out of range only if the journal is corrupt
+        self.assignment[latest[:, 0]] = latest[:, 1]
+
+    def _journal(self, rows: np.ndarray, labels: np.ndarray):
+        """Append assignment changes, or save everything once the journal outgrows the array."""
+        if self._journal_rows + len(rows) > max(len(self.assignment), 4096):
+            self.save()
+            return
+        entries = np.column_stack([rows, labels]).astype(np.int32)
+        with open(self._file(self.JOURNAL_FILE), "ab") as f:
+            f.write(entries.tobytes())
+        self._journal_rows += len(rows)
+
+    def save(self):
+        """Persist centroids and the full row assignment as a new epoch, then drop the previous epoch's files."""
+        if self.centroids is None:
+            return
+        epoch = self.epoch + 1
+        _replace_file(self._file(self.CENTROIDS_FILE, epoch), lambda f: np.save(f, self.centroids))
+        _replace_file(self._file(self.ASSIGNMENT_FILE, epoch), lambda f: np.save(f, self.assignment))
+        meta = json.dumps({'trained_size': self.trained_size, 'epoch': epoch}).encode("utf-8")
+        # Replacing the meta file commits the new epoch
+        _replace_file(os.path.join(self.path, self.META_FILE), lambda f: f.write(meta))
+        self.epoch, self._journal_rows = epoch, 0
+        # Older epochs, and files a crashed save left behind, are no longer referenced
+        current = {os.path.basename(self._file(name)) for name in (self.CENTROIDS_FILE, self.ASSIGNMENT_FILE)}
+        for name in os.listdir(self.path):
+            if name.startswith("ivf_") and name != self.META_FILE and name not in current:
+                os.remove(os.path.join(self.path, name))
+
+    def needs_retrain(self, live_rows: int) -> bool:
+        """True once the corpus has grown `retrain_ratio` times past the size the centroids were fitted on."""
+        return (self.is_trained and self.retrain_ratio > 0
+                and live_rows >= self.retrain_ratio * max(self.trained_size, 1))
+
+    def _rebuild_lists(self, size: int):
+        """Regroup row ids into posting lists from the assignment array."""
+        assigned = self.assignment[:size]
+        rows = np.flatnonzero(assigned >= 0)
+        order = rows[np.argsort(assigned[rows], kind="stable")]
+        bounds = np.searchsorted(assigned[order], np.arange(self.nlist + 1))
+        self._lists = [array("q", order[bounds[i]:bounds[i + 1]].tolist()) for i in range(self.nlist)]
+        self._tombstones = 0
+
+    def _nearest_centroids(self, matrix: np.ndarray) -> np.ndarray:
+        """Index of the closest centroid for each (normalised) row, in chunks to bound memory."""
+        labels = np.empty(len(matrix), dtype=np.int32)
+        chunk = 8192
+        for start in range(0, len(matrix), chunk):
+            labels[start:start + chunk] = np.argmax(matrix[start:start + chunk] @ self.centroids.T, axis=1)
+        return labels
+
+    def train(self, vectors: np.ndarray, alive: np.ndarray, size: int):
+        """Fit centroids with spherical k-means on a sample of live rows and reassign everything."""
+        live_rows = np.flatnonzero(alive[:size])
+        if len(live_rows) == 0:
+            return
+        nlist = self.requested_nlist or int(4 * np.sqrt(len(live_rows)))
+        nlist = max(1, min(nlist, len(live_rows)))
+
+        sample_size = min(len(live_rows), 64 * nlist)
+        sample_rows = np.sort(self._rng.choice(live_rows, size=sample_size, replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+
+        centroids = sample[self._rng.choice(sample_size, size=nlist, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Re-seed empty clusters from random sample points so no list is wasted
+            sums[empty] = sample[self._rng.choice(sample_size, size=int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = sums / norms
+        self.centroids = centroids.astype(np.float32)
+        self.trained_size = len(live_rows)
+
+        self.assignment = np.full(max(size, 1), -1, dtype=np.int32)
+        self._lists = [array("q") for _ in range(nlist)]
+        self._tombstones = 0
+        self._assign(live_rows, np.asarray(vectors[live_rows]))
+        self.save()
+
+    def add(self, rows: np.ndarray, matrix: np.ndarray):
+        """Assign (re-)inserted rows to their nearest list and journal it. Old entries become tombstones."""
+        if self.centroids is None or len(rows) == 0:
+            return
+        rows = np.asarray(rows, dtype=np.int64)
+        self._journal(rows, self._assign(rows, matrix))
+
+    def _assign(self, rows: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+        self._ensure_rows(int(rows.max()) + 1)
+        labels = self._nearest_centroids(matrix)
+        self._tombstones += int(np.count_nonzero(self.assignment[rows] >= 0))
+        self.assignment[rows] = labels
+        for row, label in zip(rows.tolist(), labels.tolist()):
+            self._lists[label].append(row)
+        return labels
+
+    def remove(self, rows: List[int]):
+        """Tombstone deleted rows; they stay in their list until `compact()`."""
+        if self.centroids is None or not len(rows):
+            return
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[rows < len(self.assignment)]
+        self._tombstones += int(np.count_nonzero(self.assignment[rows] >= 0))
+        self.assignment[rows] = -1
+        self._journal(rows, np.full(len(rows), -1, dtype=np.int32))
+
+    def needs_compaction(self) -> bool:
+        total = sum(len(posting) for posting in self._lists)
+        return total > 0 and self._tombstones > 0.2 * total
+
+    def compact(self):
+        """Drop tombstoned entries from the posting lists."""
+        if self.centroids is not None:
+            self._rebuild_lists(len(self.assignment))
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Live row ids from the `nprobe` lists closest to the (normalised) query."""
+        nprobe = max(1, min(nprobe or self.nprobe, self.nlist))
+        centroid_scores = self.centroids @ query
+        if nprobe < self.nlist:
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(self.nlist)
+
+        parts = []
+        for label in probe.tolist():
+            posting = np.array(self._lists[label], dtype=np.int64)
+            # Entries whose assignment moved on (re-upserted or deleted) are tombstones
+            parts.append(posting[self.assignment[posting] == label])
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        # A row re-upserted into its old list appears twice; unique() also sorts the
+        # rows, which turns the gather from the memory-mapped matrix into a forward scan
+        return np.unique(np.concatenate(parts))
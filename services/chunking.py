@@ -0,0 +1,99 @@
+import re
+from dataclasses import dataclass
+from typing import List, Dict, Any
+
+from config import Config
+from services.vector_backend import Match
+
+# Words and single punctuation marks, roughly how BERT's basic tokenizer splits
+# text before word pieces. Word pieces are never fewer than these tokens and
+# usually more: numbers, names and defined terms split into several pieces,
+# about 1.3 per token on contract text. CHUNK_SIZE is therefore kept at half
+# of the model's 256 word-piece limit, so window tails are not truncated.
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Extraction joins pages with a form feed so chunks can report their page number
+PAGE_SEPARATOR = "\f"
+
+
+@dataclass
+class Chunk:
+    text: str
+    index: int
+    page: int    # 1-based page of the first token
+    start: int   # character offsets into the full document text
+    end: int
+
+
+def chunk_text(text: str, chunk_size: int = None, overlap: int = None) -> List[Chunk]:
+    """
+    Split text into overlapping token windows.
+    Each chunk keeps the page it starts on and its character span in `text`.
+    """
+    chunk_size = chunk_size or Config.CHUNK_SIZE
+    overlap = Config.CHUNK_OVERLAP if overlap is None else overlap
+    if overlap >= chunk_size:
+        raise ValueError("Chunk overlap must be smaller than the chunk size")
+
+    tokens = [(m.start(), m.end()) for m in TOKEN_PATTERN.finditer(text)]
+    if not tokens:
+        return []
+
+    page_starts = [0] + [m.end() for m in re.finditer(PAGE_SEPARATOR, text)]
+    chunks = []
+    step = chunk_size - overlap
+    page = 0
+    for index, first in enumerate(range(0, len(tokens), step)):
+        window = tokens[first:first + chunk_size]
+        start, end = window[0][0], window[-1][1]
+        while page + 1 < len(page_starts) and page_starts[page + 1] <= start:
+            page += 1
+        chunks.append(Chunk(
+            text=text[start:end].replace(PAGE_SEPARATOR, "\n"),
+            index=index,
+            page=page + 1,
+            start=start,
+            end=end
+        ))
+        if first + chunk_size >= len(tokens):
+            break
+    return chunks
+
+
+def aggregate_by_document(matches, top_k: int, mode: str = None) -> List[Match]:
+    """
+    Group chunk hits back into documents.
+    `mode` is "max" (best chunk wins) or "sum" (documents with many matching
+    chunks rank higher). Each result carries the best chunk's metadata plus
+    `matched_chunks`. Vectors without a `document_id` are their own document.
+    """
+    mode = mode or Config.CHUNK_AGGREGATION
+    if mode not in ("max", "sum"):
+        raise ValueError(f"Unknown aggregation mode: {mode!r} (expected 'max' or 'sum')")
+
+    documents: Dict[str, Dict[str, Any]] = {}
+    for match in matches:
+        metadata = match.metadata or {}
+        doc_id = metadata.get('document_id', match.id)
+        entry = documents.get(doc_id)
+        if entry is None:
+            documents[doc_id] = {'best': match, 'score': match.score, 'count': 1}
+            continue
+        entry['count'] += 1
+        if mode == "sum":
+            entry['score'] += match.score
+        else:
+            entry['score'] = max(entry['score'], match.score)
+        if match.score > entry['best'].score:
+            entry['best'] = match
+
+    ranked = sorted(documents.items(), key=lambda item: item[1]['score'], reverse=True)[:top_k]
+    return [
+        Match(
+            id=doc_id,
+            score=entry['score'],
+            metadata={**(entry['best'].metadata or {}), 'matched_chunks': entry['count']},
+            values=getattr(entry['best'], 'values', None)
+        )
+        for doc_id, entry in ranked
+    ]
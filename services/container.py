@@ -0,0 +1,197 @@
+import threading
+import time
+from typing import Any, Callable
+
+from config import Config
+
+
+class ServiceContainer:
+    """
+    Process-wide owner of the expensive service objects.
+
+    Every object is built once, on first use, and shared by all Streamlit
+    sessions and reruns. `warm_up()` loads the local embedding model and
+    connects the vector store in a background thread; `readiness()` reports
+    how far that got.
+    """
+
+    SERVICES = ('embedding_service', 'embedding_scheduler', 'vector_store', 'manifest', 'query_cache',
+                'generation_stats', 'generative_model', 'docusign_client', 'extraction_pool')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._embedding_service = None
+        self._embedding_scheduler = None
+        self._vector_store = None
+        self._manifest = None
+        self._query_cache = None
+        self._generation_stats = None
+        self._generative_model = None
+        self._docusign_client = None
+        self._extraction_pool = None
+        self._build_locks = {name: threading.Lock() for name in self.SERVICES}
+        self._warm_thread = None
+        self.status = {'embedding_model': 'cold', 'vector_store': 'cold'}
+        self.errors = {}
+        self.warm_seconds = None
+
+    def override(self, **services):
+        """
+        Supply ready-made services instead of building them, e.g.
+        `override(vector_store=VectorStore(backend=...))` in benchmarks.
+        """
+        for name, service in services.items():
+            if name not in self.SERVICES:
+                raise AttributeError(f"Unknown service: {name}")
+            with self._build_locks[name]:
+                setattr(self, f"_{name}", service)
+
+    def _service(self, name: str, build: Callable[[], Any]):
+        """
+        The service stored as `_<name>`, built on first use. Each service has
+        its own lock, held only while that service is built, so a slow build
+        (the embedding model, the vector store connection) never blocks
+        sessions that need a different service or one that is already built.
+        """
+        service = getattr(self, f"_{name}")
+        if service is None:
+            with self._build_locks[name]:
+                service = getattr(self, f"_{name}")
+                if service is None:
+                    service = build()
+                    setattr(self, f"_{name}", service)
+        return service
+
+    @property
+    def embedding_service(self):
+        def build():
+            from services.embedding_service import EmbeddingService
+            return EmbeddingService()
+        return self._service('embedding_service', build)
+
+    @property
+    def embedding_scheduler(self):
+        def build():
+            from services.embedding_scheduler import EmbeddingScheduler
+            return EmbeddingScheduler(self.embedding_service)
+        return self._service('embedding_scheduler', build)
+
+    @property
+    def vector_store(self):
+        def build():
+            from services.vector_store import VectorStore
+            return VectorStore()
+        return self._service('vector_store', build)
+
+    @property
+    def manifest(self):
+        def build():
+            from services.ingest_manifest import IngestManifest
+            return IngestManifest(Config.INGEST_MANIFEST_PATH)
+        return self._service('manifest', build)
+
+    @property
+    def query_cache(self):
+        def build():
+            from services.query_cache import QueryCache
+            vector_store = self.vector_store
+            return QueryCache(
+                max_entries=Config.QUERY_CACHE_MAX_ENTRIES,
+                ttl_seconds=Config.QUERY_CACHE_TTL_SECONDS,
+                similarity_threshold=Config.QUERY_CACHE_SIMILARITY,
+                generation=lambda: vector_store.generation
+            )
+        return self._service('query_cache', build)
+
+    @property
+    def generation_stats(self):
+        """Rolling Gemini latencies: time to first streamed token and to the complete answer."""
+        def build():
+            from services.embedding_router import BackendStats
+            return {'first_token': BackendStats(), 'total': BackendStats()}
+        return self._service('generation_stats', build)
+
+    @property
+    def generative_model(self):
+        def build():
+            import google.generativeai as genai
+            genai.configure(api_key=Config.GEMINI_API_KEY)
+            return genai.GenerativeModel('gemini-1.5-flash')
+        return self._service('generative_model', build)
+
+    @property
+    def docusign_client(self):
+        def build():
+            from services.docusign_service import DocuSignClient
+            return DocuSignClient(self)
+        return self._service('docusign_client', build)
+
+    @property
+    def extraction_pool(self):
+        """Processes that extract page ranges of large PDFs, started once and shared by all sessions."""
+        def build():
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # Spawned rather than forked: forking the multithreaded Streamlit process can deadlock the child
+            return ProcessPoolExecutor(
+                max_workers=Config.PDF_EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._service('extraction_pool', build)
+
+    def discard_extraction_pool(self):
+        """Drop a broken extraction pool; the next large PDF starts a fresh one."""
+        with self._build_locks['extraction_pool']:
+            pool, self._extraction_pool = self._extraction_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def warm_up(self):
+        """Start loading the embedding model and vector store in the background (idempotent)."""
+        with self._lock:
+            if self._warm_thread is not None:
+                return
+            self._warm_thread = threading.Thread(target=self._warm, name="service-warm-up", daemon=True)
+            self._warm_thread.start()
+
+    def _warm(self):
+        started = time.perf_counter()
+        self.status['vector_store'] = 'warming'
+        try:
+            self.vector_store
+            self.status['vector_store'] = 'ready'
+        except Exception as e:
+            self.status['vector_store'] = 'failed'
+            self.errors['vector_store'] = str(e)
+
+        self.status['embedding_model'] = 'warming'
+        try:
+            if Config.WARM_LOCAL_MODEL:
+                # One encode also initialises the tokenizer and kernels, not just the weights
+                self.embedding_service._encode_local(["warm up"])
+            else:
+                self.embedding_service
+            self.status['embedding_model'] = 'ready'
+        except Exception as e:
+            self.status['embedding_model'] = 'failed'
+            self.errors['embedding_model'] = str(e)
+        self.warm_seconds = time.perf_counter() - started
+
+    def is_ready(self) -> bool:
+        return all(state == 'ready' for state in self.status.values())
+
+    def readiness(self) -> dict:
+        return {**self.status, 'ready': self.is_ready(), 'errors': dict(self.errors),
+                'warm_seconds': self.warm_seconds}
+
+
+_container = None
+_container_lock = threading.Lock()
+
+
+def get_container() -> ServiceContainer:
+    """The process-wide service container."""
+    global _container
+    with _container_lock:
+        if _container is None:
+            _container = ServiceContainer()
+        return _container
@@ -0,0 +1,141 @@
+import math
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+
+from services.chunking import TOKEN_PATTERN
+from services.vector_backend import Match
+
+# Gemini averages about four characters per token on English prose
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough Gemini token count, without a round trip to `count_tokens`."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+@dataclass
+class Passage:
+    id: str
+    title: str
+    text: str
+    score: float
+    tokens: int
+    vector: Optional[np.ndarray] = None
+
+
+@dataclass
+class PackedContext:
+    """Passages chosen for a prompt and the token accounting behind the choice."""
+    text: str = ""
+    passages: List[Passage] = field(default_factory=list)
+    tokens: int = 0
+    candidates: int = 0
+    duplicates_dropped: int = 0
+    over_budget: int = 0
+
+
+class ContextBuilder:
+    """
+    Packs retrieved chunks into a token-budgeted prompt context.
+
+    Passages are picked greedily by maximal marginal relevance: each step
+    takes the passage with the best `mmr_lambda * relevance - (1 - mmr_lambda)
+    * similarity to the passages already picked`, using the stored chunk
+    vectors (token overlap for chunks that came back without one). Passages
+    at least `duplicate_threshold` similar to a picked one are dropped, and
+    ones that no longer fit the budget are skipped in favour of shorter ones.
+    The picked passages are then ordered by retrieval score.
+    """
+
+    def __init__(self, token_budget: int = 2000, mmr_lambda: float = 0.7, duplicate_threshold: float = 0.95):
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+
+    @staticmethod
+    def format_passage(title: str, text: str) -> str:
+        return f"Document: {title}\nContent: {text}"
+
+    def _passages(self, matches: List[Match]) -> List[Passage]:
+        passages, seen = [], set()
+        for match in matches:
+            metadata = match.metadata or {}
+            text = (metadata.get('text') or metadata.get('preview') or "").strip()
+            if not text or match.id in seen:
+                continue
+            seen.add(match.id)
+            title = metadata.get('title', 'Untitled')
+            values = getattr(match, 'values', None)
+            vector = None
+            if values is not None and len(values):
+                vector = np.asarray(values, dtype=np.float32)
+                norm = np.linalg.norm(vector)
+                vector = vector / norm if norm else None
+            passages.append(Passage(
+                id=match.id,
+                title=title,
+                text=text,
+                score=float(match.score),
+                tokens=estimate_tokens(self.format_passage(title, text)),
+                vector=vector
+            ))
+        return passages
+
+    @staticmethod
+    def _similarity(a: Passage, b: Passage, terms: dict) -> float:
+        if a.vector is not None and b.vector is not None and a.vector.shape == b.vector.shape:
+            return float(a.vector @ b.vector)
+        # Jaccard overlap of word sets for passages without a stored vector (e.g. keyword-only hits)
+        left, right = terms[a.id], terms[b.id]
+        return len(left & right) / len(left | right) if left and right else 0.0
+
+    def _truncate(self, passage: Passage, budget: int) -> Passage:
+        header = estimate_tokens(self.format_passage(passage.title, ""))
+        text = passage.text[:max(0, (budget - header) * CHARS_PER_TOKEN)].rsplit(" ", 1)[0]
+        return Passage(passage.id, passage.title, text, passage.score,
+                       estimate_tokens(self.format_passage(passage.title, text)), passage.vector)
+
+    def build(self, matches: List[Match]) -> PackedContext:
+        """Select and order passages from `matches` (best first) within the token budget."""
+        candidates = self._passages(matches)
+        packed = PackedContext(candidates=len(candidates))
+        if not candidates:
+            return packed
+
+        scores = np.array([passage.score for passage in candidates])
+        spread = scores.max() - scores.min()
+        # Scores may be cosine similarities or fused ranks; only their order and spacing matter here
+        relevance = (scores - scores.min()) / spread if spread > 0 else np.ones(len(candidates))
+        terms = {passage.id: set(TOKEN_PATTERN.findall(passage.text.lower())) for passage in candidates}
+
+        remaining = list(range(len(candidates)))
+        redundancy = np.zeros(len(candidates))  # Highest similarity to any picked passage
+        selected: List[Passage] = []
+        budget = self.token_budget
+        while remaining and budget > 0:
+            best = max(remaining, key=lambda i: self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * redundancy[i])
+            remaining.remove(best)
+            passage = candidates[best]
+            if redundancy[best] >= self.duplicate_threshold:
+                packed.duplicates_dropped += 1
+                continue
+            if passage.tokens > budget:
+                if selected:
+                    packed.over_budget += 1
+                    continue
+                # Never return an empty context just because the best passage is long
+                passage = self._truncate(passage, budget)
+            selected.append(passage)
+            budget -= passage.tokens
+            for i in remaining:
+                redundancy[i] = max(redundancy[i], self._similarity(candidates[i], passage, terms))
+        packed.over_budget += len(remaining)
+
+        selected.sort(key=lambda passage: passage.score, reverse=True)
+        packed.passages = selected
+        packed.text = "\n\n".join(self.format_passage(passage.title, passage.text) for passage in selected)
+        packed.tokens = estimate_tokens(packed.text)
+        return packed
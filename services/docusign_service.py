@@ -1,8 +1,7 @@
-from docusign_esign import ApiClient, EnvelopesApi, AuthenticationApi, OAuth
 from config import Config
 import json
 import time
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Union
 import os
 import base64
 import hashlib
@@ -12,73 +11,83 @@ from urllib.parse import urlencode
 import httpx
 import streamlit as st
 import asyncio
+import weakref
 from contextlib import asynccontextmanager
-from services.embedding_service import EmbeddingService
-from services.vector_store import VectorStore
-import fitz  # PyMuPDF
-from io import BytesIO
-import PyPDF2
+from services.extraction import extract_pdf_text
+from services.ingest import index_version, reindex_document
+from services.ingest_manifest import stable_document_id, content_hash
+from services.metadata_index import to_timestamp
+from services.container import ServiceContainer, get_container
+from services.spool import SpooledDocument, DocumentTooLarge
 
 class DocuSignEmbedder:
-    def __init__(self):
-        self.embedding_service = EmbeddingService()
-        self.vector_store = VectorStore()
-
-    def extract_text_from_bytes(self, content: bytes) -> str:
-        """Extract text from document bytes"""
+    def __init__(self, services: ServiceContainer = None):
+        services = services or get_container()
+        self.embedding_scheduler = services.embedding_scheduler
+        self.embedding_service = services.embedding_service
+        self.vector_store = services.vector_store
+        self.manifest = services.manifest
+
+    def extract_text_from_bytes(self, content: Union[bytes, str]) -> str:
+        """Extract text from document bytes (or a path to the document)"""
         try:
-            # Try PyMuPDF first
-            pdf_document = fitz.open(stream=content, filetype="pdf")
-            text = ""
-            for page in pdf_document:
-                text += page.get_text()
-            return text
+            return extract_pdf_text(content)
         except Exception as e:
-            try:
-                # Fallback to PyPDF2
-                pdf_reader = PyPDF2.PdfReader(BytesIO(content))
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text()
-                return text
-            except Exception as e:
-                print(f"Error extracting text from document: {str(e)}")
-                return None
+            print(f"Error extracting text from document: {str(e)}")
+            return None
 
-    async def embed_document(self, doc_content: bytes, doc_metadata: dict) -> bool:
+    async def embed_document(self, doc_content: Union[bytes, SpooledDocument], doc_metadata: dict,
+                             on_failed: Callable[[Exception], None] = None) -> bool:
         """
         Embed a single DocuSign document into the vector store
+        `doc_content` is the raw bytes or a spooled download
         Returns True if successful, False otherwise
+        The upsert may be buffered; `on_failed(error)` runs if storing it fails later
         """
         try:
+            document_id = stable_document_id(
+                "docusign", f"{doc_metadata.get('envelopeId')}/{doc_metadata['documentId']}"
+            )
+            if isinstance(doc_content, SpooledDocument):
+                # Large spooled documents are extracted straight from their temp file
+                source, digest = doc_content.source, doc_content.sha256
+            else:
+                source, digest = doc_content, content_hash(doc_content)
+            if self.manifest.is_current(document_id, digest, index_version(self.embedding_service)):
+                # Already indexed with this exact content
+                return True
+
             # Extract text from document
-            text_content = self.extract_text_from_bytes(doc_content)
+            text_content = self.extract_text_from_bytes(source)
             if not text_content:
                 print("Could not extract text from document")
                 return False
 
-            # Generate embedding
-            embedding = self.embedding_service.get_single_embedding(text_content)
-            if not embedding:
+            # Embed chunks and store them in the vector database
+            # Runs in a worker thread so the event loop stays free while the scheduler batches
+            chunk_ids = await asyncio.to_thread(
+                reindex_document,
+                self.embedding_scheduler,
+                self.vector_store,
+                self.manifest,
+                document_id,
+                digest,
+                text_content,
+                {
+                    'title': doc_metadata['name'],
+                    'source': 'DocuSign',
+                    'docusign_document_id': doc_metadata['documentId'],
+                    'envelope_id': doc_metadata.get('envelopeId'),
+                    'status': doc_metadata.get('status'),
+                    'sent_date': doc_metadata.get('sentDateTime'),
+                    # Numeric copy of the date for range filters
+                    'sent_ts': to_timestamp(doc_metadata.get('sentDateTime'))
+                },
+                on_failed
+            )
+            if not chunk_ids:
                 print("Failed to generate embedding")
                 return False
-
-            # Store in vector database
-            self.vector_store.upsert(
-                vectors=[(
-                    f"docusign_{doc_metadata['documentId']}",  # unique ID
-                    embedding,
-                    {
-                        'title': doc_metadata['name'],
-                        'preview': text_content[:200] + "...",
-                        'source': 'DocuSign',
-                        'document_id': doc_metadata['documentId'],
-                        'envelope_id': doc_metadata.get('envelopeId'),
-                        'status': doc_metadata.get('status'),
-                        'sent_date': doc_metadata.get('sentDateTime')
-                    }
-                )]
-            )
             return True
 
         except Exception as e:
@@ -87,6 +96,8 @@ class DocuSignEmbedder:
 
 class DocuSignService:
     def __init__(self):
+        # The DocuSign SDK is only needed by this legacy service, so it is imported on first use
+        from docusign_esign import ApiClient
         self.api_client = ApiClient()
         self.account_id = Config.DOCUSIGN_ACCOUNT_ID
         self.access_token = None
@@ -184,6 +195,7 @@ class DocuSignService:
             print(f"Access token obtained: {self.access_token[:20]}...")
             
             # Configure API client with the access token
+            from docusign_esign import ApiClient, AuthenticationApi
             self.api_client = ApiClient()
             self.api_client.host = self.base_path
             self.api_client.set_default_header("Authorization", f"Bearer {self.access_token}")
@@ -222,6 +234,7 @@ class DocuSignService:
                 return []
 
             print(f"Getting envelopes with account ID: {self.account_id}")
+            from docusign_esign import EnvelopesApi
             envelopes_api = EnvelopesApi(self.api_client)
             
             # Set up the options for listing envelopes
@@ -274,6 +287,7 @@ class DocuSignService:
                 return None
 
             print(f"Downloading document {document_id} from envelope {envelope_id}")
+            from docusign_esign import EnvelopesApi
             envelopes_api = EnvelopesApi(self.api_client)
             document = envelopes_api.get_document(
                 account_id=self.account_id,
@@ -300,6 +314,7 @@ class DocuSignService:
                 return False
 
             print(f"Downloading document {document_id} from envelope {envelope_id}")
+            from docusign_esign import EnvelopesApi
             envelopes_api = EnvelopesApi(self.api_client)
             document_content = envelopes_api.get_document(
                 account_id=self.account_id,
@@ -317,33 +332,106 @@ class DocuSignService:
             print(f"Traceback: {traceback.format_exc()}")
             return False
 
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (pip install httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
 class DocuSignClient:
-    def __init__(self):
+    # DocuSign reports hourly and burst limits in these response headers
+    RATE_LIMIT_HEADERS = (
+        ("X-RateLimit-Remaining", "X-RateLimit-Reset"),
+        ("X-BurstLimit-Remaining", "X-BurstLimit-Reset"),
+    )
+    RETRY_STATUSES = (429, 502, 503, 504)
+
+    def __init__(self, services: ServiceContainer = None):
         self.base_url = "https://demo.docusign.net/restapi/v2.1/accounts"
         self.auth_url = "https://account-d.docusign.com/oauth/auth"
         self.token_url = "https://account-d.docusign.com/oauth/token"
         self.userinfo_url = "https://account-d.docusign.com/oauth/userinfo"
-        self.client = None
-        self.embedder = DocuSignEmbedder()
-        
+        # httpx clients and asyncio semaphores are bound to the event loop that
+        # first uses them, and Streamlit runs each action in a fresh asyncio.run()
+        self._pools = weakref.WeakKeyDictionary()
+        self._throttle_until = 0.0
+        self.embedder = DocuSignEmbedder(services)
+
+    def _pool(self) -> tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        pool = self._pools.get(loop)
+        if pool is None or pool[0].is_closed:
+            client = httpx.AsyncClient(
+                timeout=60.0,
+                http2=_http2_available(),
+                limits=httpx.Limits(
+                    max_connections=Config.DOCUSIGN_MAX_CONCURRENCY,
+                    max_keepalive_connections=Config.DOCUSIGN_MAX_CONCURRENCY
+                )
+            )
+            pool = (client, asyncio.Semaphore(Config.DOCUSIGN_MAX_CONCURRENCY))
+            self._pools[loop] = pool
+        return pool
+
     @asynccontextmanager
     async def get_client(self):
-        """Get or create an HTTP client with proper event loop management"""
-        if self.client is None:
-            self.client = httpx.AsyncClient(timeout=60.0)
-        try:
-            yield self.client
-        finally:
-            if self.client:
-                await self.client.aclose()
-                self.client = None
+        """Long-lived pooled HTTP client for the running event loop"""
+        yield self._pool()[0]
+
+    async def aclose(self):
+        """Close the pooled client of the running event loop"""
+        pool = self._pools.pop(asyncio.get_running_loop(), None)
+        if pool is not None:
+            await pool[0].aclose()
+
+    def _backoff_delay(self, response: Optional[httpx.Response], attempt: int) -> float:
+        """Seconds to wait before retrying, preferring the server's own hints"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+            for _, reset_header in self.RATE_LIMIT_HEADERS:
+                reset = response.headers.get(reset_header)
+                if reset and reset.isdigit():
+                    return max(0.0, min(float(reset) - time.time(), Config.DOCUSIGN_MAX_BACKOFF))
+        return min(2 ** attempt * 0.5, Config.DOCUSIGN_MAX_BACKOFF)
+
+    def _note_rate_limits(self, response: httpx.Response):
+        """Hold off new requests until the window resets when the remaining quota runs low"""
+        for remaining_header, reset_header in self.RATE_LIMIT_HEADERS:
+            remaining = response.headers.get(remaining_header)
+            reset = response.headers.get(reset_header)
+            if remaining and reset and remaining.isdigit() and reset.isdigit():
+                if int(remaining) <= Config.DOCUSIGN_RATE_LIMIT_RESERVE:
+                    self._throttle_until = max(self._throttle_until, float(reset))
 
     async def _make_request(self, method: str, url: str, **kwargs) -> httpx.Response:
-        """Make HTTP request with proper client management"""
-        async with self.get_client() as client:
-            response = await client.request(method, url, **kwargs)
-            response.raise_for_status()
-            return response
+        """Make HTTP request through the pooled client, backing off on rate limits"""
+        client, semaphore = self._pool()
+        attempt = 0
+        while True:
+            wait = self._throttle_until - time.time()
+            if wait > 0:
+                await asyncio.sleep(min(wait, Config.DOCUSIGN_MAX_BACKOFF))
+
+            response = None
+            try:
+                async with semaphore:
+                    response = await client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                if attempt >= Config.DOCUSIGN_MAX_RETRIES:
+                    raise
+            if response is not None:
+                self._note_rate_limits(response)
+                if response.status_code not in self.RETRY_STATUSES or attempt >= Config.DOCUSIGN_MAX_RETRIES:
+                    response.raise_for_status()
+                    return response
+
+            await asyncio.sleep(self._backoff_delay(response, attempt))
+            attempt += 1
 
     def get_authorization_url(self) -> str:
         """Generate DocuSign OAuth authorization URL"""
@@ -393,56 +481,109 @@ class DocuSignClient:
             st.error(f"Error fetching account ID: {str(e)}")
             return None
 
-    async def fetch_envelopes(self, account_id: str) -> List[Dict]:
-        """Fetch envelopes from DocuSign"""
-        try:
-            headers = {'Authorization': f'Bearer {st.session_state.docusign_token}'}
-            response = await self._make_request(
-                'GET',
-                f"{self.base_url}/{account_id}/envelopes",
-                headers=headers,
-                params={'from_date': '2024-01-01'}
+    async def fetch_envelopes(self, account_id: str, from_date: str = None, **filters) -> List[Dict]:
+        """
+        Fetch all envelopes from DocuSign, following start_position/count pagination.
+        After the first page the remaining pages are fetched concurrently.
+        Raises if any page fails, so a partial listing is never taken as complete.
+        """
+        headers = {'Authorization': f'Bearer {st.session_state.docusign_token}'}
+        url = f"{self.base_url}/{account_id}/envelopes"
+        page_size = Config.DOCUSIGN_PAGE_SIZE
+        params = {'from_date': from_date or Config.DOCUSIGN_SYNC_START, 'count': page_size, **filters}
+
+        response = await self._make_request('GET', url, headers=headers, params={**params, 'start_position': 0})
+        first_page = response.json()
+        envelopes = first_page.get('envelopes') or []
+        total = int(first_page.get('totalSetSize') or len(envelopes))
+        if not envelopes or len(envelopes) >= total:
+            return envelopes
+
+        async def fetch_page(start_position: int) -> List[Dict]:
+            page = await self._make_request(
+                'GET', url, headers=headers, params={**params, 'start_position': start_position}
             )
-            return response.json().get('envelopes', [])
-        except Exception as e:
-            st.error(f"Error fetching envelopes: {str(e)}")
-            return []
+            return page.json().get('envelopes') or []
+
+        pages = await asyncio.gather(*(
+            fetch_page(start) for start in range(len(envelopes), total, page_size)
+        ))
+        for page in pages:
+            envelopes.extend(page)
+        return envelopes
 
     async def fetch_documents(self, account_id: str, envelope_id: str) -> List[Dict]:
-        """Fetch documents for an envelope"""
-        try:
-            headers = {'Authorization': f'Bearer {st.session_state.docusign_token}'}
-            response = await self._make_request(
-                'GET',
-                f"{self.base_url}/{account_id}/envelopes/{envelope_id}/documents",
-                headers=headers
-            )
-            return response.json().get('envelopeDocuments', [])
-        except Exception as e:
-            st.error(f"Error fetching documents: {str(e)}")
-            return []
+        """Fetch documents for an envelope; raises if the request fails"""
+        headers = {'Authorization': f'Bearer {st.session_state.docusign_token}'}
+        response = await self._make_request(
+            'GET',
+            f"{self.base_url}/{account_id}/envelopes/{envelope_id}/documents",
+            headers=headers
+        )
+        return response.json().get('envelopeDocuments', [])
+
+    async def fetch_all_documents(self, account_id: str, envelopes: List[Dict]) -> Dict[str, Optional[List[Dict]]]:
+        """
+        Fetch the document lists of many envelopes concurrently, keyed by envelope id.
+        An envelope whose list could not be fetched maps to None rather than to
+        an empty list, so callers can tell it apart from an envelope without documents.
+        """
+        results = await asyncio.gather(*(
+            self.fetch_documents(account_id, envelope['envelopeId']) for envelope in envelopes
+        ), return_exceptions=True)
+        documents = {}
+        for envelope, result in zip(envelopes, results):
+            if isinstance(result, Exception):
+                st.error(f"Error fetching documents of envelope {envelope['envelopeId']}: {str(result)}")
+                result = None
+            documents[envelope['envelopeId']] = result
+        return documents
 
-    async def fetch_document(self, account_id: str, document_uri: str) -> Optional[bytes]:
-        """Fetch document content"""
+    async def fetch_document_spooled(self, account_id: str, document_uri: str) -> Optional[SpooledDocument]:
+        """
+        Stream document content into a size-capped spool: small documents stay in
+        memory, larger ones go to a temporary file. The caller closes the spool.
+        """
+        headers = {'Authorization': f'Bearer {st.session_state.docusign_token}'}
+        url = f"{self.base_url}/{account_id}{document_uri}"
+        spool = SpooledDocument(
+            Config.DOCUMENT_SPOOL_MEMORY_MB * 1024 * 1024,
+            Config.DOCUMENT_MAX_MB * 1024 * 1024,
+            directory=Config.DOCUMENT_SPOOL_DIR
+        )
+        client, semaphore = self._pool()
         try:
-            headers = {'Authorization': f'Bearer {st.session_state.docusign_token}'}
-            response = await self._make_request(
-                'GET',
-                f"{self.base_url}/{account_id}{document_uri}",
-                headers=headers,
-                timeout=120.0  # Increase timeout for large documents
-            )
-            
-            if response.status_code == 200:
-                return response.content
-            else:
-                st.error(f"Failed to fetch document. Status code: {response.status_code}")
-                return None
-            
+            for attempt in range(Config.DOCUSIGN_MAX_RETRIES + 1):
+                wait = self._throttle_until - time.time()
+                if wait > 0:
+                    await asyncio.sleep(min(wait, Config.DOCUSIGN_MAX_BACKOFF))
+                try:
+                    async with semaphore:
+                        async with client.stream('GET', url, headers=headers, timeout=120.0) as response:
+                            self._note_rate_limits(response)
+                            if response.status_code in self.RETRY_STATUSES and attempt < Config.DOCUSIGN_MAX_RETRIES:
+                                delay = self._backoff_delay(response, attempt)
+                            else:
+                                response.raise_for_status()
+                                declared = int(response.headers.get('Content-Length') or 0)
+                                if declared > spool.max_bytes:
+                                    raise DocumentTooLarge(
+                                        f"Document is {declared // (1024 * 1024)} MB, "
+                                        f"above the {Config.DOCUMENT_MAX_MB} MB limit"
+                                    )
+                                async for chunk in response.aiter_bytes():
+                                    spool.write(chunk)
+                                return spool.finish()
+                except httpx.TransportError:
+                    if attempt >= Config.DOCUSIGN_MAX_RETRIES:
+                        raise
+                    # A connection dropped mid-download leaves a partial document; start it over
+                    spool.reset()
+                    delay = self._backoff_delay(None, attempt)
+                await asyncio.sleep(delay)
         except Exception as e:
+            spool.close()
             st.error(f"Error fetching document content: {str(e)}")
-            if hasattr(e, 'response'):
-                st.error(f"Response content: {e.response.text}")
             return None
 
     async def process_document(self, content: bytes, doc_metadata: dict) -> bool:
@@ -452,15 +593,14 @@ class DocuSignClient:
     async def download_and_process_document(self, account_id: str, envelope_id: str, doc: dict) -> bool:
         """Download and process a document"""
         try:
-            # Fetch document content
-            headers = {'Authorization': f'Bearer {st.session_state.docusign_token}'}
-            response = await self._make_request(
-                'GET',
-                f"{self.base_url}/{account_id}/envelopes/{envelope_id}/documents/{doc['documentId']}",
-                headers=headers
+            # Stream document content to a spool
+            spool = await self.fetch_document_spooled(
+                account_id, f"/envelopes/{envelope_id}/documents/{doc['documentId']}"
             )
-            
-            if response.status_code == 200:
+            if spool is None:
+                return False
+
+            with spool:
                 # Prepare metadata
                 doc_metadata = {
                     'documentId': doc['documentId'],
@@ -469,13 +609,10 @@ class DocuSignClient:
                     'status': doc.get('status'),
                     'sentDateTime': doc.get('sentDateTime')
                 }
-                
+
                 # Process the document
-                return await self.process_document(response.content, doc_metadata)
-            else:
-                st.error(f"Failed to fetch document. Status code: {response.status_code}")
-                return False
+                return await self.process_document(spool, doc_metadata)
                 
         except Exception as e:
             st.error(f"Error processing document: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
\ No newline at end of file
@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set
+
+from config import Config
+
+
+def envelope_version(envelope: Dict) -> str:
+    """Timestamp that changes whenever DocuSign considers the envelope modified."""
+    return (
+        envelope.get('statusChangedDateTime')
+        or envelope.get('lastModifiedDateTime')
+        or envelope.get('sentDateTime')
+        or ""
+    )
+
+
+class SyncState:
+    """Per-account sync watermark and the version of every envelope already synced."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS watermarks (account_id TEXT PRIMARY KEY, watermark TEXT NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS envelopes ("
+            "account_id TEXT NOT NULL, envelope_id TEXT NOT NULL, version TEXT NOT NULL, "
+            "PRIMARY KEY (account_id, envelope_id))"
+        )
+        self._db.commit()
+
+    def get_watermark(self, account_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT watermark FROM watermarks WHERE account_id = ?", (account_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, account_id: str, watermark: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO watermarks (account_id, watermark) VALUES (?, ?)",
+                (account_id, watermark)
+            )
+            self._db.commit()
+
+    def known_versions(self, account_id: str, envelope_ids: List[str]) -> Dict[str, str]:
+        versions = {}
+        with self._lock:
+            for i in range(0, len(envelope_ids), 500):
+                chunk = envelope_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                versions.update(self._db.execute(
+                    f"SELECT envelope_id, version FROM envelopes "
+                    f"WHERE account_id = ? AND envelope_id IN ({placeholders})",
+                    [account_id, *chunk]
+                ).fetchall())
+        return versions
+
+    def mark_synced(self, account_id: str, envelopes: List[Dict]):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO envelopes (account_id, envelope_id, version) VALUES (?, ?, ?)",
+                [(account_id, envelope['envelopeId'], envelope_version(envelope)) for envelope in envelopes]
+            )
+            self._db.commit()
+
+
+@dataclass
+class SyncPlan:
+    account_id: str
+    next_watermark: str
+    envelopes: List[Dict] = field(default_factory=list)
+    # Documents to (re-)embed, with envelope metadata merged in
+    documents: List[Dict] = field(default_factory=list)
+    # Envelopes whose document list could not be fetched; never marked as synced
+    failed_envelope_ids: Set[str] = field(default_factory=set)
+
+
+class DocuSignSync:
+    """
+    Incremental DocuSign sync.
+
+    Each run lists only envelopes whose status changed since the account's
+    watermark (`from_date` + `from_to_status=changed`), drops the ones whose
+    version was already synced, and queues their documents for embedding.
+    Listing errors propagate out of `plan()`, so a failed listing is never
+    mistaken for "nothing changed". The watermark only moves forward once
+    the caller commits a plan, so a failed run is simply retried next time.
+    """
+
+    def __init__(self, client, state: SyncState = None):
+        self.client = client
+        self.state = state or SyncState(Config.DOCUSIGN_SYNC_STATE_PATH)
+
+    async def plan(self, account_id: str) -> SyncPlan:
+        now = datetime.now(timezone.utc)
+        watermark = self.state.get_watermark(account_id) or Config.DOCUSIGN_SYNC_START
+        # Overlap the next window a little to tolerate clock skew; re-seen envelopes are filtered by version
+        next_watermark = (now - timedelta(minutes=Config.DOCUSIGN_SYNC_OVERLAP_MINUTES)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        envelopes = await self.client.fetch_envelopes(account_id, from_date=watermark, from_to_status='changed')
+        known = self.state.known_versions(account_id, [envelope['envelopeId'] for envelope in envelopes])
+        changed = [
+            envelope for envelope in envelopes
+            if known.get(envelope['envelopeId']) != envelope_version(envelope)
+        ]
+
+        plan = SyncPlan(account_id=account_id, next_watermark=next_watermark, envelopes=changed)
+        documents_by_envelope = await self.client.fetch_all_documents(account_id, changed)
+        for envelope in changed:
+            docs = documents_by_envelope.get(envelope['envelopeId'])
+            if docs is None:
+                plan.failed_envelope_ids.add(envelope['envelopeId'])
+                continue
+            for doc in docs:
+                plan.documents.append({
+                    **doc,
+                    'envelopeId': envelope['envelopeId'],
+                    'status': envelope.get('status'),
+                    'sentDateTime': envelope.get('sentDateTime')
+                })
+        return plan
+
+    def commit(self, plan: SyncPlan, synced_envelope_ids: Optional[set] = None):
+        """
+        Record the envelopes that were fully processed. The watermark advances
+        only when every envelope in the plan was synced.
+        """
+        synced = [
+            envelope for envelope in plan.envelopes
+            if envelope['envelopeId'] not in plan.failed_envelope_ids
+            and (synced_envelope_ids is None or envelope['envelopeId'] in synced_envelope_ids)
+        ]
+        self.state.mark_synced(plan.account_id, synced)
+        if len(synced) == len(plan.envelopes):
+            self.state.set_watermark(plan.account_id, plan.next_watermark)
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding cache.
+
+    Entries are keyed by a SHA-256 of the model id and the normalised text and
+    stored as float32 blobs in SQLite. When the stored size exceeds `max_bytes`
+    the least recently used entries are evicted.
+    """
+
+    # SQLite limits the number of bound parameters per statement
+    _QUERY_CHUNK = 500
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_access)")
+        self._db.commit()
+        self._total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Canonical form used for keys: NFC unicode with collapsed whitespace."""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    @classmethod
+    def make_key(cls, text: str, model_id: str) -> bytes:
+        return hashlib.sha256(f"{model_id}\0{cls.normalize(text)}".encode("utf-8")).digest()
+
+    def get_many(self, texts: List[str], model_id: str) -> List[Optional[List[float]]]:
+        """Look up embeddings for `texts`; misses come back as None."""
+        keys = [self.make_key(text, model_id) for text in texts]
+        found = {}
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for i in range(0, len(unique_keys), self._QUERY_CHUNK):
+                chunk = unique_keys[i:i + self._QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                for key, blob in self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ):
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._db.commit()
+
+            results = [found.get(key) for key in keys]
+            hits = sum(1 for result in results if result is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put_many(self, items: List[Tuple[str, List[float]]], model_id: str):
+        """Store (text, embedding) pairs, evicting old entries if the cache is over budget."""
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for text, embedding in items:
+            blob = np.asarray(embedding, dtype=np.float32).tobytes()
+            rows.append((self.make_key(text, model_id), blob, len(blob), now))
+
+        with self._lock:
+            replaced = self._stored_size([row[0] for row in rows])
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_access) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._total_bytes += sum(row[2] for row in rows) - replaced
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _stored_size(self, keys: List[bytes]) -> int:
+        total = 0
+        for i in range(0, len(keys), self._QUERY_CHUNK):
+            chunk = keys[i:i + self._QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            total += self._db.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchone()[0]
+        return total
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is at 90% of its budget."""
+        count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+        target = int(self.max_bytes * 0.9)
+        if count and total > target:
+            average = total / count
+            excess = int((total - target) / average) + 1
+            self._db.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                (excess,)
+            )
+        self._total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM embeddings")
+            self._db.commit()
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process plus the current size of the cache."""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': entries,
+                'bytes': self._total_bytes
+            }
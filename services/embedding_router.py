@@ -0,0 +1,218 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, List
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+from services.tracing import tracer
+
+
+class BackendStats:
+    """Rolling window of call latencies and outcomes for one embedding backend."""
+
+    def __init__(self, window: int = 200):
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self._latencies.append(latency)
+            self._outcomes.append(ok)
+            self.calls += 1
+            self.errors += 0 if ok else 1
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return 1 - sum(self._outcomes) / len(self._outcomes)
+
+    def samples(self) -> int:
+        with self._lock:
+            return len(self._outcomes)
+
+    def snapshot(self) -> dict:
+        """Latency percentiles (ms) and error rate over the window."""
+        with self._lock:
+            latencies = np.asarray(self._latencies) * 1000
+            outcomes = list(self._outcomes)
+        if not len(latencies):
+            return {'calls': self.calls, 'errors': self.errors, 'error_rate': 0.0,
+                    'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'error_rate': 1 - sum(outcomes) / len(outcomes),
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99)
+        }
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after repeated failures; open -> half-open after `reset_timeout`
+    seconds, when a single probe call decides whether to close again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self, trip: bool = False):
+        with self._lock:
+            self._failures += 1
+            if trip or self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class EmbeddingRouter:
+    """
+    Routes embedding calls between the HuggingFace Inference API and the local model.
+
+    The remote backend uses one pooled `requests.Session` with a timeout and is
+    skipped while its circuit is open. With `hedge_after_ms` set, a remote call
+    that has not answered within the budget races a local encode and the first
+    successful result wins.
+    """
+
+    def __init__(self, api_url: str, headers: dict, encode_local: Callable[[List[str]], list],
+                 timeout: float = None, hedge_after_ms: float = None):
+        self.api_url = api_url
+        self.encode_local = encode_local
+        self.timeout = timeout or Config.HF_API_TIMEOUT
+        hedge_after_ms = Config.EMBEDDING_HEDGE_AFTER_MS if hedge_after_ms is None else hedge_after_ms
+        self.hedge_after = hedge_after_ms / 1000 if hedge_after_ms > 0 else None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=Config.HF_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(headers)
+
+        self.stats = {'remote': BackendStats(), 'local': BackendStats()}
+        self.breaker = CircuitBreaker(Config.CIRCUIT_FAILURE_THRESHOLD, Config.CIRCUIT_RESET_SECONDS)
+        self._executor = ThreadPoolExecutor(max_workers=Config.HF_POOL_SIZE, thread_name_prefix="embedding-router")
+
+    def embed_remote(self, texts: List[str], wait_for_model: bool = False) -> list:
+        """Call the Inference API; raises on timeouts and non-200 responses."""
+        payload = {"inputs": texts}
+        if wait_for_model:
+            payload["options"] = {"wait_for_model": True}
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            embeddings = response.json()
+            if not isinstance(embeddings, list) or len(embeddings) != len(texts):
+                raise ValueError("Unexpected response shape from embedding API")
+        except Exception:
+            elapsed = time.perf_counter() - start
+            self.stats['remote'].record(elapsed, ok=False)
+            tracer.record("embed", elapsed, ok=False, backend="remote")
+            remote = self.stats['remote']
+            self.breaker.record_failure(
+                trip=remote.samples() >= Config.CIRCUIT_MIN_SAMPLES
+                and remote.error_rate() >= Config.CIRCUIT_ERROR_RATE
+            )
+            raise
+        elapsed = time.perf_counter() - start
+        self.stats['remote'].record(elapsed, ok=True)
+        tracer.record("embed", elapsed, backend="remote").annotate(texts=len(texts))
+        tracer.count("embedded_texts", len(texts), backend="remote")
+        self.breaker.record_success()
+        return embeddings
+
+    def embed_local(self, texts: List[str]) -> list:
+        start = time.perf_counter()
+        try:
+            embeddings = self.encode_local(texts)
+        except Exception:
+            elapsed = time.perf_counter() - start
+            self.stats['local'].record(elapsed, ok=False)
+            tracer.record("embed", elapsed, ok=False, backend="local")
+            raise
+        elapsed = time.perf_counter() - start
+        self.stats['local'].record(elapsed, ok=True)
+        tracer.record("embed", elapsed, backend="local").annotate(texts=len(texts))
+        tracer.count("embedded_texts", len(texts), backend="local")
+        return embeddings
+
+    def embed(self, texts: List[str], wait_for_model: bool = False) -> list:
+        """Remote first (unless its circuit is open), local on failure or when the hedge wins."""
+        if not self.breaker.allow():
+            return self.embed_local(texts)
+        if self.hedge_after is None:
+            try:
+                return self.embed_remote(texts, wait_for_model)
+            except Exception:
+                return self.embed_local(texts)
+        return self._hedged(texts, wait_for_model)
+
+    def _hedged(self, texts: List[str], wait_for_model: bool = False) -> list:
+        # Each call runs in a copy of the caller's context so its spans join the caller's trace
+        remote = self._executor.submit(contextvars.copy_context().run, self.embed_remote, texts, wait_for_model)
+        done, _ = wait([remote], timeout=self.hedge_after)
+        if done and remote.exception() is None:
+            return remote.result()
+        if done:
+            return self.embed_local(texts)
+
+        # Remote is over budget: race it against the local model
+        local = self._executor.submit(contextvars.copy_context().run, self.embed_local, texts)
+        pending = {remote, local}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+        # Both failed; surface the local error since it is the last resort
+        return local.result()
+
+    def latency_report(self) -> dict:
+        """Per-backend latency/error snapshot plus the remote circuit state."""
+        return {
+            'remote': self.stats['remote'].snapshot(),
+            'local': self.stats['local'].snapshot(),
+            'circuit': self.breaker.state
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
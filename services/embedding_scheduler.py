@@ -0,0 +1,114 @@
+import asyncio
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional
+
+from config import Config
+from services.embedding_service import EmbeddingService
+
+
+class EmbeddingScheduler:
+    """
+    Micro-batching front-end for `EmbeddingService`.
+
+    Callers submit single texts from any thread or event loop. A background
+    worker collects pending requests for up to `max_wait_ms` or until
+    `max_batch_size` texts are queued, runs one batched `get_embeddings` call
+    and resolves each caller's future. The sync methods mirror
+    `EmbeddingService`, so the scheduler can be passed wherever a service is
+    expected.
+    """
+
+    def __init__(self, embedding_service: EmbeddingService = None,
+                 max_batch_size: int = None, max_wait_ms: float = None):
+        self.embedding_service = embedding_service or EmbeddingService()
+        self.max_batch_size = max_batch_size or Config.EMBEDDING_SCHEDULER_MAX_BATCH
+        self.max_wait = (Config.EMBEDDING_SCHEDULER_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self._queue: "queue.Queue[Optional[tuple[str, Future, contextvars.Context]]]" = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-scheduler", daemon=True)
+                self._worker.start()
+
+    @property
+    def cache_model_id(self) -> str:
+        return self.embedding_service.cache_model_id
+
+    def submit(self, text: str) -> Future:
+        """Queue one text and return a future for its embedding (None if it could not be embedded)."""
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((text, future, contextvars.copy_context()))
+        return future
+
+    def get_single_embedding(self, text: str) -> Optional[List[float]]:
+        return self.submit(text).result()
+
+    def get_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    async def get_single_embedding_async(self, text: str) -> Optional[List[float]]:
+        return await asyncio.wrap_future(self.submit(text))
+
+    async def get_embeddings_async(self, texts: List[str]) -> List[Optional[List[float]]]:
+        return list(await asyncio.gather(*(asyncio.wrap_future(self.submit(text)) for text in texts)))
+
+    def close(self):
+        """Stop the worker once the requests already queued have been served."""
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join()
+
+    def _collect_batch(self, first) -> tuple[list, bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, stopping = self._collect_batch(first)
+            # Skip requests whose caller cancelled (e.g. an awaiting task); the rest can no longer be cancelled
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            texts = [text for text, _, _ in batch]
+            try:
+                # The batch is traced as part of its first caller's request
+                embeddings = batch[0][2].run(self.embedding_service.get_embeddings, texts)
+                if not embeddings or len(embeddings) != len(texts):
+                    embeddings = [None] * len(texts)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), embedding in zip(batch, embeddings):
+                    future.set_result(embedding)
+            self.batches += 1
+            self.texts += len(texts)
@@ -1,78 +1,175 @@
 from typing import List, Optional
-import numpy as np
-import requests
 from config import Config
-from sentence_transformers import SentenceTransformer
+from services.embedding_cache import EmbeddingCache
+from services.embedding_router import EmbeddingRouter
+from services.local_encoder import (
+    LocalEncoder, bucket_batches, create_local_encoder, encode_in_worker, init_encode_worker
+)
+from services.tracing import tracer
+import multiprocessing
 import os
-import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 class EmbeddingService:
-    def __init__(self):
-        # Initialize the local model as a fallback
-        self.local_model = None
+    MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+
+    def __init__(self, cache: Optional[EmbeddingCache] = None, local_encoder: Optional[LocalEncoder] = None):
+        # Initialize the local model as a fallback (loaded on first use)
+        self.local_encoder = local_encoder or create_local_encoder(Config.LOCAL_ENCODER, self.MODEL_ID)
+        self._model_lock = threading.Lock()
+        self.bulk_processes = Config.BULK_ENCODE_PROCESSES
+        self._encode_pool = None
+        self._encode_pool_size = 0
         self.api_url = "https://api-inference.huggingface.co/pipeline/feature-extraction/sentence-transformers/all-MiniLM-L6-v2"
         self.api_key = os.getenv("HUGGINGFACE_API_KEY")
         self.headers = {"Authorization": f"Bearer {self.api_key}"}
+        if cache is None and Config.EMBEDDING_CACHE_ENABLED:
+            cache = EmbeddingCache(Config.EMBEDDING_CACHE_PATH, Config.EMBEDDING_CACHE_MAX_MB * 1024 * 1024)
+        self.cache = cache
+        # Quantized encoders drift slightly from the reference model, so they get their own cache namespace
+        variant = self.local_encoder.variant
+        self.cache_model_id = self.MODEL_ID if variant == "torch" else f"{self.MODEL_ID}@{variant}"
+        self.router = EmbeddingRouter(self.api_url, self.headers, self._encode_local)
+
+    @property
+    def local_model(self):
+        return self.local_encoder.model
 
     def _ensure_local_model(self):
         """Ensure local model is loaded"""
-        if self.local_model is None:
-            self.local_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        if self.local_encoder.model is None:
+            with self._model_lock:
+                if self.local_encoder.model is None:
+                    self.local_encoder.load()
 
-    def get_single_embedding(self, text: str):
-        """Get embedding for a single text using API first, falling back to local model"""
-        try:
-            # Try API first
-            response = requests.post(self.api_url, headers=self.headers, json={"inputs": text})
-            
-            if response.status_code == 200:
-                return response.json()
-                
-            # If API fails, use local model
-            self._ensure_local_model()
-            embedding = self.local_model.encode([text])[0]
-            return embedding.tolist()
-            
-        except Exception as e:
-            # If any error occurs, use local model
-            self._ensure_local_model()
-            embedding = self.local_model.encode([text])[0]
-            return embedding.tolist()
+    def _with_cache(self, texts: List[str], compute) -> list:
+        """Serve what we can from the cache and only compute the misses."""
+        if self.cache is None or not texts:
+            return compute(texts)
+
+        results = self.cache.get_many(texts, self.cache_model_id)
+        missing = [i for i, embedding in enumerate(results) if embedding is None]
+        if not missing:
+            return results
+
+        computed = compute([texts[i] for i in missing])
+        if not computed or len(computed) != len(missing):
+            # Keep the cached hits; the texts that failed stay None
+            return computed if len(missing) == len(texts) else results
+        for i, embedding in zip(missing, computed):
+            results[i] = embedding
+        self.cache.put_many(
+            [(texts[i], embedding) for i, embedding in zip(missing, computed) if embedding is not None],
+            self.cache_model_id
+        )
+        return results
 
     def get_embeddings(self, texts: list):
         """Get embeddings for multiple texts"""
-        try:
-            # Try API first
-            response = requests.post(self.api_url, headers=self.headers, json={"inputs": texts})
-            
-            if response.status_code == 200:
-                return response.json()
-                
-            # If API fails, use local model
-            self._ensure_local_model()
-            embeddings = self.local_model.encode(texts)
-            return embeddings.tolist()
-            
-        except Exception as e:
-            # If any error occurs, use local model
+        return self._with_cache(texts, self._compute_embeddings)
+
+    def _compute_embeddings(self, texts: list):
+        # Router tries the API first and falls back to (or hedges with) the local model
+        return self.router.embed(texts)
+
+    def _encode_local(self, texts: list):
+        self._ensure_local_model()
+        embeddings = self.local_encoder.encode(texts)
+        return embeddings.tolist()
+
+    def encode_bulk(self, texts: List[str], processes: int = None) -> List[Optional[List[float]]]:
+        """
+        Encode a large batch of texts with the local model, e.g. for backfills.
+
+        Texts are bucketed by length with adaptive batch sizes and, when
+        `processes` (default `self.bulk_processes`) is above one,
+        spread over a pool of encoder processes. Results are in input order;
+        texts whose batch failed are None.
+        """
+        with tracer.span("embed", backend="local_bulk") as span:
+            span.annotate(texts=len(texts))
+            return self._with_cache(texts, lambda missing: self._encode_bulk(missing, processes))
+
+    def _encode_bulk(self, texts: List[str], processes: int = None) -> List[Optional[List[float]]]:
+        processes = self.bulk_processes if processes is None else processes
+        batches = bucket_batches(texts, Config.BULK_ENCODE_TOKEN_BUDGET, Config.BULK_ENCODE_MAX_BATCH)
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        if processes <= 1:
             self._ensure_local_model()
-            embeddings = self.local_model.encode(texts)
-            return embeddings.tolist()
+            for batch in batches:
+                try:
+                    embeddings = self.local_encoder.encode([texts[i] for i in batch], batch_size=len(batch))
+                except Exception as e:
+                    print(f"Error encoding batch of {len(batch)} texts: {e}")
+                    continue
+                for i, embedding in zip(batch, embeddings):
+                    results[i] = embedding.tolist()
+            return results
+
+        pool = self._bulk_pool(processes)
+        futures = [(batch, pool.submit(encode_in_worker, [texts[i] for i in batch])) for batch in batches]
+        broken = False
+        for batch, future in futures:
+            try:
+                embeddings = future.result()
+            except Exception as e:
+                print(f"Error encoding batch of {len(batch)} texts: {e}")
+                broken = broken or isinstance(e, BrokenProcessPool)
+                continue
+            for i, embedding in zip(batch, embeddings):
+                results[i] = embedding.tolist()
+        if broken:
+            # A crashed worker breaks the whole pool; start a fresh one on the next call
+            with self._model_lock:
+                self.close_bulk_pool()
+        return results
+
+    def _bulk_pool(self, processes: int):
+        """Encoder processes, one model copy each, kept alive between bulk calls."""
+        with self._model_lock:
+            if self._encode_pool is None or self._encode_pool_size != processes:
+                self.close_bulk_pool()
+                # Split the cores between workers so they do not oversubscribe each other
+                threads = max(1, (os.cpu_count() or 1) // processes)
+                self._encode_pool = ProcessPoolExecutor(
+                    max_workers=processes,
+                    # torch is not fork-safe once its thread pools exist
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_encode_worker,
+                    initargs=(Config.LOCAL_ENCODER, self.MODEL_ID, threads)
+                )
+                self._encode_pool_size = processes
+            return self._encode_pool
+
+    def close_bulk_pool(self):
+        if self._encode_pool is not None:
+            self._encode_pool.shutdown()
+            self._encode_pool = None
+            self._encode_pool_size = 0
 
     def get_batch_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
         """Get embeddings for multiple texts."""
+        return self._with_cache(texts, self._compute_batch_embeddings)
+
+    def _compute_batch_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
+        # Same circuit breaker and local fallback as `get_embeddings`, but waits for a cold API model
         try:
-            response = requests.post(
-                self.api_url,
-                headers=self.headers,
-                json={"inputs": texts, "options": {"wait_for_model": True}}
-            )
-            response.raise_for_status()
-            return response.json()
+            return self.router.embed(texts, wait_for_model=True)
         except Exception as e:
             print(f"Error getting batch embeddings: {e}")
             return [None] * len(texts)
 
     def get_single_embedding(self, text: str) -> Optional[List[float]]:
         embeddings = self.get_embeddings([text])
-        return embeddings[0] if embeddings else None 
\ No newline at end of file
+        return embeddings[0] if embeddings else None
+
+    def cache_stats(self) -> Optional[dict]:
+        """Embedding cache hit/miss counters, or None when caching is disabled."""
+        return self.cache.stats() if self.cache is not None else None
+
+    def latency_report(self) -> dict:
+        """Rolling latency and error rates for the remote and local backends."""
+        return self.router.latency_report()
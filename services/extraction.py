@@ -0,0 +1,203 @@
+import time
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+from typing import Iterator, List, Optional, Union
+
+from config import Config
+from services.chunking import PAGE_SEPARATOR
+from services.spool import SpooledDocument
+from services.tracing import tracer
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt')
+
+# A PDF given as raw bytes or as a path on disk
+PdfSource = Union[bytes, str]
+
+
+@dataclass
+class ExtractionResult:
+    text: str
+    backend: str  # "pymupdf", "pypdf2" or "mixed" for PDFs; "docx" / "text" otherwise
+    pages: int = 1
+    page_seconds: List[float] = field(default_factory=list)
+    seconds: float = 0.0
+
+
+@dataclass
+class PageText:
+    number: int  # 0-based
+    text: str
+    backend: str
+    seconds: float
+
+
+# The PDF/DOCX libraries are imported on first use so that importing this
+# module (and with it the search path) stays cheap.
+
+def _open_fitz(source: PdfSource):
+    import fitz  # PyMuPDF
+    if isinstance(source, str):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def _open_pypdf2(source: PdfSource):
+    import PyPDF2
+    if isinstance(source, str):
+        return PyPDF2.PdfReader(source)
+    return PyPDF2.PdfReader(BytesIO(source))
+
+
+def open_pdf(source: PdfSource):
+    """A PyMuPDF document, or a PyPDF2 reader if PyMuPDF cannot open the file."""
+    try:
+        return _open_fitz(source)
+    except Exception:
+        return _open_pypdf2(source)
+
+
+def _is_fitz(document) -> bool:
+    return hasattr(document, "load_page")
+
+
+def pdf_page_count(document) -> int:
+    return document.page_count if _is_fitz(document) else len(document.pages)
+
+
+def iter_pdf_pages(source: PdfSource, start: int = 0, stop: Optional[int] = None,
+                   document=None) -> Iterator[PageText]:
+    """
+    Yield the text of pages [start, stop) one at a time.
+    PyMuPDF is used first; a page it cannot read falls back to PyPDF2 for that
+    page only, and the whole range falls back only if PyMuPDF cannot open the file.
+    `document` is one already returned by `open_pdf(source)`; it is read
+    instead of opening `source` again and is left open.
+    """
+    owned = document is None
+    if owned:
+        document = open_pdf(source)
+
+    if not _is_fitz(document):
+        stop = len(document.pages) if stop is None else stop
+        for number in range(start, stop):
+            began = time.perf_counter()
+            text = document.pages[number].extract_text() or ""
+            yield PageText(number, text, "pypdf2", time.perf_counter() - began)
+        return
+
+    fallback_reader = None
+    try:
+        stop = document.page_count if stop is None else stop
+        for number in range(start, stop):
+            began = time.perf_counter()
+            try:
+                text, backend = document[number].get_text(), "pymupdf"
+            except Exception:
+                if fallback_reader is None:
+                    fallback_reader = _open_pypdf2(source)
+                text, backend = fallback_reader.pages[number].extract_text() or "", "pypdf2"
+            yield PageText(number, text, backend, time.perf_counter() - began)
+    finally:
+        if owned:
+            document.close()
+
+
+def _extract_page_range(task: tuple[PdfSource, int, int]) -> List[PageText]:
+    """Process-pool task for one slice of a large PDF."""
+    source, start, stop = task
+    return list(iter_pdf_pages(source, start, stop))
+
+
+def _extract_in_pool(source: PdfSource, pages: int, parts: int) -> Optional[List[PageText]]:
+    """Page ranges extracted on the container's process pool; None if the pool broke."""
+    if isinstance(source, bytes):
+        # Workers open the PDF from a temp file rather than each range task carrying a pickled copy of it
+        with SpooledDocument(0, len(source), directory=Config.DOCUMENT_SPOOL_DIR) as spool:
+            spool.write(source)
+            return _extract_in_pool(spool.finish().path, pages, parts)
+
+    from services.container import get_container
+    container = get_container()
+    ranges = _split_ranges(pages, parts)
+    try:
+        results = container.extraction_pool.map(_extract_page_range, [(source, a, b) for a, b in ranges])
+        return [page for part in results for page in part]
+    except BrokenProcessPool as e:
+        print(f"PDF extraction pool failed, extracting in this process instead: {e}")
+        container.discard_extraction_pool()
+        return None
+
+
+def _split_ranges(pages: int, parts: int) -> List[tuple[int, int]]:
+    size = -(-pages // parts)
+    return [(start, min(start + size, pages)) for start in range(0, pages, size)]
+
+
+def extract_pdf(source: PdfSource, workers: int = None) -> ExtractionResult:
+    """
+    Extract a PDF page by page and join the pages once.
+    PDFs with at least `Config.PDF_PARALLEL_MIN_PAGES` pages are split into
+    `workers` page ranges on the container's extraction pool when `workers` > 1.
+    """
+    began = time.perf_counter()
+    workers = workers or Config.PDF_EXTRACT_WORKERS
+    with tracer.span("extract", format="pdf") as span:
+        document = open_pdf(source)
+        try:
+            pages = pdf_page_count(document)
+            page_texts = None
+            if workers > 1 and pages >= Config.PDF_PARALLEL_MIN_PAGES:
+                page_texts = _extract_in_pool(source, pages, workers)
+            if page_texts is None:
+                page_texts = list(iter_pdf_pages(source, document=document))
+        finally:
+            if _is_fitz(document):
+                document.close()
+
+        backends = {page.backend for page in page_texts}
+        result = ExtractionResult(
+            text=PAGE_SEPARATOR.join(page.text for page in page_texts),
+            backend=backends.pop() if len(backends) == 1 else ("mixed" if backends else "pymupdf"),
+            pages=len(page_texts),
+            page_seconds=[page.seconds for page in page_texts],
+            seconds=time.perf_counter() - began
+        )
+        span.annotate(backend=result.backend, pages=result.pages, chars=len(result.text))
+    return result
+
+
+def extract_pdf_text(source: PdfSource, workers: int = None) -> str:
+    """Extract text from a PDF, one form feed between pages."""
+    return extract_pdf(source, workers).text
+
+
+def extract_document(content: bytes, file_name: str, workers: int = None) -> ExtractionResult:
+    """
+    Extract text from a PDF, DOCX or TXT document given as bytes.
+    Raises ValueError for unsupported file types.
+    """
+    file_extension = Path(file_name).suffix.lower()
+
+    if file_extension == '.pdf':
+        return extract_pdf(content, workers)
+
+    if file_extension not in SUPPORTED_EXTENSIONS:
+        raise ValueError(f"Unsupported file format: {file_extension}")
+
+    began = time.perf_counter()
+    with tracer.span("extract", format=file_extension.lstrip('.')) as span:
+        if file_extension == '.docx':
+            import docx
+            doc = docx.Document(BytesIO(content))
+            text, backend = ' '.join([paragraph.text for paragraph in doc.paragraphs]), "docx"
+        else:
+            text, backend = content.decode('utf-8'), "text"
+        span.annotate(chars=len(text))
+    return ExtractionResult(text=text, backend=backend, seconds=time.perf_counter() - began)
+
+
+def extract_text(content: bytes, file_name: str, workers: int = None) -> Optional[str]:
+    """Text of a PDF, DOCX or TXT document. Raises ValueError for unsupported file types."""
+    return extract_document(content, file_name, workers).text
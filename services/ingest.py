@@ -0,0 +1,134 @@
+from typing import Callable, Dict, Any, List
+
+from config import Config
+from services.chunking import chunk_text
+from services.ingest_manifest import IngestManifest
+from services.tracing import tracer
+
+
+def index_version(embedding_service) -> str:
+    """
+    What the manifest records each document as indexed with: the embedding
+    model and local encoder variant, and the chunk size and overlap. A
+    document indexed under another version is stale and embedded again.
+    """
+    return f"{embedding_service.cache_model_id}|{Config.CHUNK_SIZE}/{Config.CHUNK_OVERLAP}"
+
+
+def chunk_id(document_id: str, index: int) -> str:
+    """Vector id of a document chunk."""
+    return f"{document_id}#{index}"
+
+
+def build_chunk_records(document_id: str, text: str, metadata: Dict[str, Any]) -> List[tuple[str, str, Dict[str, Any]]]:
+    """Chunk a document into (vector id, chunk text, chunk metadata) records."""
+    # Pinecone rejects null metadata values
+    base_metadata = {key: value for key, value in metadata.items() if value is not None}
+    base_metadata['document_id'] = document_id
+
+    return [
+        (
+            chunk_id(document_id, chunk.index),
+            chunk.text,
+            {
+                **base_metadata,
+                'chunk_index': chunk.index,
+                'page': chunk.page,
+                'start': chunk.start,
+                'end': chunk.end,
+                'text': chunk.text,
+                'preview': chunk.text[:200] + "..."
+            }
+        )
+        for chunk in chunk_text(text)
+    ]
+
+
+def embed_and_upsert(embedding_service, vector_store, records: List[tuple[str, str, Dict[str, Any]]],
+                     batch_size: int = None, bulk: bool = False,
+                     on_written: Callable[[List[str]], None] = None,
+                     on_failed: Callable[[List[str], Exception], None] = None) -> List[str]:
+    """
+    Embed chunk records in batches and upsert them in one call.
+    With `bulk=True` all records go through `EmbeddingService.encode_bulk`
+    (local model, length-bucketed, multi-process) in a single call.
+    Returns the upserted vector ids, or an empty list if any batch failed to embed.
+    The vector store may buffer the upsert; `on_written(ids)` runs once it is
+    stored and `on_failed(ids, error)` if storing it fails.
+    """
+    batch_size = len(records) if bulk else batch_size or Config.EMBEDDING_BATCH_SIZE
+    vectors = []
+    for i in range(0, len(records), max(batch_size, 1)):
+        batch = records[i:i + batch_size]
+        texts = [text for _, text, _ in batch]
+        embeddings = embedding_service.encode_bulk(texts) if bulk else embedding_service.get_embeddings(texts)
+        if not embeddings or len(embeddings) != len(batch) or any(e is None for e in embeddings):
+            print(f"Failed to embed chunks {i}-{i + len(batch)}")
+            return []
+        vectors.extend(
+            (vector_id, embedding, metadata)
+            for (vector_id, _, metadata), embedding in zip(batch, embeddings)
+        )
+
+    if vectors:
+        vector_store.upsert(vectors=vectors, on_written=on_written, on_failed=on_failed)
+    return [vector_id for vector_id, _, _ in vectors]
+
+
+def index_document(embedding_service, vector_store, document_id: str, text: str,
+                   metadata: Dict[str, Any], on_written: Callable[[List[str]], None] = None,
+                   on_failed: Callable[[List[str], Exception], None] = None) -> List[str]:
+    """
+    Chunk a document, embed the chunks in batches and upsert one vector per chunk.
+    Returns the ids of the upserted chunks (empty if nothing could be embedded);
+    `on_written(ids)` runs once the vector store has stored them, `on_failed(ids, error)` if it could not.
+    """
+    records = build_chunk_records(document_id, text, metadata)
+    if not records:
+        return []
+    return embed_and_upsert(embedding_service, vector_store, records, on_written=on_written, on_failed=on_failed)
+
+
+def record_indexed(vector_store, manifest: IngestManifest, document_id: str, digest: str,
+                   chunk_ids: List[str], version: str):
+    """Delete chunks the previous version had but the new one does not, then update the manifest."""
+    previous = manifest.get(document_id)
+    if previous is not None:
+        current = set(chunk_ids)
+        stale = [vector_id for vector_id in previous.chunk_ids if vector_id not in current]
+        if stale:
+            vector_store.delete(stale)
+    manifest.record(document_id, digest, version, chunk_ids)
+
+
+def reindex_document(embedding_service, vector_store, manifest: IngestManifest, document_id: str,
+                     digest: str, text: str, metadata: Dict[str, Any],
+                     on_failed: Callable[[Exception], None] = None) -> List[str]:
+    """
+    Index a new or changed document and record it in the manifest.
+    Callers check `manifest.is_current` against `index_version` first so unchanged documents are
+    never extracted or embedded.
+    The manifest entry is written only once the chunks are stored, which with
+    write-behind can be after this returns; a document whose write fails is
+    left out of the manifest, reported through `on_failed(error)` and indexed
+    again next time.
+    """
+    version = index_version(embedding_service)
+
+    def written(chunk_ids: List[str]):
+        record_indexed(vector_store, manifest, document_id, digest, chunk_ids, version)
+        tracer.count("ingested_documents", status="indexed")
+
+    def failed(_chunk_ids: List[str], error: Exception):
+        tracer.count("ingested_documents", status="failed")
+        if on_failed is not None:
+            on_failed(error)
+
+    with tracer.span("ingest") as span:
+        chunk_ids = index_document(
+            embedding_service, vector_store, document_id, text, metadata, on_written=written, on_failed=failed
+        )
+        span.annotate(document_id=document_id, chunks=len(chunk_ids))
+    if not chunk_ids:
+        tracer.count("ingested_documents", status="failed")
+    return chunk_ids
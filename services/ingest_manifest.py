@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import PurePath
+from typing import List, Optional
+
+
+def stable_document_id(source: str, key: str) -> str:
+    """
+    Deterministic document id for a source ("local", "docusign", ...) and a
+    source-specific key such as a file name. Unlike `hash()`, it is the same
+    in every process.
+    """
+    return f"{source}_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]}"
+
+
+def local_document_id(path: str) -> str:
+    """
+    Document id of a local file, keyed by its path relative to the import
+    root with "/" separators. An uploaded file's path is its name, so an
+    upload and a bulk import of the same top-level file share one id.
+    """
+    return stable_document_id("local", PurePath(path).as_posix())
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+@dataclass
+class ManifestEntry:
+    document_id: str
+    content_hash: str
+    model_id: str
+    chunk_ids: List[str]
+    updated_at: float
+
+
+class IngestManifest:
+    """
+    Persistent record of what has been indexed: for each document id, the hash
+    of the content that was embedded, the index version it was embedded with
+    (`services.ingest.index_version`, stored as `model_id`), and the chunk ids
+    written to the vector store.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "document_id TEXT PRIMARY KEY, content_hash TEXT NOT NULL, model_id TEXT NOT NULL, "
+            "chunk_ids TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, document_id: str) -> Optional[ManifestEntry]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT document_id, content_hash, model_id, chunk_ids, updated_at "
+                "FROM documents WHERE document_id = ?",
+                (document_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return ManifestEntry(row[0], row[1], row[2], json.loads(row[3]), row[4])
+
+    def is_current(self, document_id: str, content_hash: str, model_id: str) -> bool:
+        """True if this exact content was already indexed with this model."""
+        entry = self.get(document_id)
+        return entry is not None and entry.content_hash == content_hash and entry.model_id == model_id
+
+    def record(self, document_id: str, content_hash: str, model_id: str, chunk_ids: List[str]):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents (document_id, content_hash, model_id, chunk_ids, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (document_id, content_hash, model_id, json.dumps(chunk_ids), time.time())
+            )
+            self._db.commit()
+
+    def remove(self, document_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+            self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
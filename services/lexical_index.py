@@ -0,0 +1,268 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from services.metadata_index import matches_filter
+from services.vector_backend import Match
+
+# Words, keeping clause numbers ("12.3"), hyphenated terms and abbreviations ("u.s") in one token
+LEXICAL_TOKEN_PATTERN = re.compile(r"\w+(?:[.\-/']\w+)*")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+MAX_TF = 65535  # Term frequencies are stored as uint16
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in LEXICAL_TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def quoted_phrase(query: str) -> Optional[str]:
+    """The phrase inside a fully quoted query (`"force majeure"`), else None."""
+    query = query.strip()
+    if len(query) > 2 and query[0] == query[-1] == '"':
+        return query[1:-1].strip() or None
+    return None
+
+
+def _normalize_phrase(text: str) -> str:
+    # Padded with spaces so a substring test only matches whole tokens ("indemnification" not in "preindemnification")
+    return f" {' '.join(LEXICAL_TOKEN_PATTERN.findall(text.lower()))} "
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over chunk text, kept next to the vector store.
+
+    Postings are two parallel arrays per term (uint32 document numbers and
+    uint16 term frequencies), so a query term is scored with a few vectorised
+    numpy operations. Chunks, their term counts and metadata are persisted in
+    SQLite and the postings are rebuilt from it on start-up. Updated or
+    deleted chunks leave tombstones in the postings that are skipped at query
+    time; once they make up `compact_ratio` of all postings the lists are
+    compacted in place, and the rest are dropped on the next load.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75, compact_ratio: float = 0.25):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "docno INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, length INTEGER NOT NULL, "
+            "terms TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+        self._postings: Dict[str, tuple[array, array]] = {}
+        self._df: Counter = Counter()
+        self._ids: List[Optional[str]] = []
+        self._lengths = array('I')
+        self._alive = bytearray()
+        self._docno_by_id: Dict[str, int] = {}
+        self._total_length = 0
+        self._posting_count = 0
+        self._dead_postings = 0
+        for docno, vector_id, length, terms in self._db.execute(
+            "SELECT docno, id, length, terms FROM chunks ORDER BY docno"
+        ):
+            self._index(docno, vector_id, length, json.loads(terms))
+
+    def __len__(self) -> int:
+        return len(self._docno_by_id)
+
+    def _index(self, docno: int, vector_id: str, length: int, terms: Dict[str, int]):
+        if docno >= len(self._ids):
+            grow = docno + 1 - len(self._ids)
+            self._ids.extend([None] * grow)
+            self._lengths.extend([0] * grow)
+            self._alive.extend(bytes(grow))
+        self._ids[docno] = vector_id
+        self._lengths[docno] = length
+        self._alive[docno] = 1
+        self._docno_by_id[vector_id] = docno
+        self._total_length += length
+        for term, tf in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array('I'), array('H'))
+            postings[0].append(docno)
+            postings[1].append(min(tf, MAX_TF))
+            self._df[term] += 1
+        self._posting_count += len(terms)
+
+    def add(self, chunks: List[tuple[str, str, Dict[str, Any]]]):
+        """Index or re-index chunks given as (id, text, metadata) tuples."""
+        if not chunks:
+            return
+        with self._lock:
+            self.remove([vector_id for vector_id, _, _ in chunks])
+            docno = len(self._ids)
+            rows = []
+            for vector_id, text, metadata in chunks:
+                tokens = tokenize(text or "")
+                terms = dict(Counter(tokens))
+                self._index(docno, vector_id, len(tokens), terms)
+                rows.append((docno, vector_id, len(tokens), json.dumps(terms), json.dumps(metadata or {})))
+                docno += 1
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunks (docno, id, length, terms, metadata) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._db.commit()
+
+    def remove(self, ids: List[str]):
+        """Drop chunks by id. Unknown ids are ignored."""
+        with self._lock:
+            docnos = [self._docno_by_id.pop(vector_id) for vector_id in ids if vector_id in self._docno_by_id]
+            if not docnos:
+                return
+            for i in range(0, len(docnos), 500):
+                batch = docnos[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                for length, terms in self._db.execute(
+                    f"SELECT length, terms FROM chunks WHERE docno IN ({placeholders})", batch
+                ):
+                    self._total_length -= length
+                    terms = json.loads(terms)
+                    self._df.subtract(terms.keys())
+                    self._dead_postings += len(terms)
+                self._db.execute(f"DELETE FROM chunks WHERE docno IN ({placeholders})", batch)
+            self._db.commit()
+            for docno in docnos:
+                self._ids[docno] = None
+                self._alive[docno] = 0
+            if self._dead_postings > self.compact_ratio * self._posting_count:
+                self.compact()
+
+    def compact(self):
+        """Drop the postings of updated and deleted chunks, so queries stop scanning them."""
+        with self._lock:
+            alive = np.frombuffer(self._alive, dtype=np.uint8)
+            for term in list(self._postings):
+                docnos, tfs = self._postings[term]
+                keep = alive[np.frombuffer(docnos, dtype=np.uint32)] == 1
+                if keep.all():
+                    continue
+                if not keep.any():
+                    del self._postings[term]
+                    self._df.pop(term, None)
+                    continue
+                kept_docnos, kept_tfs = array('I'), array('H')
+                kept_docnos.frombytes(np.frombuffer(docnos, dtype=np.uint32)[keep].tobytes())
+                kept_tfs.frombytes(np.frombuffer(tfs, dtype=np.uint16)[keep].tobytes())
+                self._postings[term] = (kept_docnos, kept_tfs)
+            self._posting_count -= self._dead_postings
+            self._dead_postings = 0
+
+    def _scores(self, terms: List[str], require_all: bool) -> np.ndarray:
+        """BM25 score of every document number for `terms` (0 for non-matching and deleted ones)."""
+        size = len(self._ids)
+        scores = np.zeros(size, dtype=np.float32)
+        if not self._docno_by_id:
+            return scores
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32)[:size].astype(np.float32)
+        average_length = max(self._total_length / len(self._docno_by_id), 1.0)
+        norm = self.k1 * (1 - self.b + self.b * lengths / average_length)
+        matched = np.zeros(size, dtype=np.int32)
+        count = len(self._docno_by_id)
+        for term in set(terms):
+            postings = self._postings.get(term)
+            if postings is None or self._df[term] <= 0:
+                if require_all:
+                    return np.zeros(size, dtype=np.float32)
+                continue
+            docnos = np.frombuffer(postings[0], dtype=np.uint32)
+            tf = np.frombuffer(postings[1], dtype=np.uint16).astype(np.float32)
+            df = self._df[term]
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            # Each document appears at most once per posting list, so plain fancy-index addition is safe
+            scores[docnos] += idf * tf * (self.k1 + 1) / (tf + norm[docnos])
+            matched[docnos] += 1
+        if require_all:
+            scores[matched < len(set(terms))] = 0
+        scores[np.frombuffer(self._alive, dtype=np.uint8)[:size] == 0] = 0
+        return scores
+
+    def search(self, query: str, top_k: int = 5, phrase: bool = False,
+               filter: Optional[Dict[str, Any]] = None) -> List[Match]:
+        """
+        BM25 top-k chunks for `query`. With `phrase=True` every chunk must
+        contain the query as an exact phrase (case- and punctuation-insensitive).
+        `filter` is a metadata filter checked against each candidate's metadata.
+        """
+        terms = tokenize(query)
+        if not terms or top_k <= 0:
+            return []
+        with self._lock:
+            scores = self._scores(terms, require_all=phrase)
+            candidates = np.flatnonzero(scores > 0)
+            if not phrase and not filter and len(candidates) > top_k:
+                candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+            return self._matches(
+                [int(docno) for docno in candidates], scores, top_k, _normalize_phrase(query) if phrase else None,
+                filter
+            )
+
+    def _matches(self, docnos: List[int], scores: np.ndarray, top_k: int, phrase: Optional[str],
+                 filter: Optional[Dict[str, Any]] = None) -> List[Match]:
+        matches = []
+        # Phrase and filter checks need the chunk metadata, so candidates are loaded in batches until enough pass
+        for i in range(0, len(docnos), 256):
+            batch = docnos[i:i + 256]
+            placeholders = ",".join("?" * len(batch))
+            metadata = {
+                docno: json.loads(value) for docno, value in self._db.execute(
+                    f"SELECT docno, metadata FROM chunks WHERE docno IN ({placeholders})", batch
+                )
+            }
+            for docno in batch:
+                chunk_metadata = metadata.get(docno, {})
+                if phrase is not None and phrase not in _normalize_phrase(chunk_metadata.get('text', '')):
+                    continue
+                if not matches_filter(chunk_metadata, filter):
+                    continue
+                matches.append(Match(id=self._ids[docno], score=float(scores[docno]), metadata=chunk_metadata))
+                if len(matches) >= top_k:
+                    return matches
+        return matches
+
+
+def reciprocal_rank_fusion(rankings: List[list], k: int = 60) -> List[Match]:
+    """
+    Merge ranked match lists by reciprocal rank fusion: each list adds
+    1 / (k + rank) to an id's score, so ids ranked well by several retrievers
+    rise to the top regardless of how each retriever scales its scores.
+    """
+    scores: Dict[str, float] = {}
+    first_seen: Dict[str, Any] = {}
+    for ranking in rankings:
+        for rank, match in enumerate(ranking, 1):
+            scores[match.id] = scores.get(match.id, 0.0) + 1.0 / (k + rank)
+            first_seen.setdefault(match.id, match)
+    return [
+        Match(
+            id=vector_id,
+            score=score,
+            metadata=dict(first_seen[vector_id].metadata or {}),
+            values=getattr(first_seen[vector_id], 'values', None)
+        )
+        for vector_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    ]
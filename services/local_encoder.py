@@ -0,0 +1,162 @@
+import importlib.metadata
+import importlib.util
+import re
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import numpy as np
+
+from config import Config
+from services.chunking import TOKEN_PATTERN
+
+# First sentence-transformers release with the ONNX backend
+ONNX_MIN_VERSION = (3, 2)
+
+# ONNX exports shipped in the all-MiniLM-L6-v2 model repository
+ONNX_FILES = {
+    "onnx": "onnx/model.onnx",
+    "onnx-int8": "onnx/model_quint8_avx2.onnx",
+}
+
+
+class LocalEncoder(ABC):
+    """
+    CPU copy of the embedding model used when the Inference API is unavailable.
+
+    `variant` names the precision/runtime so embeddings from different
+    variants are never mixed in the embedding cache.
+    """
+
+    variant = "torch"
+
+    def __init__(self, model_id: str, threads: int = 0):
+        self.model_id = model_id
+        self.threads = threads
+        self.model = None
+
+    @abstractmethod
+    def load(self):
+        """Load the model into `self.model`."""
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        if self.model is None:
+            self.load()
+        return self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+
+    def _set_torch_threads(self):
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+
+
+class TorchEncoder(LocalEncoder):
+    """Full-precision PyTorch SentenceTransformer (the reference model)."""
+
+    variant = "torch"
+
+    def load(self):
+        # Deferred: sentence_transformers pulls in torch, which dominates import time
+        from sentence_transformers import SentenceTransformer
+        self._set_torch_threads()
+        self.model = SentenceTransformer(self.model_id, device="cpu")
+
+
+class QuantizedTorchEncoder(LocalEncoder):
+    """PyTorch model with its Linear layers dynamically quantized to int8."""
+
+    variant = "torch-int8"
+
+    def load(self):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        self._set_torch_threads()
+        model = SentenceTransformer(self.model_id, device="cpu")
+        # Weights become int8 and activations are quantized on the fly; the transformer's
+        # matmuls dominate CPU time and are where the speed-up comes from
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        self.model = model
+
+
+class OnnxEncoder(LocalEncoder):
+    """ONNX Runtime export of the model, optionally the pre-quantized int8 file."""
+
+    def __init__(self, model_id: str, threads: int = 0, variant: str = "onnx", file_name: Optional[str] = None):
+        super().__init__(model_id, threads)
+        self.variant = variant
+        self.file_name = file_name or ONNX_FILES[variant]
+
+    def load(self):
+        self._check_dependencies()
+        from sentence_transformers import SentenceTransformer
+        model_kwargs = {"file_name": self.file_name}
+        if self.threads:
+            import onnxruntime
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = self.threads
+            model_kwargs["session_options"] = options
+        self.model = SentenceTransformer(self.model_id, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+    def _check_dependencies(self):
+        """The ONNX backend needs sentence-transformers 3.2+ with its optional optimum/onnxruntime packages."""
+        missing = [module for module in ("onnxruntime", "optimum") if importlib.util.find_spec(module) is None]
+        try:
+            version = importlib.metadata.version("sentence-transformers")
+        except importlib.metadata.PackageNotFoundError:
+            version = None
+        if version is not None and tuple(int(part) for part in re.findall(r"\d+", version)[:2]) < ONNX_MIN_VERSION:
+            missing.insert(0, f"sentence-transformers>={'.'.join(map(str, ONNX_MIN_VERSION))} (found {version})")
+        if missing:
+            raise ImportError(
+                f"LOCAL_ENCODER={self.variant} needs {', '.join(missing)}; "
+                f"install them with: pip install 'sentence-transformers[onnx]>=3.2'"
+            )
+
+
+LOCAL_ENCODERS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+
+def create_local_encoder(name: str, model_id: str, threads: int = None) -> LocalEncoder:
+    """Encoder for `Config.LOCAL_ENCODER`: "torch", "torch-int8", "onnx" or "onnx-int8"."""
+    threads = Config.LOCAL_ENCODER_THREADS if threads is None else threads
+    if name == "torch":
+        return TorchEncoder(model_id, threads)
+    if name == "torch-int8":
+        return QuantizedTorchEncoder(model_id, threads)
+    if name in ONNX_FILES:
+        return OnnxEncoder(model_id, threads, variant=name, file_name=Config.ONNX_MODEL_FILE or None)
+    raise ValueError(f"Unknown local encoder: {name!r} (expected one of {', '.join(LOCAL_ENCODERS)})")
+
+
+def bucket_batches(texts: List[str], token_budget: int, max_batch: int) -> List[List[int]]:
+    """
+    Group text indices into batches of similar length, longest first.
+
+    Padding makes every text in a batch cost as much as the longest one, so
+    texts are sorted by token count and each batch takes as many texts as fit
+    in `token_budget` at the length of its longest member: short texts go in
+    large batches, long ones in small batches.
+    """
+    lengths = [max(1, len(TOKEN_PATTERN.findall(text))) for text in texts]
+    order = sorted(range(len(texts)), key=lambda i: lengths[i], reverse=True)
+    batches = []
+    start = 0
+    while start < len(order):
+        size = max(1, min(max_batch, token_budget // lengths[order[start]]))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+
+# Encoder of the current bulk-encoding worker process
+_worker_encoder: Optional[LocalEncoder] = None
+
+
+def init_encode_worker(name: str, model_id: str, threads: int):
+    global _worker_encoder
+    _worker_encoder = create_local_encoder(name, model_id, threads)
+    _worker_encoder.load()
+
+
+def encode_in_worker(texts: List[str]) -> np.ndarray:
+    """Process-pool task: encode one pre-bucketed batch."""
+    return _worker_encoder.encode(texts, batch_size=len(texts))
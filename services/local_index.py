@@ -0,0 +1,318 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from services.ann_index import IVFIndex
+from services.metadata_index import MetadataIndex
+from services.quantization import SCAN_BLOCK_ROWS, Quantizer, remove_stale_codes
+from services.vector_backend import VectorBackend, Match, QueryResult
+
+
+class LocalVectorIndex(VectorBackend):
+    """
+    In-process vector index for offline / on-prem use.
+
+    Vectors are L2-normalised on insert and stored as one contiguous float32
+    matrix in a memory-mapped `.npy` file, so cosine similarity is a single
+    matrix-vector product. Ids and metadata live in a SQLite side table keyed
+    by row number. Deleted rows are zeroed and reused by later inserts.
+
+    When an `IVFIndex` is attached, searches only score the rows in the
+    closest inverted lists once the index holds enough vectors to train it.
+
+    When a `Quantizer` is attached, candidates are ranked on its int8 or
+    binary codes and only the best few are rescored against the float32
+    matrix, so the full-precision vectors can stay on disk.
+
+    Metadata filters are resolved against a `MetadataIndex` into a row mask
+    before scoring. Narrow filters (up to `filter_scan_rows` matches) score
+    just the matching rows exactly; broader ones restrict the ANN candidates.
+    """
+
+    name = "local"
+
+    VECTORS_FILE = "vectors.npy"
+    METADATA_FILE = "metadata.sqlite3"
+
+    def __init__(self, path: str, dimension: int, initial_capacity: int = 1024,
+                 ann: Optional[IVFIndex] = None, quantizer: Optional[Quantizer] = None,
+                 filter_scan_rows: int = 10000):
+        self.path = path
+        self.dimension = dimension
+        self.ann = ann
+        self.quantizer = quantizer
+        self.filter_scan_rows = filter_scan_rows
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        self._db = sqlite3.connect(os.path.join(path, self.METADATA_FILE), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            "row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+        rows = self._db.execute("SELECT row, id, metadata FROM vectors ORDER BY row").fetchall()
+        self._row_by_id: Dict[str, int] = {vector_id: row for row, vector_id, _ in rows}
+        self._size = rows[-1][0] + 1 if rows else 0  # rows in use, including holes
+
+        self._vectors = self._open_vectors(max(initial_capacity, self._size))
+        self._ids: List[Optional[str]] = [None] * self._capacity
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        self.metadata_index = MetadataIndex(self._capacity)
+        for row, vector_id, metadata in rows:
+            self._ids[row] = vector_id
+            self._alive[row] = True
+            self.metadata_index.set(row, json.loads(metadata))
+        self._free_rows = [row for row in range(self._size) if not self._alive[row]]
+        remove_stale_codes(path, keep=quantizer)
+        if self.quantizer is not None and self.quantizer.open(self._capacity):
+            self._encode_existing()
+        if self.ann is not None:
+            self.ann.load(self._vectors, self._alive, self._size)
+
+    @property
+    def _capacity(self) -> int:
+        return self._vectors.shape[0]
+
+    def __len__(self) -> int:
+        return len(self._row_by_id)
+
+    def _vectors_path(self) -> str:
+        return os.path.join(self.path, self.VECTORS_FILE)
+
+    def _open_vectors(self, capacity: int) -> np.memmap:
+        """Open the vector file, creating or growing it to `capacity` rows."""
+        path = self._vectors_path()
+        if os.path.exists(path):
+            vectors = np.load(path, mmap_mode="r+")
+            if vectors.shape[1] != self.dimension:
+                raise ValueError(
+                    f"Local index at {self.path} has dimension {vectors.shape[1]}, expected {self.dimension}"
+                )
+            if vectors.shape[0] >= capacity:
+                return vectors
+            return self._grow(vectors, capacity)
+        return np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.float32, shape=(capacity, self.dimension)
+        )
+
+    def _grow(self, vectors: np.memmap, capacity: int) -> np.memmap:
+        """Copy the matrix into a larger file and swap it in place."""
+        path = self._vectors_path()
+        tmp_path = path + ".tmp"
+        grown = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=np.float32, shape=(capacity, self.dimension)
+        )
+        grown[:vectors.shape[0]] = vectors
+        grown.flush()
+        del grown, vectors
+        os.replace(tmp_path, path)
+        return np.load(path, mmap_mode="r+")
+
+    def _reserve(self, extra: int):
+        """Make room for `extra` new rows beyond the current size."""
+        needed = self._size + extra
+        if needed <= self._capacity:
+            return
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        self._vectors.flush()
+        self._vectors = self._grow(self._vectors, capacity)
+        if self.quantizer is not None:
+            self.quantizer.flush()
+            self.quantizer.open(capacity)
+        self._ids.extend([None] * (capacity - len(self._ids)))
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+        self.metadata_index.grow(capacity)
+
+    def _encode_existing(self):
+        """Quantize rows written before the quantizer was enabled."""
+        for start in range(0, self._size, SCAN_BLOCK_ROWS):
+            stop = min(start + SCAN_BLOCK_ROWS, self._size)
+            self.quantizer.write(slice(start, stop), np.asarray(self._vectors[start:stop]))
+        self.quantizer.flush()
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def ensure_ready(self):
+        """The local index is created on construction, so there is nothing to do."""
+        return True
+
+    def upsert(self, vectors: List[tuple[str, List[float], Dict[str, Any]]]):
+        """Insert or replace vectors given as (id, embedding, metadata) tuples."""
+        if not vectors:
+            return
+        matrix = self._normalize(np.asarray([v[1] for v in vectors], dtype=np.float32))
+        if matrix.shape[1] != self.dimension:
+            raise ValueError(f"Expected {self.dimension}-dim vectors, got {matrix.shape[1]}")
+
+        with self._lock:
+            new_ids = {vector_id for vector_id, _, _ in vectors if vector_id not in self._row_by_id}
+            self._reserve(max(0, len(new_ids) - len(self._free_rows)))
+
+            rows = []
+            for vector_id, _, _ in vectors:
+                row = self._row_by_id.get(vector_id)
+                if row is None:
+                    if self._free_rows:
+                        row = self._free_rows.pop()
+                    else:
+                        row = self._size
+                        self._size += 1
+                    self._row_by_id[vector_id] = row
+                    self._ids[row] = vector_id
+                    self._alive[row] = True
+                rows.append(row)
+
+            self._vectors[rows] = matrix
+            self._vectors.flush()
+            if self.quantizer is not None:
+                self.quantizer.write(rows, matrix)
+                self.quantizer.flush()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO vectors (row, id, metadata) VALUES (?, ?, ?)",
+                [(row, vector_id, json.dumps(metadata or {}))
+                 for row, (vector_id, _, metadata) in zip(rows, vectors)]
+            )
+            self._db.commit()
+            for row, (_, _, metadata) in zip(rows, vectors):
+                self.metadata_index.set(row, metadata)
+            self._index_rows(rows, matrix)
+
+    def delete(self, ids: List[str]):
+        """Remove vectors by id. Unknown ids are ignored."""
+        with self._lock:
+            rows = [self._row_by_id.pop(vector_id) for vector_id in ids if vector_id in self._row_by_id]
+            if not rows:
+                return
+            for row in rows:
+                self._ids[row] = None
+                self.metadata_index.clear(row)
+            self._alive[rows] = False
+            self._vectors[rows] = 0.0
+            self._vectors.flush()
+            self._free_rows.extend(rows)
+            self._db.executemany("DELETE FROM vectors WHERE row = ?", [(row,) for row in rows])
+            self._db.commit()
+            if self.ann is not None and self.ann.is_trained:
+                self.ann.remove(rows)
+                if self.ann.needs_compaction():
+                    self.ann.compact()
+
+    def _index_rows(self, rows: List[int], matrix: np.ndarray):
+        """Keep the ANN index in step with freshly written rows, training it once it is big enough."""
+        if self.ann is None:
+            return
+        if self.ann.is_trained:
+            self.ann.add(np.asarray(rows), matrix)
+        elif len(self._row_by_id) >= self.ann.min_train_size:
+            self.ann.train(self._vectors, self._alive, self._size)
+
+    def ann_needs_retrain(self) -> bool:
+        """True once the corpus has outgrown the ANN centroids (see `IVFIndex.needs_retrain`)."""
+        with self._lock:
+            return self.ann is not None and self.ann.needs_retrain(len(self._row_by_id))
+
+    def rebuild_ann(self):
+        """Retrain the ANN centroids on the current corpus, e.g. after it has grown a lot."""
+        with self._lock:
+            if self.ann is not None:
+                self.ann.train(self._vectors, self._alive, self._size)
+
+    def _top_k(self, scores: np.ndarray, top_k: int) -> np.ndarray:
+        """Indices of the `top_k` highest scores, best first."""
+        top_k = min(top_k, len(scores))
+        if top_k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if top_k < len(scores):
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(len(scores))
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+    def _load_metadata(self, rows: List[int]) -> Dict[int, Dict[str, Any]]:
+        placeholders = ",".join("?" * len(rows))
+        cursor = self._db.execute(
+            f"SELECT row, metadata FROM vectors WHERE row IN ({placeholders})", rows
+        )
+        return {row: json.loads(metadata) for row, metadata in cursor}
+
+    def _shortlist(self, rows: Optional[np.ndarray], query: np.ndarray, top_k: int) -> np.ndarray:
+        """Rows worth rescoring exactly, ranked on the quantized codes (`rows=None` scans every row)."""
+        keep = top_k * self.quantizer.rescore_multiplier
+        if rows is None:
+            scores = self.quantizer.score_range(self._size, query)
+            scores[~self._alive[:self._size]] = -np.inf
+            shortlist = self._top_k(scores, min(keep, len(self._row_by_id)))
+        else:
+            shortlist = rows[self._top_k(self.quantizer.score_rows(rows, query), keep)]
+        # Sorted rows make the gather from the memory-mapped matrix sequential
+        return np.sort(shortlist)
+
+    def search(self, query_vector: List[float], top_k: int = 5, include_values: bool = False,
+               nprobe: Optional[int] = None, exact: bool = False,
+               filter: Optional[Dict[str, Any]] = None) -> QueryResult:
+        """
+        Cosine top-k over live vectors, optionally restricted by a
+        Pinecone-style metadata `filter`.
+        Uses the ANN index when it is trained (`nprobe` overrides its default
+        per query) and the quantized codes when a quantizer is attached; final
+        scores are always exact. `exact=True` forces a full float32 scan.
+        """
+        query = self._normalize(np.asarray(query_vector, dtype=np.float32))
+        with self._lock:
+            if not self._row_by_id:
+                return QueryResult()
+            rows = None
+            if filter:
+                rows = self._filtered_rows(filter, query, nprobe, top_k, exact)
+                if not len(rows):
+                    return QueryResult()
+            elif self.ann is not None and self.ann.is_trained and not exact:
+                rows = self.ann.candidates(query, nprobe)
+            if self.quantizer is not None and not exact:
+                rows = self._shortlist(rows, query, top_k)
+            if rows is not None:
+                scores = np.asarray(self._vectors[rows] @ query)
+                best = self._top_k(scores, top_k)
+                return self._build_result([int(row) for row in rows[best]], scores[best], include_values)
+
+            scores = np.asarray(self._vectors[:self._size] @ query)
+            scores[~self._alive[:self._size]] = -np.inf
+            best = self._top_k(scores, min(top_k, len(self._row_by_id)))
+            return self._build_result([int(row) for row in best], scores[best], include_values)
+
+    def _filtered_rows(self, filter: Dict[str, Any], query: np.ndarray, nprobe: Optional[int],
+                       top_k: int, exact: bool) -> np.ndarray:
+        """Candidate rows for a filtered search: the matching rows, or the matching ANN candidates."""
+        allowed = self.metadata_index.mask(filter, self._size) & self._alive[:self._size]
+        if self.ann is not None and self.ann.is_trained and not exact \
+                and np.count_nonzero(allowed) > self.filter_scan_rows:
+            candidates = self.ann.candidates(query, nprobe)
+            candidates = candidates[allowed[candidates]]
+            # The probed lists can hold too few matches for a selective filter; fall back to all of them
+            if len(candidates) >= top_k:
+                return candidates
+        return np.flatnonzero(allowed)
+
+    def _build_result(self, rows: List[int], scores, include_values: bool) -> QueryResult:
+        metadata = self._load_metadata(rows) if rows else {}
+        return QueryResult(matches=[
+            Match(
+                id=self._ids[row],
+                score=float(score),
+                metadata=metadata.get(row, {}),
+                values=self._vectors[row].tolist() if include_values else None
+            )
+            for row, score in zip(rows, scores)
+        ])
@@ -0,0 +1,283 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Long free-text fields are never filtered on
+UNINDEXED_FIELDS = frozenset({"text", "preview"})
+
+COMPARISONS = ("$gt", "$gte", "$lt", "$lte")
+OPERATORS = frozenset({"$eq", "$ne", "$in", "$nin", "$exists", *COMPARISONS})
+
+
+def to_timestamp(value: Optional[str]) -> Optional[int]:
+    """
+    Seconds since the epoch for an ISO-8601 date, for range filters: Pinecone
+    only compares numbers, so dates are also stored as `*_ts` fields.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float))
+
+
+def _indexable(value) -> bool:
+    return isinstance(value, (str, int, float))
+
+
+def _compare(value, op: str, bound) -> bool:
+    if _is_number(value) != _is_number(bound):
+        return False
+    if op == "$gt":
+        return value > bound
+    if op == "$gte":
+        return value >= bound
+    if op == "$lt":
+        return value < bound
+    return value <= bound
+
+
+def _field_matches(metadata: Dict[str, Any], field: str, condition) -> bool:
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+    present = field in metadata and metadata[field] is not None
+    value = metadata.get(field)
+    for op, operand in condition.items():
+        if op == "$eq":
+            ok = present and value == operand
+        elif op == "$ne":
+            ok = present and value != operand
+        elif op == "$in":
+            ok = present and value in operand
+        elif op == "$nin":
+            ok = present and value not in operand
+        elif op == "$exists":
+            ok = present == bool(operand)
+        elif op in COMPARISONS:
+            ok = present and _compare(value, op, operand)
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        if not ok:
+            return False
+    return True
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    """
+    Evaluate a Pinecone-style metadata filter against one metadata dict.
+    Supports `$eq`, `$ne`, `$in`, `$nin`, `$gt`, `$gte`, `$lt`, `$lte`,
+    `$exists`, `$and` and `$or`; a bare value means `$eq`.
+    """
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif not _field_matches(metadata, key, condition):
+            return False
+    return True
+
+
+class _SortedColumn:
+    """Row numbers ordered by value, separately for numbers and strings, for range and point lookups."""
+
+    def __init__(self, rows: np.ndarray, values: List[Any]):
+        numeric = np.fromiter((_is_number(value) for value in values), dtype=bool, count=len(values))
+        self.numbers, self.number_rows = self._sort(
+            np.asarray([value for value, is_number in zip(values, numeric) if is_number], dtype=np.float64),
+            rows[numeric]
+        )
+        self.strings, self.string_rows = self._sort(
+            np.asarray([value for value, is_number in zip(values, numeric) if not is_number], dtype=object),
+            rows[~numeric]
+        )
+
+    @staticmethod
+    def _sort(keys: np.ndarray, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        order = np.argsort(keys, kind="stable")
+        return keys[order], rows[order]
+
+    def rows_between(self, lower=None, lower_inclusive=True, upper=None, upper_inclusive=True,
+                     numeric: bool = True) -> np.ndarray:
+        keys, rows = (self.numbers, self.number_rows) if numeric else (self.strings, self.string_rows)
+        start = 0 if lower is None else np.searchsorted(keys, lower, side="left" if lower_inclusive else "right")
+        stop = len(keys) if upper is None else np.searchsorted(keys, upper, side="right" if upper_inclusive else "left")
+        return rows[start:max(start, stop)]
+
+
+class _Field:
+    def __init__(self, capacity: int, bitmap_max_values: int):
+        self.codes = np.full(capacity, -1, dtype=np.int32)
+        self.code_by_value: Dict[Any, int] = {}
+        self.values: List[Any] = []
+        self.bitmap_max_values = bitmap_max_values
+        # One bitmap per value while the field has few distinct values (source, status, ...)
+        self.bitmaps: Optional[Dict[int, np.ndarray]] = {}
+        self._sorted: Optional[_SortedColumn] = None
+
+    def grow(self, capacity: int):
+        extra = capacity - len(self.codes)
+        self.codes = np.concatenate([self.codes, np.full(extra, -1, dtype=np.int32)])
+        if self.bitmaps is not None:
+            for code, bitmap in self.bitmaps.items():
+                self.bitmaps[code] = np.concatenate([bitmap, np.zeros(extra, dtype=bool)])
+
+    def set(self, row: int, value):
+        self.clear(row)
+        code = self.code_by_value.get(value)
+        if code is None:
+            code = self.code_by_value[value] = len(self.values)
+            self.values.append(value)
+            if self.bitmaps is not None and len(self.values) > self.bitmap_max_values:
+                # Too many distinct values for bitmaps; point lookups use the sorted column from now on
+                self.bitmaps = None
+        self.codes[row] = code
+        if self.bitmaps is not None:
+            bitmap = self.bitmaps.get(code)
+            if bitmap is None:
+                bitmap = self.bitmaps[code] = np.zeros(len(self.codes), dtype=bool)
+            bitmap[row] = True
+        self._sorted = None
+
+    def clear(self, row: int):
+        code = self.codes[row]
+        if code < 0:
+            return
+        if self.bitmaps is not None:
+            self.bitmaps[code][row] = False
+        self.codes[row] = -1
+        self._sorted = None
+
+    def sorted_column(self, size: int) -> _SortedColumn:
+        """Built on the first range or point lookup after a write and reused until the next one."""
+        if self._sorted is None:
+            rows = np.flatnonzero(self.codes[:size] >= 0)
+            self._sorted = _SortedColumn(rows, [self.values[code] for code in self.codes[rows]])
+        return self._sorted
+
+    def present(self, size: int) -> np.ndarray:
+        return self.codes[:size] >= 0
+
+    def equal(self, value, size: int) -> np.ndarray:
+        code = self.code_by_value.get(value)
+        if code is None:
+            return np.zeros(size, dtype=bool)
+        if self.bitmaps is not None:
+            return self.bitmaps[code][:size].copy()
+        mask = np.zeros(size, dtype=bool)
+        mask[self.sorted_column(size).rows_between(value, True, value, True, numeric=_is_number(value))] = True
+        return mask
+
+    def between(self, condition: Dict[str, Any], size: int) -> np.ndarray:
+        bounds = [operand for op, operand in condition.items() if op in COMPARISONS]
+        numeric = _is_number(bounds[0])
+        if any(_is_number(bound) != numeric for bound in bounds):
+            return np.zeros(size, dtype=bool)
+        lower, lower_inclusive, upper, upper_inclusive = None, True, None, True
+        for op, operand in condition.items():
+            if op in ("$gt", "$gte") and (lower is None or operand >= lower):
+                lower, lower_inclusive = operand, op == "$gte"
+            elif op in ("$lt", "$lte") and (upper is None or operand <= upper):
+                upper, upper_inclusive = operand, op == "$lte"
+        mask = np.zeros(size, dtype=bool)
+        mask[self.sorted_column(size).rows_between(lower, lower_inclusive, upper, upper_inclusive, numeric)] = True
+        return mask
+
+
+class MetadataIndex:
+    """
+    Secondary indexes over vector metadata, so filters are resolved to a row
+    bitmap before any vector is scored.
+
+    Every scalar field gets a dictionary-encoded column. Fields with few
+    distinct values also keep one bitmap per value, so `status = completed`
+    is a single array copy. Range and high-cardinality point lookups use a
+    sorted (value, row) column that is rebuilt lazily after writes and then
+    answered with binary search, so their cost grows with the number of
+    matching rows rather than the corpus.
+    """
+
+    def __init__(self, capacity: int = 1024, bitmap_max_values: int = 256):
+        self._capacity = capacity
+        self.bitmap_max_values = bitmap_max_values
+        self._fields: Dict[str, _Field] = {}
+
+    def grow(self, capacity: int):
+        if capacity <= self._capacity:
+            return
+        for field in self._fields.values():
+            field.grow(capacity)
+        self._capacity = capacity
+
+    def set(self, row: int, metadata: Dict[str, Any]):
+        """Index `metadata` for `row`, replacing whatever the row held before."""
+        self.clear(row)
+        for name, value in (metadata or {}).items():
+            if name in UNINDEXED_FIELDS or not _indexable(value):
+                continue
+            field = self._fields.get(name)
+            if field is None:
+                field = self._fields[name] = _Field(self._capacity, self.bitmap_max_values)
+            field.set(row, value)
+
+    def clear(self, row: int):
+        for field in self._fields.values():
+            field.clear(row)
+
+    def mask(self, filter: Dict[str, Any], size: int) -> np.ndarray:
+        """Boolean mask over rows `[0, size)` of the rows whose metadata match `filter`."""
+        result = np.ones(size, dtype=bool)
+        for key, condition in filter.items():
+            if key == "$and":
+                for sub in condition:
+                    result &= self.mask(sub, size)
+            elif key == "$or":
+                any_match = np.zeros(size, dtype=bool)
+                for sub in condition:
+                    any_match |= self.mask(sub, size)
+                result &= any_match
+            else:
+                result &= self._field_mask(key, condition, size)
+        return result
+
+    def _field_mask(self, name: str, condition, size: int) -> np.ndarray:
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        unknown = set(condition) - OPERATORS
+        if unknown:
+            raise ValueError(f"Unsupported filter operator: {', '.join(sorted(unknown))}")
+        field = self._fields.get(name)
+        if field is None:
+            # Nothing has this field, so only `$exists: false` can match
+            matches = all(op == "$exists" and not operand for op, operand in condition.items())
+            return np.full(size, matches, dtype=bool)
+
+        result = np.ones(size, dtype=bool)
+        for op, operand in condition.items():
+            if op == "$eq":
+                result &= field.equal(operand, size)
+            elif op == "$ne":
+                result &= field.present(size) & ~field.equal(operand, size)
+            elif op in ("$in", "$nin"):
+                any_equal = np.zeros(size, dtype=bool)
+                for value in operand:
+                    any_equal |= field.equal(value, size)
+                result &= any_equal if op == "$in" else field.present(size) & ~any_equal
+            elif op == "$exists":
+                result &= field.present(size) if operand else ~field.present(size)
+        if any(op in COMPARISONS for op in condition):
+            result &= field.between(condition, size)
+        return result
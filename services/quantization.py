@@ -0,0 +1,206 @@
+import os
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import numpy as np
+
+# Rows scored per block during full scans, so decoding never materialises the whole corpus in float32
+SCAN_BLOCK_ROWS = 16384
+
+# Set bits per byte value, for Hamming distances on packed codes
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint16)
+
+
+def open_rows(path: str, dtype, row_shape: tuple, capacity: int) -> tuple[np.memmap, bool]:
+    """
+    Open a memory-mapped `.npy` array of `capacity` rows, creating or growing it.
+    Returns the array and whether the file was newly created.
+    """
+    if not os.path.exists(path):
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(capacity, *row_shape)), True
+    rows = np.load(path, mmap_mode="r+")
+    if rows.shape[1:] != row_shape:
+        raise ValueError(f"{path} has rows of shape {rows.shape[1:]}, expected {row_shape}")
+    if rows.shape[0] >= capacity:
+        return rows, False
+    tmp_path = path + ".tmp"
+    grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=(capacity, *row_shape))
+    grown[:rows.shape[0]] = rows
+    grown.flush()
+    del grown, rows
+    os.replace(tmp_path, path)
+    return np.load(path, mmap_mode="r+"), False
+
+
+class Quantizer(ABC):
+    """
+    Compressed copy of a `LocalVectorIndex` matrix used to shortlist candidates.
+
+    Codes live in their own memory-mapped files next to the float32 matrix and
+    are small enough to stay resident in RAM. Searches score the codes, keep
+    the best `top_k * rescore_multiplier` rows, and rescore only those against
+    the full-precision vectors, which are otherwise left on disk.
+    """
+
+    name = ""
+    default_rescore_multiplier = 4
+
+    def __init__(self, path: str, dimension: int, rescore_multiplier: int = 0):
+        self.path = path
+        self.dimension = dimension
+        self.rescore_multiplier = rescore_multiplier or self.default_rescore_multiplier
+
+    @classmethod
+    @abstractmethod
+    def files(cls) -> List[str]:
+        """Names of the code files kept next to the float32 matrix."""
+
+    @property
+    @abstractmethod
+    def bytes_per_vector(self) -> int:
+        """Size of one vector's code."""
+
+    @property
+    def compression(self) -> float:
+        """Size of a float32 vector relative to its code."""
+        return self.dimension * 4 / self.bytes_per_vector
+
+    @abstractmethod
+    def open(self, capacity: int) -> bool:
+        """Open or grow the code files to `capacity` rows. Returns True if they had to be created."""
+
+    @abstractmethod
+    def write(self, rows, matrix: np.ndarray):
+        """Encode L2-normalised `matrix` into `rows`."""
+
+    @abstractmethod
+    def flush(self):
+        """Write the codes to disk."""
+
+    @abstractmethod
+    def score_rows(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Approximate similarity of `query` to each of `rows`; higher is closer."""
+
+    def score_range(self, size: int, query: np.ndarray) -> np.ndarray:
+        """Approximate similarity of `query` to rows `[0, size)`, scored block by block."""
+        scores = np.empty(size, dtype=np.float32)
+        for start in range(0, size, SCAN_BLOCK_ROWS):
+            stop = min(start + SCAN_BLOCK_ROWS, size)
+            scores[start:stop] = self.score_rows(slice(start, stop), query)
+        return scores
+
+
+class Int8Quantizer(Quantizer):
+    """
+    Scalar quantization: each vector is scaled so its largest component maps
+    to ±127 and rounded to int8, with the per-vector scale kept alongside
+    (~4x smaller than float32). Scores are int8 dot products times the scale.
+    """
+
+    name = "int8"
+    default_rescore_multiplier = 8
+    CODES_FILE = "codes_int8.npy"
+    SCALES_FILE = "scales_int8.npy"
+
+    def __init__(self, path: str, dimension: int, rescore_multiplier: int = 0):
+        super().__init__(path, dimension, rescore_multiplier)
+        self.codes: Optional[np.memmap] = None
+        self.scales: Optional[np.memmap] = None
+
+    @classmethod
+    def files(cls) -> List[str]:
+        return [cls.CODES_FILE, cls.SCALES_FILE]
+
+    @property
+    def bytes_per_vector(self) -> int:
+        return self.dimension + 4
+
+    def open(self, capacity: int) -> bool:
+        self.codes, codes_created = open_rows(
+            os.path.join(self.path, self.CODES_FILE), np.int8, (self.dimension,), capacity
+        )
+        self.scales, scales_created = open_rows(
+            os.path.join(self.path, self.SCALES_FILE), np.float32, (), capacity
+        )
+        return codes_created or scales_created
+
+    def write(self, rows, matrix: np.ndarray):
+        peaks = np.abs(matrix).max(axis=1)
+        scales = np.where(peaks > 0, peaks / 127.0, 1.0).astype(np.float32)
+        self.codes[rows] = np.rint(matrix / scales[:, None]).astype(np.int8)
+        self.scales[rows] = scales
+
+    def flush(self):
+        self.codes.flush()
+        self.scales.flush()
+
+    def score_rows(self, rows, query: np.ndarray) -> np.ndarray:
+        return (self.codes[rows].astype(np.float32) @ query) * self.scales[rows]
+
+
+class BinaryQuantizer(Quantizer):
+    """
+    1-bit quantization: one sign bit per dimension, packed into bytes (32x
+    smaller than float32). Candidates are ranked by Hamming distance to the
+    query's sign bits, so more of them need exact rescoring than with int8.
+    """
+
+    name = "binary"
+    default_rescore_multiplier = 64
+    CODES_FILE = "codes_binary.npy"
+
+    def __init__(self, path: str, dimension: int, rescore_multiplier: int = 0):
+        super().__init__(path, dimension, rescore_multiplier)
+        self.codes: Optional[np.memmap] = None
+
+    @classmethod
+    def files(cls) -> List[str]:
+        return [cls.CODES_FILE]
+
+    @property
+    def bytes_per_vector(self) -> int:
+        return (self.dimension + 7) // 8
+
+    def open(self, capacity: int) -> bool:
+        self.codes, created = open_rows(
+            os.path.join(self.path, self.CODES_FILE), np.uint8, (self.bytes_per_vector,), capacity
+        )
+        return created
+
+    def write(self, rows, matrix: np.ndarray):
+        self.codes[rows] = np.packbits(matrix > 0, axis=1)
+
+    def flush(self):
+        self.codes.flush()
+
+    def score_rows(self, rows, query: np.ndarray) -> np.ndarray:
+        query_bits = np.packbits(query > 0)
+        distances = _POPCOUNT[np.bitwise_xor(self.codes[rows], query_bits)].sum(axis=1)
+        # Matching bits minus differing bits, on the same "higher is closer" scale as a dot product
+        return (self.dimension - 2 * distances.astype(np.float32)) / self.dimension
+
+
+QUANTIZERS = {quantizer.name: quantizer for quantizer in (Int8Quantizer, BinaryQuantizer)}
+
+
+def create_quantizer(name: str, path: str, dimension: int, rescore_multiplier: int = 0) -> Optional[Quantizer]:
+    """Quantizer for `Config.LOCAL_INDEX_QUANTIZATION` ("none", "int8" or "binary")."""
+    if name in ("", "none"):
+        return None
+    if name not in QUANTIZERS:
+        raise ValueError(f"Unknown quantization mode: {name!r} (expected 'none', 'int8' or 'binary')")
+    return QUANTIZERS[name](path, dimension, rescore_multiplier)
+
+
+def remove_stale_codes(path: str, keep: Optional[Quantizer] = None):
+    """
+    Delete code files of quantization modes that are not in use. They would
+    otherwise miss every write made while the mode was off and silently serve
+    stale candidates if it were switched back on.
+    """
+    keep_files = set(keep.files()) if keep is not None else set()
+    for quantizer in QUANTIZERS.values():
+        for file_name in quantizer.files():
+            file_path = os.path.join(path, file_name)
+            if file_name not in keep_files and os.path.exists(file_path):
+                os.remove(file_path)
@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import numpy as np
+
+from services.embedding_cache import EmbeddingCache
+
+
+@dataclass
+class _Entry:
+    value: Any
+    embedding: Optional[np.ndarray]
+    expires_at: float
+
+
+class QueryCache:
+    """
+    In-memory cache of search results and generated answers keyed by query.
+
+    A lookup first tries the normalised query text (case- and
+    whitespace-insensitive). If that misses and the caller has the query
+    embedding, the closest cached query in the same `scope` is a hit when its
+    cosine similarity is at least `similarity_threshold`. The scope holds
+    everything besides the query text that the value depends on, such as
+    top-k and filters for searches, or the result ids for answers.
+
+    Entries expire after `ttl_seconds` and the least recently used ones are
+    evicted beyond `max_entries`. The whole cache is dropped when
+    `generation()` changes, which `VectorStore` bumps on every write, so
+    results never outlive the index contents they were computed from in this
+    process. Writes from other processes are only picked up through the TTL.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600, similarity_threshold: float = 0.97,
+                 generation: Optional[Callable[[], int]] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._generation = generation or (lambda: 0)
+        self._seen_generation = self._generation()
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return EmbeddingCache.normalize(query).casefold()
+
+    def _check_generation(self):
+        generation = self._generation()
+        if generation != self._seen_generation:
+            self._entries.clear()
+            self._seen_generation = generation
+
+    def _live(self, key: tuple, now: float) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, query: str, scope: Hashable = None, embedding: Optional[List[float]] = None) -> Optional[Any]:
+        """
+        Cached value for `query` in `scope`, or None. Callers typically probe
+        without the embedding first, so an exact hit skips the embedding call.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._check_generation()
+            entry = self._live((scope, self.normalize(query)), now)
+            if entry is not None:
+                self.exact_hits += 1
+                return entry.value
+            if embedding is not None:
+                entry = self._nearest(scope, self._unit(embedding), now)
+                if entry is not None:
+                    self.semantic_hits += 1
+                    return entry.value
+            return None
+
+    def _nearest(self, scope: Hashable, query: np.ndarray, now: float) -> Optional[_Entry]:
+        keys = [
+            key for key, entry in self._entries.items()
+            if key[0] == scope and entry.embedding is not None and entry.expires_at > now
+        ]
+        if not keys:
+            return None
+        similarities = np.stack([self._entries[key].embedding for key in keys]) @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        return self._live(keys[best], now)
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def put(self, query: str, value: Any, scope: Hashable = None, embedding: Optional[List[float]] = None):
+        """Store a freshly computed value; every put is counted as a miss."""
+        with self._lock:
+            self.misses += 1
+            self._check_generation()
+            key = (scope, self.normalize(query))
+            self._entries[key] = _Entry(
+                value=value,
+                embedding=self._unit(embedding) if embedding is not None else None,
+                expires_at=time.monotonic() + self.ttl_seconds
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            hits = self.exact_hits + self.semantic_hits
+            return {
+                'exact_hits': self.exact_hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'entries': len(self._entries)
+            }
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+from typing import Optional, Union
+
+
+class DocumentTooLarge(Exception):
+    """Raised when a download exceeds the per-document size cap."""
+
+
+class SpooledDocument:
+    """
+    Write-once buffer for a downloaded document.
+
+    Data stays in memory up to `max_memory_bytes` and is then moved to a
+    temporary file, so peak memory per download is bounded no matter how
+    large the document is. Writes beyond `max_bytes` raise `DocumentTooLarge`.
+    The SHA-256 of the content is computed while writing.
+    """
+
+    def __init__(self, max_memory_bytes: int, max_bytes: int, suffix: str = ".pdf", directory: str = None):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.directory = directory
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._buffer: Optional[BytesIO] = BytesIO()
+        self._file = None
+        self.path: Optional[str] = None
+
+    def write(self, chunk: bytes):
+        if self.size + len(chunk) > self.max_bytes:
+            raise DocumentTooLarge(f"Document exceeds the {self.max_bytes // (1024 * 1024)} MB limit")
+        self.size += len(chunk)
+        self._hash.update(chunk)
+        if self._buffer is not None and self.size > self.max_memory_bytes:
+            self._roll_over()
+        (self._file if self._file is not None else self._buffer).write(chunk)
+
+    def _roll_over(self):
+        """Move the in-memory prefix to a temporary file and keep writing there."""
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(suffix=self.suffix, dir=self.directory, delete=False)
+        self.path = self._file.name
+        self._file.write(self._buffer.getbuffer())
+        self._buffer = None
+
+    def finish(self) -> "SpooledDocument":
+        """Flush and close the temporary file so it can be reopened by path."""
+        if self._file is not None:
+            self._file.close()
+        return self
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    @property
+    def in_memory(self) -> bool:
+        return self._buffer is not None
+
+    @property
+    def source(self) -> Union[bytes, str]:
+        """Bytes for small documents, a file path for spooled ones (what the extraction functions accept)."""
+        return bytes(self._buffer.getbuffer()) if self._buffer is not None else self.path
+
+    def reset(self):
+        """Discard everything written so far, e.g. before retrying an interrupted download."""
+        self.close()
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._buffer = BytesIO()
+        self._file = None
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self._buffer = None
+        self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
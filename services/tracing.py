@@ -0,0 +1,274 @@
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+
+# Upper bounds (seconds) of the exported latency buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_PREFIX = "semantic_search"
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    One timed pipeline stage. `labels` are low-cardinality dimensions of the
+    stage metrics (e.g. `backend="remote"`); `attributes` such as document ids
+    or batch sizes only go to the JSON-lines export.
+    """
+
+    def __init__(self, name: str, labels: Dict[str, str], parent: Optional["Span"] = None):
+        self.name = name
+        self.labels = labels
+        self.attributes: Dict[str, Any] = {}
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set_labels(self, **labels):
+        """Set labels only known once the stage has run, e.g. which embedding backend answered."""
+        self.labels.update({key: str(value) for key, value in labels.items()})
+
+    def annotate(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'labels': self.labels,
+            'attributes': self.attributes,
+            'start': self.start,
+            'duration_ms': self.duration * 1000 if self.duration is not None else None,
+            'error': self.error
+        }
+
+
+class _Histogram:
+    """Cumulative bucket counts for export plus a rolling window for percentiles."""
+
+    def __init__(self, window: int):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+        self._recent = deque(maxlen=window)
+
+    def observe(self, seconds: float, ok: bool):
+        index = bisect_left(BUCKETS, seconds)
+        if index < len(BUCKETS):
+            self.buckets[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.errors += 0 if ok else 1
+        self._recent.append(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        recent = np.asarray(self._recent) * 1000
+        p50, p95, p99 = np.percentile(recent, [50, 95, 99]) if len(recent) else (None, None, None)
+        return {
+            'calls': self.count,
+            'errors': self.errors,
+            'mean_ms': self.sum / self.count * 1000 if self.count else None,
+            'p50_ms': None if p50 is None else float(p50),
+            'p95_ms': None if p95 is None else float(p95),
+            'p99_ms': None if p99 is None else float(p99)
+        }
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class Tracer:
+    """
+    In-process spans, latency histograms and counters for the ingest and query pipelines.
+
+    Spans nest through a context variable, so a stage started inside another
+    (embed inside ingest, say) shares its trace id. Each finished span feeds
+    a per-(stage, labels) histogram and, when `export_path` is set, is
+    appended to that file as one JSON line. `prometheus()` renders the
+    histograms and counters in the Prometheus text format, which `serve()`
+    exposes on `/metrics`. Work handed to another thread joins the trace
+    only if it runs in a copy of the submitter's context
+    (`contextvars.copy_context().run`).
+    """
+
+    def __init__(self, export_path: Optional[str] = None, window: int = 1000):
+        self.export_path = export_path
+        self.window = window
+        self._histograms: Dict[Tuple[str, tuple], _Histogram] = {}
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._lock = threading.Lock()
+        self._export_file = None
+        self._server = None
+
+    @contextmanager
+    def span(self, name: str, **labels) -> Iterator[Span]:
+        """Time the enclosed block as stage `name`; exceptions are recorded and re-raised."""
+        span = Span(name, {key: str(value) for key, value in labels.items()}, _current_span.get())
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            _current_span.reset(token)
+            self._finish(span)
+
+    def record(self, name: str, seconds: float, ok: bool = True, **labels) -> Span:
+        """
+        Record a stage timed by the caller, for work that cannot sit inside a
+        `with` block, such as a generator that yields between start and end.
+        """
+        span = Span(name, {key: str(value) for key, value in labels.items()}, _current_span.get())
+        span.duration = seconds
+        span.error = None if ok else "error"
+        self._finish(span)
+        return span
+
+    def count(self, name: str, value: float = 1, **labels):
+        key = (name, _label_key({key: str(value) for key, value in labels.items()}))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def _finish(self, span: Span):
+        key = (span.name, _label_key(span.labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.window)
+            histogram.observe(span.duration, span.error is None)
+            if self.export_path:
+                self._export(span)
+
+    def _export(self, span: Span):
+        try:
+            if self._export_file is None:
+                directory = os.path.dirname(self.export_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._export_file = open(self.export_path, "a", buffering=1, encoding="utf-8")
+            self._export_file.write(json.dumps(span.to_dict(), default=str) + "\n")
+        except OSError as e:
+            # Tracing must never break the pipeline it observes
+            print(f"Disabling span export to {self.export_path}: {e}")
+            self.export_path = None
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Per-stage latency summary, sorted by stage then labels."""
+        with self._lock:
+            return [
+                {'stage': name, 'labels': dict(labels), **histogram.snapshot()}
+                for (name, labels), histogram in sorted(self._histograms.items())
+            ]
+
+    def counters(self) -> Dict[str, float]:
+        with self._lock:
+            return {f"{name}{_format_labels(labels)}": value for (name, labels), value in sorted(self._counters.items())}
+
+    def prometheus(self) -> str:
+        """Histograms and counters in the Prometheus text exposition format."""
+        metric = f"{METRIC_PREFIX}_stage_duration_seconds"
+        errors = f"{METRIC_PREFIX}_stage_errors_total"
+        lines = [
+            f"# HELP {metric} Time spent in each pipeline stage.",
+            f"# TYPE {metric} histogram",
+        ]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            for (name, labels), histogram in histograms:
+                base = (("stage", name),) + labels
+                cumulative = 0
+                for bound, bucket in zip(BUCKETS, histogram.buckets):
+                    cumulative += bucket
+                    lines.append(f"{metric}_bucket{_format_labels(base + (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{metric}_bucket{_format_labels(base + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{metric}_sum{_format_labels(base)} {histogram.sum}")
+                lines.append(f"{metric}_count{_format_labels(base)} {histogram.count}")
+            lines += [f"# HELP {errors} Pipeline stages that raised.", f"# TYPE {errors} counter"]
+            for (name, labels), histogram in histograms:
+                lines.append(f"{errors}{_format_labels((('stage', name),) + labels)} {histogram.errors}")
+            for name in sorted({name for (name, _) in self._counters}):
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name}_total counter")
+                lines += [
+                    f"{METRIC_PREFIX}_{name}_total{_format_labels(labels)} {value:g}"
+                    for (counter, labels), value in counters if counter == name
+                ]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = None):
+        """
+        Expose `prometheus()` on http://host:port/metrics from a daemon thread
+        (idempotent). Binds to `Config.METRICS_HOST`, loopback by default. If
+        the port cannot be bound the error is printed and None returned, as
+        metrics must not stop the app from starting.
+        """
+        with self._lock:
+            if self._server is not None:
+                return self._server
+            tracer = self
+
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = tracer.prometheus().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            host = host or Config.METRICS_HOST
+            try:
+                self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+            except OSError as e:
+                print(f"Metrics endpoint not started on {host}:{port}: {e}")
+                return None
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+            return self._server
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+# Process-wide tracer used by every service
+tracer = Tracer(Config.TRACE_EXPORT_PATH or None, Config.TRACE_WINDOW)
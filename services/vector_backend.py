@@ -0,0 +1,44 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional
+
+
+@dataclass
+class Match:
+    """A single search hit, shaped like a Pinecone query match."""
+    id: str
+    score: float
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    values: Optional[List[float]] = None
+
+
+@dataclass
+class QueryResult:
+    """Search response, shaped like a Pinecone query response."""
+    matches: List[Match] = field(default_factory=list)
+
+
+class VectorBackend(ABC):
+    """Storage engine behind `VectorStore`."""
+
+    name = "unknown"  # Label on this backend's query and upsert metrics
+
+    @abstractmethod
+    def ensure_ready(self):
+        """Make sure the underlying index exists and is usable."""
+
+    @abstractmethod
+    def upsert(self, vectors: List[tuple[str, List[float], Dict[str, Any]]]):
+        """Insert or replace vectors given as (id, embedding, metadata) tuples."""
+
+    @abstractmethod
+    def search(self, query_vector: List[float], top_k: int = 5, **params):
+        """
+        Return the `top_k` most similar vectors with their metadata.
+        `params` carries backend-specific query knobs; backends ignore ones they do not know.
+        A `filter` param is a Pinecone-style metadata filter that every backend must honour.
+        """
+
+    @abstractmethod
+    def delete(self, ids: List[str]):
+        """Remove vectors by id. Unknown ids are ignored."""
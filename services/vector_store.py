@@ -1,20 +1,58 @@
-from typing import List, Dict, Any
-from pinecone import Pinecone, ServerlessSpec
+import contextvars
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Any, Optional
 from config import Config
+from services.lexical_index import LexicalIndex
+from services.tracing import tracer
+from services.vector_backend import Match, VectorBackend
+from services.write_buffer import WriteBehindBuffer, payload_batches
 
-class VectorStore:
-    def __init__(self):
-        self.pc = Pinecone(api_key=Config.PINECONE_API_KEY)
+
+class UpsertError(Exception):
+    """Raised when some batches of a concurrent upsert failed; `errors` holds every batch's exception."""
+
+    def __init__(self, errors: List[Exception], batches: int):
+        super().__init__(f"{len(errors)} of {batches} upsert batches failed; first error: {errors[0]}")
+        self.errors = errors
+
+
+class PineconeBackend(VectorBackend):
+    """
+    Pinecone serverless index. Upserts are split into batches that fit
+    Pinecone's request limits and sent concurrently; batches that hit
+    throttling or transient errors are resent, which is safe because an
+    upsert overwrites vectors by id.
+    """
+
+    name = "pinecone"
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, index=None):
         self.index_name = Config.PINECONE_INDEX_NAME
-        self._ensure_index_exists()
+        self._upsert_pool = None
+        self._upsert_pool_lock = threading.Lock()
+        if index is not None:
+            # An already-connected index object (or a local stand-in with the same interface)
+            self.pc = None
+            self.index = index
+            return
+        from pinecone import Pinecone
+        self.pc = Pinecone(api_key=Config.PINECONE_API_KEY)
+        self.ensure_ready()
         self.index = self.pc.Index(self.index_name)
 
-    def _ensure_index_exists(self):
+    def ensure_ready(self):
         """Ensure the Pinecone index exists, create if it doesn't."""
+        if self.pc is None:
+            return
+        from pinecone import ServerlessSpec
         if self.index_name not in self.pc.list_indexes().names():
             self.pc.create_index(
                 name=self.index_name,
-                dimension=384,  # Dimension for all-MiniLM-L6-v2 model
+                dimension=Config.EMBEDDING_DIMENSION,
                 metric="cosine",
                 spec=ServerlessSpec(
                     cloud="gcp",
@@ -23,19 +61,214 @@ class VectorStore:
             )
 
     def upsert(self, vectors: List[tuple[str, List[float], Dict[str, Any]]]):
+        # An id repeated across concurrent requests could land in either order; keep its last value
+        vectors = list({vector[0]: vector for vector in vectors}.values())
+        batches = list(payload_batches(vectors, Config.UPSERT_MAX_REQUEST_BYTES, Config.UPSERT_MAX_BATCH_VECTORS))
+        tracer.count("upsert_requests", len(batches), backend=self.name)
+        if len(batches) <= 1 or Config.UPSERT_CONCURRENCY <= 1:
+            for batch in batches:
+                self._send_batch(batch)
+            return
+
+        # One context copy per batch: a context cannot be entered by two threads at once
+        futures = [
+            self._pool().submit(contextvars.copy_context().run, self._send_batch, batch) for batch in batches
+        ]
+        errors = [error for error in (future.exception() for future in futures) if error is not None]
+        if errors:
+            raise UpsertError(errors, len(batches))
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._upsert_pool_lock:
+            if self._upsert_pool is None:
+                self._upsert_pool = ThreadPoolExecutor(
+                    max_workers=Config.UPSERT_CONCURRENCY, thread_name_prefix="pinecone-upsert"
+                )
+            return self._upsert_pool
+
+    def _send_batch(self, batch: List[tuple[str, List[float], Dict[str, Any]]]):
+        for attempt in range(Config.UPSERT_MAX_RETRIES + 1):
+            try:
+                self.index.upsert(vectors=batch)
+                return
+            except Exception as e:
+                if attempt >= Config.UPSERT_MAX_RETRIES or not self._is_transient(e):
+                    tracer.count("upsert_errors", backend=self.name)
+                    raise
+                tracer.count("upsert_retries", backend=self.name)
+                # Exponential backoff with jitter so concurrent batches do not retry in lockstep
+                time.sleep(min(0.5 * 2 ** attempt, 8.0) * random.uniform(0.5, 1.0))
+
+    @classmethod
+    def _is_transient(cls, error: Exception) -> bool:
+        """Throttling, server errors, timeouts and dropped connections; not bad requests."""
+        status = getattr(error, 'status', None) or getattr(error, 'status_code', None)
+        if isinstance(status, int):
+            return status in cls.RETRY_STATUSES
+        return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__module__.startswith("urllib3")
+
+    def search(self, query_vector: List[float], top_k: int = 5, filter: Optional[Dict[str, Any]] = None,
+               include_values: bool = False, **params):
+        query = {}
+        if filter:
+            # Pinecone evaluates the same filter syntax server-side, before ranking
+            query['filter'] = filter
+        return self.index.query(
+            vector=query_vector,
+            top_k=top_k,
+            include_metadata=True,
+            include_values=include_values,
+            **query
+        )
+
+    def delete(self, ids: List[str]):
+        if ids:
+            self.index.delete(ids=ids)
+
+
+def create_backend(name: str) -> VectorBackend:
+    """Build the vector backend selected by `Config.VECTOR_BACKEND`."""
+    if name == "pinecone":
+        return PineconeBackend()
+    if name == "local":
+        from services.local_index import LocalVectorIndex
+        from services.quantization import create_quantizer
+        ann = None
+        if Config.LOCAL_INDEX_TYPE == "ivf":
+            from services.ann_index import IVFIndex
+            ann = IVFIndex(
+                Config.LOCAL_INDEX_PATH,
+                nlist=Config.IVF_NLIST,
+                nprobe=Config.IVF_NPROBE,
+                min_train_size=Config.IVF_MIN_TRAIN_SIZE,
+                retrain_ratio=Config.IVF_RETRAIN_RATIO
+            )
+        quantizer = create_quantizer(
+            Config.LOCAL_INDEX_QUANTIZATION,
+            Config.LOCAL_INDEX_PATH,
+            Config.EMBEDDING_DIMENSION,
+            rescore_multiplier=Config.QUANTIZATION_RESCORE_MULTIPLIER
+        )
+        return LocalVectorIndex(
+            Config.LOCAL_INDEX_PATH,
+            Config.EMBEDDING_DIMENSION,
+            ann=ann,
+            quantizer=quantizer,
+            filter_scan_rows=Config.FILTER_SCAN_ROWS
+        )
+    raise ValueError(f"Unknown vector backend: {name!r} (expected 'pinecone' or 'local')")
+
+
+class VectorStore:
+    def __init__(self, backend: VectorBackend = None, lexical_index: Optional[LexicalIndex] = None):
+        self.backend = backend if backend is not None else create_backend(Config.VECTOR_BACKEND)
+        # Keyword index over the same chunks, kept in step on every upsert and delete
+        if lexical_index is None and Config.LEXICAL_INDEX_ENABLED:
+            lexical_index = LexicalIndex(
+                Config.LEXICAL_INDEX_PATH, k1=Config.BM25_K1, b=Config.BM25_B,
+                compact_ratio=Config.LEXICAL_COMPACT_RATIO
+            )
+        self.lexical_index = lexical_index
+        # Bumped on every write so caches of search results know when to drop them
+        self.generation = 0
+        # Small upserts (one document at a time) are coalesced into full batches
+        self.write_buffer = None
+        if Config.WRITE_BEHIND_ENABLED:
+            self.write_buffer = WriteBehindBuffer(
+                self._write,
+                max_vectors=Config.WRITE_BEHIND_MAX_VECTORS,
+                # Enough to keep every concurrent upsert request full
+                max_bytes=Config.UPSERT_MAX_REQUEST_BYTES * max(Config.UPSERT_CONCURRENCY, 1),
+                max_delay=Config.WRITE_BEHIND_MAX_DELAY_MS / 1000
+            )
+
+    def _ensure_index_exists(self):
+        """Ensure the backing index exists, create if it doesn't."""
+        self.backend.ensure_ready()
+
+    def upsert(self, vectors: List[tuple[str, List[float], Dict[str, Any]]],
+               on_written: Optional[Callable[[List[str]], None]] = None,
+               on_failed: Optional[Callable[[List[str], Exception], None]] = None):
         """
         Upsert vectors to the index.
         vectors: List of tuples (id, embedding, metadata)
+        With write-behind enabled the vectors may be written later, together
+        with other upserts. `on_written(ids)` runs once they are stored and
+        `on_failed(ids, error)` if storing them fails; without `on_failed` a
+        direct (unbuffered) write raises instead.
         """
-        batch_size = Config.BATCH_SIZE
-        for i in range(0, len(vectors), batch_size):
-            batch = vectors[i:i + batch_size]
-            self.index.upsert(vectors=batch)
+        if self.write_buffer is not None:
+            self.write_buffer.add(vectors, on_written, on_failed)
+            return
+        ids = [vector_id for vector_id, _, _ in vectors]
+        try:
+            self._write(vectors)
+        except Exception as e:
+            if on_failed is None:
+                raise
+            on_failed(ids, e)
+            return
+        if on_written is not None:
+            on_written(ids)
 
-    def search(self, query_vector: List[float], top_k: int = 5):
-        """Search for similar vectors."""
-        return self.index.query(
-            vector=query_vector,
-            top_k=top_k,
-            include_metadata=True
-        ) 
\ No newline at end of file
+    def _write(self, vectors: List[tuple[str, List[float], Dict[str, Any]]]):
+        with tracer.span("upsert", backend=self.backend.name) as span:
+            span.annotate(vectors=len(vectors))
+            self.backend.upsert(vectors)
+        tracer.count("upserted_vectors", len(vectors), backend=self.backend.name)
+        self.generation += 1
+        if self.lexical_index is not None:
+            with tracer.span("upsert", backend="lexical"):
+                self.lexical_index.add([
+                    (vector_id, (metadata or {}).get('text', ''), metadata)
+                    for vector_id, _, metadata in vectors
+                ])
+
+    def search(self, query_vector: List[float], top_k: int = 5, filter: Optional[Dict[str, Any]] = None,
+               **params):
+        """
+        Search for similar vectors.
+        `filter` is a Pinecone-style metadata filter, e.g.
+        `{"status": "completed", "sent_ts": {"$gte": 1719792000}}`; see
+        `services.metadata_index` for the supported operators.
+        Extra keyword arguments are backend query knobs, e.g. `nprobe` for the local IVF index.
+        """
+        self.flush()
+        if filter:
+            params['filter'] = filter
+        with tracer.span("query", backend=self.backend.name) as span:
+            span.annotate(top_k=top_k, filtered=bool(filter))
+            return self.backend.search(query_vector, top_k=top_k, **params)
+
+    def lexical_search(self, query: str, top_k: int = 5, phrase: bool = False,
+                       filter: Optional[Dict[str, Any]] = None) -> List[Match]:
+        """BM25 search over chunk text; empty when the lexical index is disabled."""
+        if self.lexical_index is None:
+            return []
+        self.flush()
+        with tracer.span("query", backend="lexical") as span:
+            span.annotate(top_k=top_k, phrase=phrase, filtered=bool(filter))
+            return self.lexical_index.search(query, top_k=top_k, phrase=phrase, filter=filter)
+
+    def delete(self, ids: List[str]):
+        """Delete vectors by id."""
+        # Buffered upserts of these ids must not land after the delete
+        self.flush()
+        self.backend.delete(ids)
+        self.generation += 1
+        if self.lexical_index is not None:
+            self.lexical_index.remove(ids)
+
+    def flush(self):
+        """
+        Write buffered upserts now. Searches and deletes flush first, so they
+        see every upsert made before them. A failed write is reported to the
+        `on_failed` callbacks of its upserts, not raised.
+        """
+        if self.write_buffer is not None:
+            self.write_buffer.flush()
+
+    def close(self):
+        """Write buffered upserts and stop the write-behind thread."""
+        if self.write_buffer is not None:
+            self.write_buffer.close()
@@ -0,0 +1,160 @@
+import atexit
+import contextvars
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+Vector = Tuple[str, List[float], Dict[str, Any]]
+
+# JSON bytes per embedding value ("-0.012345678918063641," is 22 characters)
+BYTES_PER_VALUE = 22
+# Braces, keys and separators around each vector in an upsert request body
+VECTOR_OVERHEAD_BYTES = 64
+
+
+def estimate_payload_bytes(vector: Vector) -> int:
+    """Upper estimate of one vector's size in a JSON upsert request, without serialising the values."""
+    vector_id, values, metadata = vector
+    metadata_bytes = len(json.dumps(metadata, default=str)) if metadata else 0
+    return len(vector_id) + len(values) * BYTES_PER_VALUE + metadata_bytes + VECTOR_OVERHEAD_BYTES
+
+
+def payload_batches(vectors: List[Vector], max_bytes: int, max_vectors: int) -> Iterator[List[Vector]]:
+    """
+    Split vectors into request-sized batches of at most `max_bytes` estimated
+    payload and `max_vectors` vectors. A vector larger than `max_bytes` on
+    its own still gets a batch, and the backend decides whether to accept it.
+    """
+    batch, size = [], 0
+    for vector in vectors:
+        vector_bytes = estimate_payload_bytes(vector)
+        if batch and (size + vector_bytes > max_bytes or len(batch) >= max_vectors):
+            yield batch
+            batch, size = [], 0
+        batch.append(vector)
+        size += vector_bytes
+    if batch:
+        yield batch
+
+
+class WriteBehindBuffer:
+    """
+    Coalesces many small upserts into few large writes.
+
+    `add()` queues vectors and returns at once. The queue is written in
+    one `write()` call when it reaches `max_vectors` or `max_bytes` (by the
+    call that filled it, which keeps memory bounded while a backfill outpaces
+    the backend), when its oldest vector has waited `max_delay` seconds (by
+    a background thread), on `flush()`, and at interpreter exit.
+
+    Writes are serialised and a vector id queued twice is written once with
+    its latest value, so a later upsert never lands before an earlier one.
+    Each `add()` may pass `on_written(ids)`, which runs after its vectors are
+    stored, and `on_failed(ids, error)`, which runs instead when the write
+    fails. Callers record progress there, e.g. in the ingest manifest, so an
+    unwritten document is retried instead of being marked as indexed. A
+    failed write is only reported through these callbacks and never raised,
+    so one caller's `add()` is not failed by other callers' vectors.
+
+    Callbacks run in the context of the `add()` that passed them, and a
+    write in the context of the first `add()` it contains, so their spans
+    stay in the callers' traces even when the background thread flushes.
+    """
+
+    def __init__(self, write: Callable[[List[Vector]], None], max_vectors: int = 1000,
+                 max_bytes: int = 8 * 1024 * 1024, max_delay: float = 2.0):
+        self._write = write
+        self.max_vectors = max_vectors
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self._pending: Dict[str, Vector] = {}
+        self._callbacks: List[Tuple[Optional[Callable], Optional[Callable], List[str], contextvars.Context]] = []
+        self._context: Optional[contextvars.Context] = None
+        self._pending_bytes = 0
+        self._oldest: Optional[float] = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.RLock()  # Reentrant: callbacks may delete, and deletes flush first
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def add(self, vectors: List[Vector], on_written: Optional[Callable[[List[str]], None]] = None,
+            on_failed: Optional[Callable[[List[str], Exception], None]] = None):
+        with self._lock:
+            for vector in vectors:
+                previous = self._pending.pop(vector[0], None)
+                if previous is not None:
+                    self._pending_bytes -= estimate_payload_bytes(previous)
+                self._pending[vector[0]] = vector
+                self._pending_bytes += estimate_payload_bytes(vector)
+            if on_written is not None or on_failed is not None:
+                self._callbacks.append(
+                    (on_written, on_failed, [vector[0] for vector in vectors], contextvars.copy_context())
+                )
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+                self._context = contextvars.copy_context()
+                self._wakeup.notify()
+            full = (len(self._pending) >= self.max_vectors or self._pending_bytes >= self.max_bytes
+                    or self._closed)
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Write everything queued so far. If the write fails its vectors are
+        dropped and each of their `on_failed` callbacks is told why.
+        """
+        with self._flush_lock:
+            with self._lock:
+                vectors, callbacks, context = list(self._pending.values()), self._callbacks, self._context
+                self._pending, self._callbacks, self._pending_bytes, self._oldest = {}, [], 0, None
+                self._context = None
+            if not vectors and not callbacks:
+                return
+            error = None
+            try:
+                if vectors:
+                    context.run(self._write, vectors)
+            except Exception as e:
+                print(f"Write-behind flush of {len(vectors)} vectors failed: {e}")
+                error = e
+            for on_written, on_failed, ids, callback_context in callbacks:
+                try:
+                    if error is None and on_written is not None:
+                        callback_context.run(on_written, ids)
+                    elif error is not None and on_failed is not None:
+                        callback_context.run(on_failed, ids, error)
+                except Exception as e:
+                    print(f"Write-behind callback failed: {e}")
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._closed:
+                    if self._oldest is None:
+                        self._wakeup.wait()
+                        continue
+                    remaining = self._oldest + self.max_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.wait(remaining)
+                if self._closed:
+                    return
+            self.flush()
+
+    def close(self):
+        """Stop the background thread and write what is left (idempotent)."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify_all()
+        self.flush()